@@ -1,26 +1,19 @@
 from mangum import Mangum
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-import zipfile
 import os
-import tempfile
-import shutil
-import re
-import base64
-from typing import Dict, Tuple
 
 # Import all the processing functions from backend
 import sys
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
 
 from main import (
-    extract_username_from_pdf_name,
-    extract_username_from_folder_name,
-    extract_nested_zips,
-    process_zip1,
-    process_zip2,
-    merge_pdfs
+    compare_uploads,
+    part_store,
+    validate_compression,
+    validate_fuzzy_distance,
+    validate_max_part_bytes,
+    validate_upload_names
 )
 
 app = FastAPI(title="ZIP Comparison Tool")
@@ -38,77 +31,30 @@ app.add_middleware(
 @app.post("/api/compare-zips")
 async def compare_zips(
     file1: UploadFile = File(...),
-    file2: UploadFile = File(...)
+    file2: UploadFile = File(...),
+    compression: str = Form('balanced'),
+    fingerprint: bool = Form(True),
+    prefer_newer: bool = Form(False),
+    fuzzy_distance: int = Form(0),
+    max_part_bytes: int = Form(0)
 ):
     """
     Upload and compare two ZIP files.
     Returns the merged result ZIP file.
+    With max_part_bytes the response carries a manifest of ZIP parts under that
+    size instead. Instances share no disk, so the parts are uploaded to the part
+    store (COMPARE_PART_BUCKET) and the manifest lists their presigned URLs.
     """
-    # Validate file types
-    if not file1.filename.lower().endswith('.zip'):
-        raise HTTPException(status_code=400, detail="File 1 must be a ZIP file")
-    
-    if not file2.filename.lower().endswith('.zip'):
-        raise HTTPException(status_code=400, detail="File 2 must be a ZIP file")
-    
-    # Create temporary directory for processing
-    with tempfile.TemporaryDirectory() as temp_dir:
-        try:
-            # Save uploaded files
-            zip1_path = os.path.join(temp_dir, "zip1.zip")
-            zip2_path = os.path.join(temp_dir, "zip2.zip")
-            
-            with open(zip1_path, 'wb') as f:
-                shutil.copyfileobj(file1.file, f)
-            
-            with open(zip2_path, 'wb') as f:
-                shutil.copyfileobj(file2.file, f)
-            
-            # Validate ZIP files
-            try:
-                with zipfile.ZipFile(zip1_path, 'r') as z:
-                    z.testzip()
-            except zipfile.BadZipFile:
-                raise HTTPException(status_code=400, detail="File 1 is not a valid ZIP file")
-            
-            try:
-                with zipfile.ZipFile(zip2_path, 'r') as z:
-                    z.testzip()
-            except zipfile.BadZipFile:
-                raise HTTPException(status_code=400, detail="File 2 is not a valid ZIP file")
-            
-            # Extract and process ZIP files
-            zip1_extract_dir = os.path.join(temp_dir, "zip1_extract")
-            zip2_extract_dir = os.path.join(temp_dir, "zip2_extract")
-            os.makedirs(zip1_extract_dir, exist_ok=True)
-            os.makedirs(zip2_extract_dir, exist_ok=True)
-            
-            zip1_pdfs, zip1_info = process_zip1(zip1_path, zip1_extract_dir)
-            zip2_pdfs, zip2_info = process_zip2(zip2_path, zip2_extract_dir)
-            
-            if not zip1_pdfs and not zip2_pdfs:
-                raise HTTPException(status_code=400, detail="No PDF files found in either ZIP file")
-            
-            # Merge PDFs and get summary
-            result_zip_path, summary = merge_pdfs(zip1_pdfs, zip2_pdfs, zip1_info, zip2_info, temp_dir)
-            
-            # Read ZIP file and encode to base64
-            with open(result_zip_path, 'rb') as f:
-                zip_data = f.read()
-                zip_base64 = base64.b64encode(zip_data).decode('utf-8')
-            
-            # Return JSON response with summary and ZIP file
-            return JSONResponse({
-                'success': True,
-                'summary': summary,
-                'zip_file': zip_base64,
-                'filename': 'result.zip'
-            })
-            
-        except HTTPException:
-            raise
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Error processing files: {str(e)}")
+    validate_upload_names(file1, file2)
+    validate_compression(compression)
+    validate_fuzzy_distance(fuzzy_distance)
+    validate_max_part_bytes(max_part_bytes)
+    if max_part_bytes and not part_store:
+        raise HTTPException(status_code=400,
+                            detail="max_part_bytes needs a part store (COMPARE_PART_BUCKET) on this deployment")
+    options = {'compression': compression, 'fingerprint': fingerprint, 'prefer_newer': prefer_newer,
+               'fuzzy_distance': fuzzy_distance}
+    return await compare_uploads(file1, file2, options, None, max_part_bytes=max_part_bytes)
 
 
 @app.get("/")
@@ -0,0 +1,190 @@
+"""
+Benchmark of the kernel-assisted copy paths in fast_io against buffered copies.
+
+Each scenario runs the pipeline's own code on the same synthetic data with
+fast_io enabled and with fast_io.ENABLED = False (the plain read/write
+loops), alternating, and reports the best of --repeat runs of each:
+
+- spool:   copy_and_hash of an upload spooled to disk into the job directory
+- copy:    copy_file of a finished result into the cache
+- members: raw member data copied from an uploaded ranges blob into a result
+- archive: write_zip of incompressible (STORED) PDFs
+- base64:  base64 encoding of a result for the JSON response
+
+Files live in a temporary directory (--dir to choose its filesystem); they
+stay in the page cache, so the numbers compare CPU and copy overhead rather
+than disk speed.
+
+Example:
+    python bench_io.py --size-mb 512 --repeat 5 --output io.json
+"""
+import argparse
+import base64
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import zipfile
+from typing import Callable, Dict, List, Optional
+
+import fast_io
+from manifest import iter_member_data
+from zip_stream import ZIP_STORED, ZipStreamWriter, pack_dos_datetime, write_zip
+
+
+def timed(func: Callable[[str], None], work_dir: str) -> float:
+    """
+    Run func once with a fresh output path; removing the output is not timed.
+    """
+    output = os.path.join(work_dir, 'output.bin')
+    started = time.perf_counter()
+    func(output)
+    elapsed = time.perf_counter() - started
+    if os.path.exists(output):
+        os.remove(output)
+    return elapsed
+
+
+def make_file(path: str, size: int):
+    with open(path, 'wb') as f:
+        remaining = size
+        while remaining > 0:
+            chunk = os.urandom(min(remaining, 1024 * 1024))
+            f.write(chunk)
+            remaining -= len(chunk)
+
+
+def spooled_upload(path: str) -> tempfile.SpooledTemporaryFile:
+    """
+    The upload as Starlette hands it over: a SpooledTemporaryFile rolled to disk.
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    with open(path, 'rb') as f:
+        shutil.copyfileobj(f, spool)
+    spool.seek(0)
+    return spool
+
+
+def scenarios(work_dir: str, size: int, files: int) -> Dict[str, Callable[[str], None]]:
+    source = os.path.join(work_dir, 'source.bin')
+    make_file(source, size)
+
+    spool = spooled_upload(source)
+
+    def spool_copy(output: str):
+        spool.seek(0)
+        fast_io.copy_and_hash(spool, output)
+
+    def cache_copy(output: str):
+        fast_io.copy_file(source, output)
+
+    # A STORED archive stands in for the uploaded ranges blob
+    blob_path = os.path.join(work_dir, 'blob.zip')
+    pdf_size = max(size // files, 1)
+    pdf_paths = []
+    for index in range(files):
+        pdf_path = os.path.join(work_dir, f"{index:05d}.pdf")
+        make_file(pdf_path, pdf_size)
+        pdf_paths.append(pdf_path)
+    with zipfile.ZipFile(blob_path, 'w', zipfile.ZIP_STORED) as zf:
+        for pdf_path in pdf_paths:
+            zf.write(pdf_path, os.path.basename(pdf_path))
+    with zipfile.ZipFile(blob_path) as zf:
+        infos = zf.infolist()
+
+    def member_copy(output: str):
+        writer = ZipStreamWriter()
+        with open(blob_path, 'rb') as blob, open(output, 'wb') as f:
+            for info in infos:
+                entry = {'member': info.filename, 'compress_size': info.compress_size}
+                chunks = iter_member_data(blob, info.header_offset, entry, ranges=True)
+                fast_io.write_chunks(f, writer.add_raw(info.filename, info.compress_type, info.CRC,
+                                                       info.compress_size, info.file_size,
+                                                       pack_dos_datetime(info.date_time), chunks))
+            fast_io.write_chunks(f, writer.finish())
+
+    def archive_write(output: str):
+        write_zip([(os.path.basename(path), path) for path in pdf_paths],
+                  output, ZipStreamWriter(compression=ZIP_STORED))
+
+    def encode_result(output: str):
+        if fast_io.ENABLED:
+            with fast_io.MappedFile(source) as data:
+                base64.b64encode(data)
+        else:
+            with open(source, 'rb') as f:
+                base64.b64encode(f.read())
+
+    return {
+        'spool': spool_copy,
+        'copy': cache_copy,
+        'members': member_copy,
+        'archive': archive_write,
+        'base64': encode_result,
+    }
+
+
+def run(size: int, files: int, repeat: int, selected: List[str], work_root: Optional[str]) -> Dict:
+    work_dir = tempfile.mkdtemp(prefix='bench-io-', dir=work_root)
+    try:
+        cases = scenarios(work_dir, size, files)
+        results = {}
+        for name in selected:
+            timings = {'buffered': None, 'fast': None}
+            # Alternate the two paths so page cache and writeback affect both alike
+            for _ in range(repeat):
+                for enabled in (False, True):
+                    fast_io.ENABLED = enabled
+                    label = 'fast' if enabled else 'buffered'
+                    elapsed = timed(cases[name], work_dir)
+                    timings[label] = elapsed if timings[label] is None else min(timings[label], elapsed)
+            results[name] = {
+                'buffered_seconds': round(timings['buffered'], 4),
+                'fast_seconds': round(timings['fast'], 4),
+                'buffered_mb_per_s': round(size / timings['buffered'] / 1e6, 1),
+                'fast_mb_per_s': round(size / timings['fast'] / 1e6, 1),
+                'speedup': round(timings['buffered'] / timings['fast'], 2),
+            }
+        return {
+            'bytes': size,
+            'files': files,
+            'repeat': repeat,
+            'copy_file_range': hasattr(os, 'copy_file_range'),
+            'sendfile': hasattr(os, 'sendfile'),
+            'results': results,
+        }
+    finally:
+        fast_io.ENABLED = True
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Compare fast_io copies with buffered copies.")
+    parser.add_argument('--size-mb', type=int, default=256, help="Bytes moved per scenario, in MB")
+    parser.add_argument('--files', type=int, default=64, help="PDFs in the members and archive scenarios")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per scenario; the best is reported")
+    parser.add_argument('--scenarios', default='spool,copy,members,archive,base64',
+                        help="Comma-separated scenarios to run")
+    parser.add_argument('--dir', default=None, help="Directory for the scratch files")
+    parser.add_argument('--output', default=None, help="Also write the JSON report to this file")
+    args = parser.parse_args(argv)
+
+    selected = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    known = ('spool', 'copy', 'members', 'archive', 'base64')
+    unknown = [name for name in selected if name not in known]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+
+    report = run(args.size_mb * 1024 * 1024, args.files, args.repeat, selected, args.dir)
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,216 @@
+"""
+Kernel-assisted file copies.
+
+Most bytes the pipeline moves are copied verbatim: uploads into the job
+directory, stored (uncompressed) PDFs and raw member data into result.zip,
+finished results into the cache. Read/write loops pull every byte through a
+Python buffer; here the same copies go through os.copy_file_range (which can
+also share extents on copy-on-write filesystems) or os.sendfile, so the data
+stays in the kernel, and hashes and CRCs are computed over memory-mapped
+files instead of freshly read chunks.
+
+Writers pass FileRange objects in place of byte chunks for data that already
+sits in an open file; write_chunks turns them into range copies. Every path
+falls back to a plain buffered copy where a system call is unavailable or
+refuses the file pair (e.g. EXDEV across filesystems), and in-memory sources
+such as small uploads still spooled in RAM always take the buffered path.
+COMPARE_FAST_IO=0 disables the kernel paths altogether.
+"""
+import errno
+import hashlib
+import mmap
+import os
+import stat
+import tempfile
+import zlib
+from typing import BinaryIO, Iterable, Optional, Union
+
+ENABLED = os.environ.get('COMPARE_FAST_IO', '1') != '0'
+CHUNK_SIZE = 1024 * 1024
+# Bytes per system call; sendfile moves at most about 2 GiB at a time
+MAX_COPY = 1 << 30
+
+# errno values meaning "this call cannot copy between these files", not a failed copy
+FALLBACK_ERRORS = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSUP,
+                   errno.EBADF, errno.ESPIPE, errno.EPERM}
+
+
+class FileRange:
+    """
+    length bytes at offset of the open file descriptor fd, written by
+    write_chunks without passing through Python.
+    """
+    __slots__ = ('fd', 'offset', 'length')
+
+    def __init__(self, fd: int, offset: int, length: int):
+        self.fd = fd
+        self.offset = offset
+        self.length = length
+
+    def __len__(self) -> int:
+        return self.length
+
+
+def source_fileno(f: BinaryIO) -> Optional[int]:
+    """
+    The descriptor of f if it is a regular file the kernel paths can read, else None.
+    """
+    if not ENABLED:
+        return None
+    # A SpooledTemporaryFile still in memory would be written to disk by fileno()
+    if isinstance(f, tempfile.SpooledTemporaryFile) and not f._rolled:
+        return None
+    try:
+        fd = f.fileno()
+        if not stat.S_ISREG(os.fstat(fd).st_mode):
+            return None
+    except (AttributeError, OSError, ValueError):
+        return None
+    return fd
+
+
+def _kernel_copies():
+    if not ENABLED:
+        return []
+    calls = []
+    if hasattr(os, 'copy_file_range'):
+        calls.append(lambda src, dest, at, size: os.copy_file_range(src, dest, size, at))
+    if hasattr(os, 'sendfile'):
+        calls.append(lambda src, dest, at, size: os.sendfile(dest, src, at, size))
+    return calls
+
+
+def _buffered_copy(src_fd: int, dest_fd: int, offset: int, size: int) -> int:
+    chunk = os.pread(src_fd, min(CHUNK_SIZE, size), offset)
+    view = memoryview(chunk)
+    while view:
+        view = view[os.write(dest_fd, view):]
+    return len(chunk)
+
+
+def copy_range(src_fd: int, dest_fd: int, offset: int, count: int) -> int:
+    """
+    Copy count bytes from offset of src_fd to the current position of dest_fd
+    (advancing it). Returns the bytes copied, fewer only if src_fd ends early.
+    """
+    calls = _kernel_copies() + [_buffered_copy]
+    copied = 0
+    while copied < count:
+        try:
+            sent = calls[0](src_fd, dest_fd, offset + copied, min(count - copied, MAX_COPY))
+        except OSError as e:
+            # The call refused this pair of files; nothing was written, try the next one
+            if e.errno not in FALLBACK_ERRORS or len(calls) == 1:
+                raise
+            calls.pop(0)
+            continue
+        if sent == 0:
+            break
+        copied += sent
+    return copied
+
+
+def copy_file(src_path: str, dest_path: str):
+    """
+    Copy a whole file (drop-in for shutil.copyfile between regular files).
+    """
+    with open(src_path, 'rb') as src, open(dest_path, 'wb') as dest:
+        size = os.fstat(src.fileno()).st_size
+        if copy_range(src.fileno(), dest.fileno(), 0, size) != size:
+            raise OSError(f"{src_path} changed size while being copied")
+
+
+def copy_and_hash(src: BinaryIO, dest_path: str) -> str:
+    """
+    Copy src from its current position to dest_path, hashing it on the way.
+    Returns the SHA-256 hex digest of the copied bytes.
+    """
+    digest = hashlib.sha256()
+    fd = source_fileno(src)
+    if fd is None:
+        with open(dest_path, 'wb') as f:
+            while True:
+                chunk = src.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                f.write(chunk)
+        return digest.hexdigest()
+
+    start = src.tell()
+    size = os.fstat(fd).st_size - start
+    if size > 0:
+        with mmap.mmap(fd, 0, access=mmap.ACCESS_READ) as mapped:
+            with memoryview(mapped) as view:
+                digest.update(view[start:])
+    with open(dest_path, 'wb') as f:
+        if size > 0 and copy_range(fd, f.fileno(), start, size) != size:
+            raise OSError("Upload changed size while being copied")
+    src.seek(start + max(size, 0))
+    return digest.hexdigest()
+
+
+def file_sha256(path: str) -> str:
+    """
+    SHA-256 hex digest of the file at path, computed over a memory map.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        if not ENABLED:
+            while True:
+                chunk = f.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+        elif os.fstat(f.fileno()).st_size:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                digest.update(mapped)
+    return digest.hexdigest()
+
+
+def file_crc32(fd: int, size: int) -> int:
+    """
+    CRC-32 of the first size bytes of fd, computed over a memory map.
+    """
+    if size == 0:
+        return 0
+    with mmap.mmap(fd, size, access=mmap.ACCESS_READ) as mapped:
+        return zlib.crc32(mapped)
+
+
+def write_chunks(f: BinaryIO, chunks: Iterable[Union[bytes, FileRange]]):
+    """
+    Write byte chunks and FileRanges, in order, to the open file f.
+    """
+    for chunk in chunks:
+        if isinstance(chunk, FileRange):
+            # Buffered bytes must land before the kernel writes at the file position
+            f.flush()
+            if copy_range(chunk.fd, f.fileno(), chunk.offset, chunk.length) != chunk.length:
+                raise EOFError(f"Source ends before {chunk.offset + chunk.length} bytes")
+        else:
+            f.write(chunk)
+
+
+class MappedFile:
+    """
+    Read-only memory map of a whole file, usable as a bytes-like object
+    (e.g. base64.b64encode(mapped)) without reading the file into memory first.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file = None
+        self.mapped = None
+
+    def __enter__(self):
+        self.file = open(self.path, 'rb')
+        if os.fstat(self.file.fileno()).st_size == 0:
+            return b''
+        self.mapped = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.mapped
+
+    def __exit__(self, *exc_info):
+        if self.mapped is not None:
+            self.mapped.close()
+        self.file.close()
@@ -0,0 +1,175 @@
+"""
+Near-duplicate username matching.
+
+Usernames are matched exactly when merging, so `dab7341`, `DAB 7341` or an
+OCR slip such as `DA87341` end up as separate users. This module finds such
+near misses between the usernames found only in ZIP 1 and those found only in
+ZIP 2, for review; it never changes what is merged.
+
+Every username is reduced to a key: uppercase, letters and digits only, with
+characters OCR commonly confuses folded together (O/0, I/L/1, S/5, B/8, Z/2,
+G/6). Equal keys are reported directly. Keys within a small edit distance are
+found with a symmetric-deletion index: each ZIP 2 key is stored under every
+string obtained by deleting up to max_distance characters, and each ZIP 1 key
+only looks up its own deletions. Candidates are then verified with a bounded
+edit distance (adjacent transpositions count as one edit). The cost grows with
+the number of usernames times the deletions per key, not with the product of
+both sides, so 100k+ usernames per archive stay fast.
+"""
+import re
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+MAX_DISTANCE = 2
+# Keys shorter than this only match on equal keys; one edit is too much of them
+MIN_EDIT_LENGTH = 5
+CANDIDATES_PER_USERNAME = 3
+
+OCR_CONFUSIONS = str.maketrans({'O': '0', 'Q': '0', 'I': '1', 'L': '1', 'S': '5', 'B': '8', 'Z': '2', 'G': '6'})
+
+
+def normalize_username(username: str) -> str:
+    """
+    Uppercase and drop everything but letters and digits: 'dab 7341' -> 'DAB7341'.
+    """
+    return re.sub(r'[^A-Z0-9]', '', username.upper())
+
+
+def match_key(username: str) -> str:
+    """
+    Normalized username with OCR look-alikes folded: 'DA87341' and 'DAB7341' -> 'DA87341'.
+    """
+    return normalize_username(username).translate(OCR_CONFUSIONS)
+
+
+def deletions(key: str, max_distance: int) -> Set[str]:
+    """
+    key and every string obtained by deleting up to max_distance of its characters.
+    """
+    variants = {key}
+    frontier = {key}
+    for _ in range(max_distance):
+        frontier = {variant[:index] + variant[index + 1:]
+                    for variant in frontier for index in range(len(variant))}
+        variants |= frontier
+    return variants
+
+
+def bounded_distance(a: str, b: str, max_distance: int) -> Optional[int]:
+    """
+    Edit distance between a and b counting adjacent transpositions as one edit
+    (optimal string alignment), or None as soon as it must exceed max_distance.
+    """
+    if abs(len(a) - len(b)) > max_distance:
+        return None
+    # A shared prefix and suffix do not change the distance
+    start = 0
+    while start < len(a) and start < len(b) and a[start] == b[start]:
+        start += 1
+    end = 0
+    while end < len(a) - start and end < len(b) - start and a[-1 - end] == b[-1 - end]:
+        end += 1
+    a = a[start:len(a) - end]
+    b = b[start:len(b) - end]
+    previous_previous = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous_previous[j - 2] + 1)
+        if min(current) > max_distance:
+            return None
+        previous_previous, previous = previous, current
+    return previous[-1] if previous[-1] <= max_distance else None
+
+
+class NearMatchIndex:
+    """
+    Symmetric-deletion index over one side's usernames.
+    """
+
+    def __init__(self, usernames: Iterable[str], max_distance: int = 1):
+        self.max_distance = max_distance
+        self.keys: Dict[str, str] = {}
+        self.variants: Dict[str, Set[str]] = {}
+        for username in usernames:
+            key = match_key(username)
+            if not key:
+                continue
+            self.keys[username] = key
+            distance = max_distance if len(key) >= MIN_EDIT_LENGTH else 0
+            for variant in deletions(key, distance):
+                self.variants.setdefault(variant, set()).add(username)
+
+    def candidates(self, username: str) -> List[Tuple[str, float, str, int]]:
+        """
+        Indexed usernames close to username, best first, as
+        (username, score, reason, distance). reason is 'normalized' (same
+        letters and digits), 'ocr' (same after folding look-alikes) or 'edit'.
+        """
+        key = match_key(username)
+        if not key:
+            return []
+        distance_limit = self.max_distance if len(key) >= MIN_EDIT_LENGTH else 0
+        found = {}
+        for variant in deletions(key, distance_limit):
+            for other in self.variants.get(variant, ()):
+                if other in found:
+                    continue
+                other_key = self.keys[other]
+                if other_key == key:
+                    if normalize_username(other) == normalize_username(username):
+                        found[other] = (other, 1.0, 'normalized', 0)
+                    else:
+                        found[other] = (other, 0.9, 'ocr', 0)
+                    continue
+                if len(other_key) < MIN_EDIT_LENGTH:
+                    continue
+                distance = bounded_distance(key, other_key, distance_limit)
+                if distance is not None:
+                    score = round(0.9 * (1 - distance / max(len(key), len(other_key))), 3)
+                    found[other] = (other, score, 'edit', distance)
+        return sorted(found.values(), key=lambda candidate: (-candidate[1], candidate[0]))
+
+
+def find_near_duplicates(zip1_usernames: Iterable[str], zip2_usernames: Iterable[str],
+                         max_distance: int = 1,
+                         limit: int = CANDIDATES_PER_USERNAME,
+                         zip2_aliases: Optional[Dict[str, str]] = None) -> List[Dict]:
+    """
+    Candidate pairs between usernames found only in ZIP 1 and only in ZIP 2.
+    zip2_aliases maps other names a ZIP 2 file goes by (such as its folder
+    prefix) to its username; they are matched like usernames, but only real
+    usernames count as exact matches that leave a username out.
+    Returns dicts {zip1_username, zip2_username, score, reason, distance},
+    best score first, at most limit candidates per ZIP 1 username.
+    """
+    zip1_set = set(zip1_usernames)
+    zip2_set = set(zip2_usernames)
+    # indexed name -> ZIP 2 username it reports
+    zip2_names = {username: username for username in zip2_set - zip1_set}
+    for alias, username in (zip2_aliases or {}).items():
+        if username in zip2_names:
+            zip2_names.setdefault(alias, username)
+    index = NearMatchIndex(zip2_names, max_distance)
+
+    pairs = []
+    for username in sorted(zip1_set - zip2_set):
+        best = {}
+        for other, score, reason, distance in index.candidates(username):
+            # A username and its aliases may all match; keep the best of them
+            best.setdefault(zip2_names[other], (score, reason, distance))
+            if len(best) == limit:
+                break
+        for other, (score, reason, distance) in best.items():
+            pairs.append({
+                'zip1_username': username,
+                'zip2_username': other,
+                'score': score,
+                'reason': reason,
+                'distance': distance
+            })
+    pairs.sort(key=lambda pair: (-pair['score'], pair['zip1_username'], pair['zip2_username']))
+    return pairs
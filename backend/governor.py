@@ -0,0 +1,216 @@
+"""
+Resource governor for comparison jobs.
+
+Before anything is extracted, estimate_cost walks the central directory of an
+uploaded archive, and of every nested archive inside it, to add up entry
+counts and uncompressed bytes and to spot suspicious compression ratios. Jobs
+over the configured budgets are rejected outright. Jobs within budget are
+admitted by an AdmissionController, which runs the cheapest waiting jobs first
+while the estimated bytes of the running jobs fit in a shared capacity. While
+running, a JobBudget enforces the job's disk and time quotas. Request handlers
+wait for admission on the event loop (acquire_async), so a queued request holds
+no worker thread; job workers, which have threads of their own, block in acquire.
+
+Uncompressed sizes come from the central directory; zipfile never returns
+more than a member's declared file_size, so the estimate is also an upper
+bound on what extraction writes.
+"""
+import asyncio
+import heapq
+import itertools
+import os
+import threading
+import time
+import zipfile
+from typing import Dict, Optional
+
+MAX_UNCOMPRESSED_BYTES = int(os.environ.get('COMPARE_MAX_UNCOMPRESSED_BYTES', 2 * 1024 ** 3))
+MAX_ENTRIES = int(os.environ.get('COMPARE_MAX_ENTRIES', 100000))
+# Entries larger than RATIO_MIN_SIZE that inflate more than this are treated as zip bombs
+MAX_COMPRESSION_RATIO = float(os.environ.get('COMPARE_MAX_COMPRESSION_RATIO', 100))
+RATIO_MIN_SIZE = 1024 * 1024
+MAX_NESTING_DEPTH = 5
+# Bytes a single job may write to disk (extracted files plus the result ZIP)
+JOB_DISK_QUOTA = int(os.environ.get('COMPARE_JOB_DISK_QUOTA', 2 * MAX_UNCOMPRESSED_BYTES))
+JOB_TIME_LIMIT = float(os.environ.get('COMPARE_JOB_TIME_LIMIT', 600))
+# Estimated bytes that may be in flight across all running jobs
+MAX_CONCURRENT_BYTES = int(os.environ.get('COMPARE_MAX_CONCURRENT_BYTES', 4 * 1024 ** 3))
+QUEUE_TIMEOUT = float(os.environ.get('COMPARE_QUEUE_TIMEOUT', 120))
+# Seconds between admission checks of a request waiting on the event loop
+ADMISSION_POLL_INTERVAL = 0.05
+
+
+class ResourceLimitExceeded(Exception):
+    """
+    Raised when a job exceeds a size, entry, ratio, disk or time limit.
+    """
+
+
+class QueueTimeout(Exception):
+    """
+    Raised when a job could not be admitted within the queue timeout.
+    """
+
+
+def estimate_cost(zip_path: str, max_depth: int = MAX_NESTING_DEPTH,
+                  max_bytes: int = MAX_UNCOMPRESSED_BYTES, max_entries: int = MAX_ENTRIES,
+                  max_ratio: float = MAX_COMPRESSION_RATIO) -> Dict:
+    """
+    Pre-flight pass over an archive's central directory, including nested ZIPs.
+    Returns: {entries, uncompressed_bytes, compressed_bytes, nested_archives, max_ratio}
+    Raises ResourceLimitExceeded as soon as a budget is exceeded, so a hostile
+    archive is never walked (or extracted) in full.
+    """
+    cost = {
+        'entries': 0,
+        'uncompressed_bytes': 0,
+        'compressed_bytes': 0,
+        'nested_archives': 0,
+        'max_ratio': 0.0
+    }
+    with zipfile.ZipFile(zip_path, 'r') as zf:
+        _add_directory_cost(zf, cost, 0, max_depth, max_bytes, max_entries, max_ratio)
+    cost['max_ratio'] = round(cost['max_ratio'], 1)
+    return cost
+
+
+def _add_directory_cost(zf: zipfile.ZipFile, cost: Dict, depth: int, max_depth: int,
+                        max_bytes: int, max_entries: int, max_ratio: float):
+    for info in zf.infolist():
+        cost['entries'] += 1
+        cost['uncompressed_bytes'] += info.file_size
+        cost['compressed_bytes'] += info.compress_size
+        ratio = info.file_size / max(info.compress_size, 1)
+        if info.file_size >= RATIO_MIN_SIZE:
+            cost['max_ratio'] = max(cost['max_ratio'], ratio)
+            if ratio > max_ratio:
+                raise ResourceLimitExceeded(
+                    f"{info.filename} expands {ratio:.0f}x (limit {max_ratio:.0f}x)")
+        if cost['entries'] > max_entries:
+            raise ResourceLimitExceeded(f"More than {max_entries} entries")
+        if cost['uncompressed_bytes'] > max_bytes:
+            raise ResourceLimitExceeded(f"More than {max_bytes} uncompressed bytes")
+
+        # Nested archives are extracted too (up to the same depth as extract_nested_zips)
+        if info.filename.lower().endswith('.zip') and depth + 1 < max_depth:
+            try:
+                with zf.open(info) as member:
+                    with zipfile.ZipFile(member, 'r') as nested:
+                        cost['nested_archives'] += 1
+                        _add_directory_cost(nested, cost, depth + 1, max_depth,
+                                            max_bytes, max_entries, max_ratio)
+            except (zipfile.BadZipFile, NotImplementedError, RuntimeError, OSError):
+                # Not really a ZIP (ZIP 2 misnames PDFs); it is extracted as a plain file
+                continue
+
+
+class JobBudget:
+    """
+    Disk and time quota for one running job.
+    charge() is called before bytes are written; check_time() from the job's loops.
+    """
+
+    def __init__(self, disk_quota: int = JOB_DISK_QUOTA, time_limit: float = JOB_TIME_LIMIT):
+        self.disk_quota = disk_quota
+        self.disk_used = 0
+        self.deadline = time.monotonic() + time_limit
+        self.time_limit = time_limit
+
+    def charge(self, nbytes: int):
+        self.disk_used += nbytes
+        if self.disk_used > self.disk_quota:
+            raise ResourceLimitExceeded(f"Job exceeded its disk quota of {self.disk_quota} bytes")
+        self.check_time()
+
+    def check_time(self):
+        if time.monotonic() > self.deadline:
+            raise ResourceLimitExceeded(f"Job exceeded its time limit of {self.time_limit:.0f}s")
+
+
+class AdmissionController:
+    """
+    Admits jobs while the sum of their estimated bytes fits in capacity.
+    Waiting jobs are admitted cheapest first; a job larger than the whole
+    capacity still runs, alone, once everything else has finished.
+    Thread-based, as jobs run in worker threads.
+    """
+
+    def __init__(self, capacity: int = MAX_CONCURRENT_BYTES):
+        self.capacity = capacity
+        self.in_use = 0
+        self.running = 0
+        self.waiting = []
+        self.counter = itertools.count()
+        self.condition = threading.Condition()
+
+    def _fits(self, cost: int) -> bool:
+        return self.running == 0 or self.in_use + cost <= self.capacity
+
+    def acquire(self, cost: int, timeout: Optional[float] = QUEUE_TIMEOUT):
+        """
+        Block until the job may run. Raises QueueTimeout after timeout seconds
+        (with timeout=None, waits for as long as it takes).
+        """
+        ticket = (cost, next(self.counter))
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.condition:
+            heapq.heappush(self.waiting, ticket)
+            try:
+                while not (self.waiting[0] == ticket and self._fits(cost)):
+                    if deadline is None:
+                        self.condition.wait()
+                        continue
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise QueueTimeout(f"Server busy: job was queued for more than {timeout:g}s")
+                    self.condition.wait(remaining)
+            finally:
+                self.waiting.remove(ticket)
+                heapq.heapify(self.waiting)
+                # The next cheapest waiter may now be at the head of the queue
+                self.condition.notify_all()
+            self.in_use += cost
+            self.running += 1
+
+    async def acquire_async(self, cost: int, timeout: Optional[float] = QUEUE_TIMEOUT,
+                            poll_interval: float = ADMISSION_POLL_INTERVAL):
+        """
+        acquire() for the event loop: waits its turn without holding a thread.
+        The ticket is queued like a blocking waiter's, so the cheapest job still
+        goes first. Raises QueueTimeout after timeout seconds.
+        """
+        ticket = (cost, next(self.counter))
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.condition:
+            heapq.heappush(self.waiting, ticket)
+        try:
+            while True:
+                with self.condition:
+                    if self.waiting[0] == ticket and self._fits(cost):
+                        self.in_use += cost
+                        self.running += 1
+                        return
+                if deadline is not None and time.monotonic() >= deadline:
+                    raise QueueTimeout(f"Server busy: job was queued for more than {timeout:g}s")
+                await asyncio.sleep(poll_interval)
+        finally:
+            # Also runs if the waiting request is cancelled
+            with self.condition:
+                self.waiting.remove(ticket)
+                heapq.heapify(self.waiting)
+                self.condition.notify_all()
+
+    def release(self, cost: int):
+        with self.condition:
+            self.in_use -= cost
+            self.running -= 1
+            self.condition.notify_all()
+
+    def stats(self) -> Dict:
+        with self.condition:
+            return {
+                'running': self.running,
+                'queued': len(self.waiting),
+                'bytes_in_use': self.in_use,
+                'capacity': self.capacity
+            }
@@ -0,0 +1,351 @@
+"""
+Shared job and result store.
+
+Comparisons submitted to /api/jobs are queued here instead of running inside
+the request. Any worker thread of any uvicorn process on the host pointing at
+the same store can claim a queued job, and any of those processes can report
+its status and serve its result, so no sticky sessions are needed between them.
+
+The default backend keeps job state in SQLite and job files (uploads, result
+ZIP, summary) in a directory, one `<job_id>/` per job. The database runs in
+WAL mode, which relies on shared memory between the processes using it, so the
+SQLite store is for a single host: its files must be on a local filesystem,
+not a network share. Only a single host is supported: nodes do not share jobs
+(or the per-host result cache), so deployments spanning several nodes need
+another backend that implements JobStore and registers itself in STORE_BACKENDS.
+
+Running workers refresh a heartbeat; jobs whose heartbeat is older than the
+lease are requeued (or failed after MAX_ATTEMPTS), so a worker that dies mid-job
+does not lose it. Completion and failure are only recorded by the worker
+holding the claim.
+"""
+import json
+import os
+import secrets
+import shutil
+import socket
+import sqlite3
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, List, Optional
+
+JOB_STORE = os.environ.get('COMPARE_JOB_STORE', 'sqlite')
+JOB_DIR = os.environ.get('COMPARE_JOB_DIR', os.path.join(tempfile.gettempdir(), 'compare-zips-jobs'))
+JOB_DB = os.environ.get('COMPARE_JOB_DB', os.path.join(JOB_DIR, 'jobs.sqlite3'))
+# Seconds without a heartbeat before a running job is considered abandoned
+JOB_LEASE = float(os.environ.get('COMPARE_JOB_LEASE', 60))
+JOB_MAX_ATTEMPTS = int(os.environ.get('COMPARE_JOB_MAX_ATTEMPTS', 3))
+# Finished jobs (and their files) are removed after this many seconds
+JOB_TTL = int(os.environ.get('COMPARE_JOB_TTL', 24 * 3600))
+# Worker threads started by each API process (0 to only enqueue and serve results)
+JOB_WORKERS = int(os.environ.get('COMPARE_JOB_WORKERS', 2))
+POLL_INTERVAL = 1.0
+
+JOB_STATES = ('uploading', 'queued', 'running', 'done', 'failed')
+
+
+class JobStore(ABC):
+    """
+    Interface of a job store. Jobs are dicts with at least:
+    id, state, options, attempts, created, updated, error, result_id.
+    """
+
+    @abstractmethod
+    def job_dir(self, job_id: str) -> str:
+        ...
+
+    @abstractmethod
+    def create(self, options: Dict, job_id: Optional[str] = None) -> str:
+        """
+        Reserve a job id and its directory; the job is not claimable until enqueue().
+        """
+
+    @abstractmethod
+    def enqueue(self, job_id: str, result_id: Optional[str] = None):
+        """
+        Make an uploaded job claimable. result_id identifies the result it will produce.
+        """
+
+    @abstractmethod
+    def claim(self, worker_id: str) -> Optional[Dict]:
+        """
+        Atomically take the oldest queued job for worker_id, or return None.
+        """
+
+    @abstractmethod
+    def heartbeat(self, job_id: str, worker_id: str) -> bool:
+        """
+        Extend the claim. False if the job was taken away from worker_id.
+        """
+
+    @abstractmethod
+    def complete(self, job_id: str, worker_id: str) -> bool:
+        ...
+
+    @abstractmethod
+    def fail(self, job_id: str, worker_id: Optional[str], error: str) -> bool:
+        ...
+
+    @abstractmethod
+    def get(self, job_id: str) -> Optional[Dict]:
+        ...
+
+    @abstractmethod
+    def recover_stale(self) -> int:
+        """
+        Requeue (or fail) running jobs whose heartbeat expired. Returns how many.
+        """
+
+    @abstractmethod
+    def counts(self) -> Dict[str, int]:
+        """
+        Number of jobs per state.
+        """
+
+    @abstractmethod
+    def cleanup(self) -> int:
+        """
+        Remove finished (or abandoned uploading) jobs older than the TTL. Returns how many.
+        """
+
+
+class SQLiteJobStore(JobStore):
+    """
+    Job state in a SQLite database (WAL mode), job files in a directory on the
+    same host. A new connection is opened per operation, so the store is safe to
+    use from any thread and any process on that host.
+    """
+
+    def __init__(self, root: str = JOB_DIR, db_path: str = JOB_DB, lease: float = JOB_LEASE,
+                 max_attempts: int = JOB_MAX_ATTEMPTS, ttl: int = JOB_TTL):
+        self.root = root
+        self.db_path = db_path
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.ttl = ttl
+        os.makedirs(self.root, exist_ok=True)
+        db = self.connect()
+        try:
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('''CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                state TEXT NOT NULL,
+                options TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                worker TEXT,
+                heartbeat REAL,
+                created REAL NOT NULL,
+                updated REAL NOT NULL,
+                error TEXT,
+                result_id TEXT
+            )''')
+            db.execute('CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, created)')
+        finally:
+            db.close()
+
+    def connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        db.row_factory = sqlite3.Row
+        return db
+
+    def execute(self, sql: str, params: tuple = ()) -> int:
+        """
+        Run one statement in its own transaction. Returns the number of rows changed.
+        """
+        db = self.connect()
+        try:
+            return db.execute(sql, params).rowcount
+        finally:
+            db.close()
+
+    def job_dir(self, job_id: str) -> str:
+        return os.path.join(self.root, job_id)
+
+    def create(self, options: Dict, job_id: Optional[str] = None) -> str:
+        job_id = job_id or secrets.token_hex(16)
+        os.makedirs(self.job_dir(job_id), exist_ok=True)
+        now = time.time()
+        self.execute("INSERT INTO jobs (id, state, options, created, updated) VALUES (?, 'uploading', ?, ?, ?)",
+                     (job_id, json.dumps(options), now, now))
+        return job_id
+
+    def enqueue(self, job_id: str, result_id: Optional[str] = None):
+        self.execute("UPDATE jobs SET state = 'queued', result_id = ?, updated = ? "
+                     "WHERE id = ? AND state = 'uploading'", (result_id, time.time(), job_id))
+
+    def claim(self, worker_id: str) -> Optional[Dict]:
+        db = self.connect()
+        try:
+            # BEGIN IMMEDIATE takes the write lock first, so two workers never claim the same row
+            db.execute('BEGIN IMMEDIATE')
+            row = db.execute("SELECT id FROM jobs WHERE state = 'queued' ORDER BY created LIMIT 1").fetchone()
+            if row is None:
+                db.execute('COMMIT')
+                return None
+            now = time.time()
+            db.execute("UPDATE jobs SET state = 'running', worker = ?, heartbeat = ?, updated = ?, "
+                       "attempts = attempts + 1 WHERE id = ?", (worker_id, now, now, row['id']))
+            job = db.execute('SELECT * FROM jobs WHERE id = ?', (row['id'],)).fetchone()
+            db.execute('COMMIT')
+            return self.to_dict(job)
+        except sqlite3.Error:
+            if db.in_transaction:
+                db.execute('ROLLBACK')
+            raise
+        finally:
+            db.close()
+
+    def heartbeat(self, job_id: str, worker_id: str) -> bool:
+        return self.execute("UPDATE jobs SET heartbeat = ? WHERE id = ? AND worker = ? AND state = 'running'",
+                            (time.time(), job_id, worker_id)) == 1
+
+    def complete(self, job_id: str, worker_id: str) -> bool:
+        return self.execute("UPDATE jobs SET state = 'done', updated = ?, error = NULL "
+                            "WHERE id = ? AND worker = ? AND state = 'running'",
+                            (time.time(), job_id, worker_id)) == 1
+
+    def fail(self, job_id: str, worker_id: Optional[str], error: str) -> bool:
+        if worker_id is None:
+            return self.execute("UPDATE jobs SET state = 'failed', error = ?, updated = ? WHERE id = ?",
+                                (error, time.time(), job_id)) == 1
+        return self.execute("UPDATE jobs SET state = 'failed', error = ?, updated = ? "
+                            "WHERE id = ? AND worker = ? AND state = 'running'",
+                            (error, time.time(), job_id, worker_id)) == 1
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        db = self.connect()
+        try:
+            row = db.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        finally:
+            db.close()
+        return self.to_dict(row) if row else None
+
+    def recover_stale(self) -> int:
+        now = time.time()
+        expired = now - self.lease
+        failed = self.execute("UPDATE jobs SET state = 'failed', worker = NULL, updated = ?, "
+                              "error = 'Worker stopped responding' "
+                              "WHERE state = 'running' AND heartbeat < ? AND attempts >= ?",
+                              (now, expired, self.max_attempts))
+        requeued = self.execute("UPDATE jobs SET state = 'queued', worker = NULL, updated = ? "
+                                "WHERE state = 'running' AND heartbeat < ?", (now, expired))
+        if failed or requeued:
+            print(f"Recovered stale jobs: {requeued} requeued, {failed} failed")
+        return failed + requeued
+
+    def counts(self) -> Dict[str, int]:
+        db = self.connect()
+        try:
+            rows = db.execute('SELECT state, COUNT(*) AS n FROM jobs GROUP BY state').fetchall()
+        finally:
+            db.close()
+        counts = {state: 0 for state in JOB_STATES}
+        counts.update({row['state']: row['n'] for row in rows})
+        return counts
+
+    def cleanup(self) -> int:
+        db = self.connect()
+        try:
+            rows = db.execute("SELECT id FROM jobs WHERE state IN ('uploading', 'done', 'failed') AND updated < ?",
+                              (time.time() - self.ttl,)).fetchall()
+        finally:
+            db.close()
+        for row in rows:
+            shutil.rmtree(self.job_dir(row['id']), ignore_errors=True)
+            self.execute('DELETE FROM jobs WHERE id = ?', (row['id'],))
+        return len(rows)
+
+    @staticmethod
+    def to_dict(row: sqlite3.Row) -> Dict:
+        job = dict(row)
+        job['options'] = json.loads(job['options'])
+        return job
+
+
+STORE_BACKENDS = {
+    'sqlite': SQLiteJobStore,
+}
+
+
+def open_store(backend: str = JOB_STORE) -> JobStore:
+    """
+    Open the configured job store backend.
+    """
+    if backend not in STORE_BACKENDS:
+        raise ValueError(f"Unknown job store {backend!r}; choose from {', '.join(STORE_BACKENDS)}")
+    return STORE_BACKENDS[backend]()
+
+
+class JobWorker(threading.Thread):
+    """
+    Claims jobs from the store and runs handler(job, job_dir) on them.
+    A heartbeat is sent every lease/3 seconds while a job runs; stale jobs
+    from dead workers are recovered between polls.
+    """
+
+    def __init__(self, store: JobStore, handler: Callable[[Dict, str], None],
+                 name: str, poll_interval: float = POLL_INTERVAL):
+        super().__init__(name=name, daemon=True)
+        self.store = store
+        self.handler = handler
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{name}"
+        self.poll_interval = poll_interval
+        self.stopped = threading.Event()
+        self.jobs_done = 0
+        self.jobs_failed = 0
+
+    def run(self):
+        while not self.stopped.is_set():
+            try:
+                self.store.recover_stale()
+                job = self.store.claim(self.worker_id)
+            except Exception as e:
+                print(f"Warning: job store unavailable: {str(e)}")
+                job = None
+            if job is None:
+                self.stopped.wait(self.poll_interval)
+                continue
+            self.run_job(job)
+
+    def run_job(self, job: Dict):
+        beating = threading.Event()
+        interval = getattr(self.store, 'lease', JOB_LEASE) / 3
+
+        def beat():
+            while not beating.wait(interval):
+                if not self.store.heartbeat(job['id'], self.worker_id):
+                    return
+
+        heartbeat = threading.Thread(target=beat, daemon=True)
+        heartbeat.start()
+        try:
+            self.handler(job, self.store.job_dir(job['id']))
+            self.store.complete(job['id'], self.worker_id)
+            self.jobs_done += 1
+        except Exception as e:
+            print(f"Warning: job {job['id']} failed: {str(e)}")
+            self.store.fail(job['id'], self.worker_id, str(getattr(e, 'detail', e)))
+            self.jobs_failed += 1
+        finally:
+            beating.set()
+            heartbeat.join()
+
+    def stop(self):
+        self.stopped.set()
+
+
+def start_workers(store: JobStore, handler: Callable[[Dict, str], None],
+                  count: int) -> List[JobWorker]:
+    workers = [JobWorker(store, handler, f"worker-{index}") for index in range(count)]
+    for worker in workers:
+        worker.start()
+    return workers
+
+
+def stop_workers(workers: List[JobWorker], timeout: float = 5.0):
+    for worker in workers:
+        worker.stop()
+    for worker in workers:
+        worker.join(timeout)
@@ -0,0 +1,432 @@
+"""
+Load-test harness for the compare-zips service.
+
+Starts `uvicorn main:app` in a subprocess with its own temporary directory,
+replays a mix of synthetic archive pairs against it and prints a JSON report:
+latency percentiles, throughput, error rate, peak RSS of the server and peak
+temp-disk use. Only the standard library is used on the client side.
+
+Example:
+    python loadtest.py --concurrency 8 --rate 4 --requests 200 --mix small:3,large:1,nested:1
+    python loadtest.py --rate 0 --duration 60 --output baseline.json
+
+--rate is the mean arrival rate in requests per second (Poisson arrivals);
+latency is measured from each request's scheduled arrival, so time spent
+waiting for a free client slot counts. --rate 0 runs closed-loop instead:
+every client sends its next request as soon as the previous one returns.
+"""
+import argparse
+import http.client
+import io
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+SAMPLE_INTERVAL = 0.2
+
+# pdfs: PDFs per archive, overlap: usernames present in both,
+# size: bytes per PDF, compressible: share of each PDF that is text rather than noise
+SCENARIOS = {
+    'small': {'pdfs': 20, 'overlap': 5, 'size': 20 * 1024, 'compressible': 0.5, 'nested': False},
+    'large': {'pdfs': 200, 'overlap': 50, 'size': 200 * 1024, 'compressible': 0.2, 'nested': False},
+    'nested': {'pdfs': 50, 'overlap': 10, 'size': 50 * 1024, 'compressible': 0.5, 'nested': True},
+    'duplicates': {'pdfs': 100, 'overlap': 100, 'size': 50 * 1024, 'compressible': 0.8, 'nested': False},
+}
+
+
+def synthetic_pdf(username: str, size: int, compressible: float, rng: random.Random) -> bytes:
+    """
+    A PDF-shaped blob with a trailer the fingerprint stage can parse.
+    """
+    text_size = int(size * compressible)
+    text = (f"BT /F1 12 Tf ({username} report line) Tj ET\n" * (text_size // 40 + 1))[:text_size]
+    noise = rng.randbytes(size - text_size)
+    ident = username.encode('ascii').hex()
+    return (b"%PDF-1.4\n" + text.encode('ascii') + b"\nstream\n" + noise + b"\nendstream\n"
+            + f"trailer\n<< /Size 5 /ID [<{ident}><{ident}>] >>\nstartxref\n{size}\n%%EOF\n".encode('ascii'))
+
+
+def build_pair(scenario: Dict, seed: int) -> Tuple[bytes, bytes]:
+    """
+    Build one (ZIP 1, ZIP 2) pair in memory following the repository's layouts:
+    ZIP 1 holds folders of USERNAME_CODE.pdf, ZIP 2 one USERNAME(NUMBER) NAME folder per PDF.
+    """
+    rng = random.Random(seed)
+    count = scenario['pdfs']
+    first = 0
+    second = count - scenario['overlap']
+
+    zip1 = io.BytesIO()
+    with zipfile.ZipFile(zip1, 'w', zipfile.ZIP_DEFLATED, compresslevel=1) as zf:
+        for index in range(first, first + count):
+            username = f"LDT{index:05d}"
+            folder = f"folder{index % 2 + 1}"
+            pdf = synthetic_pdf(username, scenario['size'], scenario['compressible'], rng)
+            if scenario['nested'] and index % 10 == 0:
+                inner = io.BytesIO()
+                with zipfile.ZipFile(inner, 'w', zipfile.ZIP_STORED) as nested:
+                    nested.writestr(f"{username}_PLM-{index}.pdf", pdf)
+                zf.writestr(f"{folder}/batch{index}.zip", inner.getvalue())
+            else:
+                zf.writestr(f"{folder}/{username}_PLM-{index}.pdf", pdf)
+
+    zip2 = io.BytesIO()
+    with zipfile.ZipFile(zip2, 'w', zipfile.ZIP_DEFLATED, compresslevel=1) as zf:
+        for index in range(second, second + count):
+            username = f"LDT{index:05d}"
+            pdf = synthetic_pdf(username, scenario['size'], scenario['compressible'], rng)
+            zf.writestr(f"{username}({40000 + index}) LOAD TEST/document.pdf", pdf)
+    return zip1.getvalue(), zip2.getvalue()
+
+
+def parse_mix(mix: str) -> List[Tuple[str, int]]:
+    """
+    Parse "small:3,large:1" into [('small', 3), ('large', 1)].
+    """
+    weights = []
+    for part in mix.split(','):
+        name, _, weight = part.partition(':')
+        if name not in SCENARIOS:
+            raise ValueError(f"Unknown scenario {name!r}; choose from {', '.join(SCENARIOS)}")
+        weights.append((name, int(weight or 1)))
+    return weights
+
+
+def multipart_body(fields: Dict[str, str], files: Dict[str, Tuple[str, bytes]]) -> Tuple[bytes, str]:
+    """
+    Encode form fields and files as multipart/form-data.
+    Returns: (body, content type)
+    """
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'
+                     .encode('utf-8'))
+    for name, (filename, data) in files.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; '
+                     f'filename="{filename}"\r\nContent-Type: application/zip\r\n\r\n'.encode('utf-8'))
+        parts.append(data)
+        parts.append(b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode('utf-8'))
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+def post(base_url: str, path: str, body: bytes, content_type: str, timeout: float) -> Tuple[int, int]:
+    """
+    Send one request and drain the response.
+    Returns: (status code, response bytes)
+    """
+    url = urlsplit(base_url)
+    connection = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=timeout)
+    try:
+        connection.request('POST', path, body=body, headers={'Content-Type': content_type})
+        response = connection.getresponse()
+        received = 0
+        while True:
+            chunk = response.read(1024 * 1024)
+            if not chunk:
+                break
+            received += len(chunk)
+        return response.status, received
+    finally:
+        connection.close()
+
+
+def process_tree_rss(pid: int) -> int:
+    """
+    Resident set size in bytes of pid and its direct children (uvicorn --workers).
+    """
+    total = 0
+    pids = [pid]
+    try:
+        with open(f'/proc/{pid}/task/{pid}/children', 'r') as f:
+            pids += [int(child) for child in f.read().split()]
+    except OSError:
+        pass
+    for process_id in pids:
+        try:
+            with open(f'/proc/{process_id}/status', 'r') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1]) * 1024
+        except OSError:
+            continue
+    return total
+
+
+def directory_size(path: str) -> int:
+    total = 0
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                continue
+    return total
+
+
+class ResourceSampler(threading.Thread):
+    """
+    Samples the server's RSS and temp-directory size until stopped, keeping the peaks.
+    """
+
+    def __init__(self, pid: Optional[int], temp_dir: Optional[str], interval: float = SAMPLE_INTERVAL):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.temp_dir = temp_dir
+        self.interval = interval
+        self.peak_rss = 0
+        self.peak_temp_bytes = 0
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            if self.pid:
+                self.peak_rss = max(self.peak_rss, process_tree_rss(self.pid))
+            if self.temp_dir:
+                self.peak_temp_bytes = max(self.peak_temp_bytes, directory_size(self.temp_dir))
+            self.stopped.wait(self.interval)
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def start_server(port: int, temp_dir: str, workers: int, extra_env: Dict[str, str]) -> subprocess.Popen:
+    """
+    Run uvicorn on main:app with TMPDIR (and the cache and plan stores) inside temp_dir.
+    The result cache TTL is 0 unless overridden, so every request runs the pipeline.
+    """
+    env = dict(os.environ)
+    env.update({
+        'TMPDIR': temp_dir,
+        'COMPARE_CACHE_DIR': os.path.join(temp_dir, 'cache'),
+        'COMPARE_PLAN_DIR': os.path.join(temp_dir, 'plans'),
+        'COMPARE_CACHE_TTL': '0',
+    })
+    env.update(extra_env)
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'main:app', '--host', '127.0.0.1', '--port', str(port),
+         '--workers', str(workers), '--log-level', 'warning'],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"uvicorn exited with status {server.returncode}")
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            connection.request('GET', '/')
+            connection.getresponse().read()
+            connection.close()
+            return server
+        except OSError:
+            time.sleep(0.1)
+    server.terminate()
+    raise RuntimeError("uvicorn did not start within 30 seconds")
+
+
+def percentile(sorted_values: List[float], fraction: float) -> Optional[float]:
+    """
+    Nearest-rank percentile of an already sorted list.
+    """
+    if not sorted_values:
+        return None
+    rank = max(int(round(fraction * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def summarize(samples: List[Dict], elapsed: float) -> Dict:
+    """
+    Aggregate per-request samples into the report figures.
+    """
+    latencies = sorted(sample['latency'] for sample in samples if sample['ok'])
+    errors = sum(1 for sample in samples if not sample['ok'])
+    sent = sum(sample['sent'] for sample in samples if sample['ok'])
+    received = sum(sample['received'] for sample in samples if sample['ok'])
+    statuses = {}
+    for sample in samples:
+        statuses[str(sample['status'])] = statuses.get(str(sample['status']), 0) + 1
+
+    def ms(value):
+        return None if value is None else round(value * 1000, 1)
+
+    return {
+        'requests': len(samples),
+        'errors': errors,
+        'error_rate': round(errors / len(samples), 4) if samples else 0.0,
+        'status_codes': statuses,
+        'latency_ms': {
+            'p50': ms(percentile(latencies, 0.50)),
+            'p95': ms(percentile(latencies, 0.95)),
+            'p99': ms(percentile(latencies, 0.99)),
+            'max': ms(latencies[-1] if latencies else None),
+            'mean': ms(sum(latencies) / len(latencies) if latencies else None)
+        },
+        'requests_per_second': round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        'upload_mb_per_second': round(sent / elapsed / 1e6, 2) if elapsed else 0.0,
+        'download_mb_per_second': round(received / elapsed / 1e6, 2) if elapsed else 0.0
+    }
+
+
+def run_load(base_url: str, path: str, pairs: Dict[str, Tuple[bytes, bytes]], weights: List[Tuple[str, int]],
+             concurrency: int, rate: float, total_requests: Optional[int], duration: Optional[float],
+             fields: Dict[str, str], timeout: float, seed: int) -> Tuple[List[Dict], float]:
+    """
+    Replay the scenario mix and collect one sample per request.
+    Returns: (samples, wall-clock seconds)
+    """
+    rng = random.Random(seed)
+    names = [name for name, _ in weights]
+    bodies = {}
+    for name, (zip1, zip2) in pairs.items():
+        bodies[name] = multipart_body(fields, {'file1': ('zip1.zip', zip1), 'file2': ('zip2.zip', zip2)})
+
+    samples = []
+    samples_lock = threading.Lock()
+    started = time.monotonic()
+    stop_at = started + duration if duration else None
+
+    def fire(name: str, scheduled: float):
+        body, content_type = bodies[name]
+        try:
+            status, received = post(base_url, path, body, content_type, timeout)
+            ok = 200 <= status < 300
+        except (OSError, http.client.HTTPException) as e:
+            status, received, ok = type(e).__name__, 0, False
+        sample = {'scenario': name, 'status': status, 'ok': ok, 'latency': time.monotonic() - scheduled,
+                  'sent': len(body), 'received': received}
+        with samples_lock:
+            samples.append(sample)
+
+    def more(sent: int) -> bool:
+        if total_requests is not None and sent >= total_requests:
+            return False
+        return stop_at is None or time.monotonic() < stop_at
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        if rate > 0:
+            # Open loop: Poisson arrivals, queued behind busy clients
+            sent = 0
+            next_arrival = started
+            while more(sent):
+                delay = next_arrival - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                name = rng.choices(names, weights=[weight for _, weight in weights])[0]
+                pool.submit(fire, name, next_arrival)
+                sent += 1
+                next_arrival += rng.expovariate(rate)
+        else:
+            # Closed loop: each client sends back to back
+            counter = iter(range(total_requests)) if total_requests is not None else None
+            counter_lock = threading.Lock()
+
+            def client(client_seed: int):
+                client_rng = random.Random(client_seed)
+                while True:
+                    with counter_lock:
+                        if counter is not None and next(counter, None) is None:
+                            return
+                    if stop_at is not None and time.monotonic() >= stop_at:
+                        return
+                    name = client_rng.choices(names, weights=[weight for _, weight in weights])[0]
+                    fire(name, time.monotonic())
+
+            for index in range(concurrency):
+                pool.submit(client, seed + index + 1)
+    return samples, time.monotonic() - started
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Load-test the compare-zips service.")
+    parser.add_argument('--concurrency', type=int, default=4, help="Concurrent client connections")
+    parser.add_argument('--rate', type=float, default=2.0,
+                        help="Mean arrivals per second (Poisson); 0 for closed loop")
+    parser.add_argument('--requests', type=int, default=None, help="Stop after this many requests")
+    parser.add_argument('--duration', type=float, default=None, help="Stop after this many seconds")
+    parser.add_argument('--mix', default='small:3,large:1,nested:1',
+                        help=f"Weighted scenarios from: {', '.join(SCENARIOS)}")
+    parser.add_argument('--endpoint', default='/api/compare-zips',
+                        choices=['/api/compare-zips', '/api/compare-zips/stream'])
+    parser.add_argument('--compression', default='balanced')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--workers', type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument('--url', default=None,
+                        help="Target an already running server instead of starting one "
+                             "(RSS and temp-disk figures are then omitted)")
+    parser.add_argument('--env', action='append', default=[], metavar='NAME=VALUE',
+                        help="Extra environment for the server, e.g. COMPARE_CACHE_TTL=3600")
+    parser.add_argument('--timeout', type=float, default=300.0, help="Per-request timeout in seconds")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', default=None, help="Write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+    if args.requests is None and args.duration is None:
+        args.requests = 50
+
+    weights = parse_mix(args.mix)
+    pairs = {name: build_pair(SCENARIOS[name], args.seed) for name, _ in weights}
+
+    server = None
+    temp_dir = None
+    base_url = args.url
+    if not base_url:
+        temp_dir = tempfile.mkdtemp(prefix='compare-loadtest-')
+        extra_env = dict(item.split('=', 1) for item in args.env)
+        server = start_server(args.port, temp_dir, args.workers, extra_env)
+        base_url = f'http://127.0.0.1:{args.port}'
+
+    sampler = ResourceSampler(server.pid if server else None, temp_dir)
+    sampler.start()
+    try:
+        samples, elapsed = run_load(base_url, args.endpoint, pairs, weights, args.concurrency, args.rate,
+                                    args.requests, args.duration, {'compression': args.compression},
+                                    args.timeout, args.seed)
+    finally:
+        sampler.stop()
+        if server:
+            server.terminate()
+            server.wait(timeout=30)
+        if temp_dir:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    report = {
+        'config': {
+            'endpoint': args.endpoint,
+            'concurrency': args.concurrency,
+            'rate': args.rate,
+            'mix': dict(weights),
+            'compression': args.compression,
+            'workers': args.workers,
+            'seed': args.seed,
+            'pair_bytes': {name: len(zip1) + len(zip2) for name, (zip1, zip2) in pairs.items()}
+        },
+        'elapsed_seconds': round(elapsed, 2),
+        **summarize(samples, elapsed),
+        'peak_rss_bytes': sampler.peak_rss if server else None,
+        'peak_temp_disk_bytes': sampler.peak_temp_bytes if server else None,
+        'scenarios': {name: summarize([s for s in samples if s['scenario'] == name], elapsed)
+                      for name, _ in weights}
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+    return 1 if report['errors'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,15 +1,50 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+import anyio
 import zipfile
 import os
+import posixpath
+import secrets
 import tempfile
 import shutil
 import re
+import struct
 import base64
-from typing import Dict, Tuple
+import json
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 
-app = FastAPI(title="ZIP Comparison Tool")
+from fast_io import CHUNK_SIZE, MappedFile, copy_and_hash, copy_file, write_chunks
+from fuzzy_match import MAX_DISTANCE, find_near_duplicates
+from governor import (JOB_DISK_QUOTA, MAX_UNCOMPRESSED_BYTES, QUEUE_TIMEOUT, AdmissionController, JobBudget,
+                      QueueTimeout, ResourceLimitExceeded, estimate_cost)
+from job_store import JOB_WORKERS, JobStore, open_store, start_workers, stop_workers
+from manifest import (TailTooShort, iter_member_data, load_plan, member_ranges, needs_full_upload,
+                      plan_entry, read_central_directory, save_plan)
+from pdf_fingerprint import compare_fingerprints, fingerprint_pdf, newer_fingerprint, same_contents
+from profiling import PROFILE_FORMATS, PROFILE_MODES, RequestProfile, authorized, profile_file
+from progress import PUBLISH_INTERVAL, ProgressTracker, get_tracker, start_tracker, valid_job_id
+from result_cache import ResultCache, cache_key, etag_matches
+from part_store import open_part_store
+from result_parts import DEFAULT_PART_BYTES, MIN_PART_BYTES, part_filename, parts_manifest, stream_part
+from summary_export import EXPORT_FORMATS, EXPORT_SECTIONS, iter_export, write_exports
+from zip_stream import (COMPRESSION_PRESETS, CompressionPolicy, ZipStreamWriter, pack_dos_datetime,
+                        stream_zip, write_zip)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Job workers claim queued comparisons from the shared job store
+    workers = start_workers(get_job_store(), run_job, JOB_WORKERS)
+    yield
+    stop_workers(workers)
+
+
+app = FastAPI(title="ZIP Comparison Tool", lifespan=lifespan)
 
 # Enable CORS for React frontend
 app.add_middleware(
@@ -22,8 +57,33 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Cache", "X-Summary-Stats", "X-Profile-Id"],
 )
 
+# Longest a progress subscriber is kept connected
+PROGRESS_STREAM_TIMEOUT = 60 * 60
+
+# Completed results, keyed by (hash of file1, hash of file2, options)
+result_cache = ResultCache()
+
+# Object storage serving result parts (serverless deployments), or None
+part_store = open_part_store()
+
+# Shares the concurrent-bytes budget between the jobs running in this worker
+admission = AdmissionController()
+
+# Queued comparisons, shared by every process on the host using the same store.
+# Opened on first use (the lifespan, or a job request) rather than at import, so
+# the serverless handlers importing this module create no database or directories
+_job_store: Optional[JobStore] = None
+
+
+def get_job_store() -> JobStore:
+    global _job_store
+    if _job_store is None:
+        _job_store = open_store()
+    return _job_store
+
 
 def extract_username_from_pdf_name(pdf_name: str) -> str:
     """
@@ -62,7 +122,66 @@ def extract_username_from_folder_name(folder_name: str) -> str:
     return None
 
 
-def extract_nested_zips(root_dir: str, max_depth: int = 5, current_depth: int = 0):
+def member_path(extract_dir: str, filename: str) -> str:
+    """
+    Where zipfile.extract would write a member: drive letters, empty, '.' and
+    '..' components are dropped, so nothing lands outside extract_dir.
+    """
+    arcname = filename.replace('/', os.path.sep)
+    if os.path.altsep:
+        arcname = arcname.replace(os.path.altsep, os.path.sep)
+    arcname = os.path.splitdrive(arcname)[1]
+    invalid = ('', os.path.curdir, os.path.pardir)
+    arcname = os.path.sep.join(part for part in arcname.split(os.path.sep) if part not in invalid)
+    return os.path.join(extract_dir, arcname)
+
+
+def extract_members(zip_ref: zipfile.ZipFile, extract_dir: str,
+                    progress: Optional[ProgressTracker] = None,
+                    budget: Optional[JobBudget] = None):
+    """
+    Extract every member of zip_ref into extract_dir (like extractall),
+    reporting the bytes written to progress and charging them to budget.
+    Members are inflated chunk by chunk, checking the job's time limit, so
+    a single huge member cannot overrun it.
+    """
+    for info in zip_ref.infolist():
+        if budget:
+            # zipfile never writes more than the declared size, so charge it up front
+            budget.charge(info.file_size)
+        target = member_path(extract_dir, info.filename)
+        if info.is_dir():
+            os.makedirs(target, exist_ok=True)
+            continue
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with zip_ref.open(info) as source, open(target, 'wb') as dest:
+            for chunk in iter(lambda: source.read(CHUNK_SIZE), b''):
+                dest.write(chunk)
+                if budget:
+                    budget.check_time()
+        if progress:
+            progress.add(bytes_processed=info.file_size)
+
+
+def test_members(zip_ref: zipfile.ZipFile, budget: Optional[JobBudget] = None) -> Optional[str]:
+    """
+    zipfile.testzip, checking the job's time limit between chunks.
+    Returns the name of the first member with a bad CRC, or None.
+    """
+    for info in zip_ref.infolist():
+        try:
+            with zip_ref.open(info) as member:
+                while member.read(CHUNK_SIZE):
+                    if budget:
+                        budget.check_time()
+        except zipfile.BadZipFile:
+            return info.filename
+    return None
+
+
+def extract_nested_zips(root_dir: str, max_depth: int = 5, current_depth: int = 0,
+                        progress: Optional[ProgressTracker] = None,
+                        budget: Optional[JobBudget] = None):
     """
     Recursively extract nested ZIP files found in the directory.
     Prevents infinite recursion with max_depth parameter.
@@ -76,6 +195,8 @@ def extract_nested_zips(root_dir: str, max_depth: int = 5, current_depth: int =
     # Find and extract nested ZIP files
     # Use list() to avoid modifying dirs while iterating
     for root, dirs, files in list(os.walk(root_dir)):
+        if budget:
+            budget.check_time()
         for file in files:
             if file.lower().endswith('.zip'):
                 nested_zip_path = os.path.join(root, file)
@@ -89,15 +210,20 @@ def extract_nested_zips(root_dir: str, max_depth: int = 5, current_depth: int =
                     
                     # Extract nested ZIP
                     with zipfile.ZipFile(nested_zip_path, 'r') as nested_zip:
-                        nested_zip.extractall(nested_extract_dir)
+                        extract_members(nested_zip, nested_extract_dir, progress, budget)
                     
                     # Remove the original nested ZIP file to avoid confusion
                     os.remove(nested_zip_path)
                     extracted_count += 1
+                    if progress:
+                        progress.add(nested_archives=1)
                     
                     # Recursively extract any ZIPs inside the nested ZIP
-                    extracted_count += extract_nested_zips(nested_extract_dir, max_depth, current_depth + 1)
+                    extracted_count += extract_nested_zips(nested_extract_dir, max_depth, current_depth + 1,
+                                                           progress, budget)
                     
+                except ResourceLimitExceeded:
+                    raise
                 except (zipfile.BadZipFile, Exception) as e:
                     print(f"Warning: Could not extract nested ZIP {nested_zip_path}: {str(e)}")
                     continue
@@ -105,7 +231,9 @@ def extract_nested_zips(root_dir: str, max_depth: int = 5, current_depth: int =
     return extracted_count
 
 
-def process_zip1(zip_path: str, extract_dir: str) -> Tuple[Dict[str, str], Dict[str, Dict]]:
+def process_zip1(zip_path: str, extract_dir: str,
+                 progress: Optional[ProgressTracker] = None,
+                 budget: Optional[JobBudget] = None) -> Tuple[Dict[str, str], Dict[str, Dict]]:
     """
     Process ZIP File 1: Extract PDFs and map USERNAME -> PDF path.
     ZIP contains 1-2 folders, each with multiple PDFs named USERNAME_CODE.pdf
@@ -116,15 +244,17 @@ def process_zip1(zip_path: str, extract_dir: str) -> Tuple[Dict[str, str], Dict[
     file_info = {}  # username -> {folder, filename, full_path}
     
     with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-        zip_ref.extractall(extract_dir)
+        extract_members(zip_ref, extract_dir, progress, budget)
     
     # Extract any nested ZIP files
-    nested_count = extract_nested_zips(extract_dir)
+    nested_count = extract_nested_zips(extract_dir, progress=progress, budget=budget)
     if nested_count > 0:
         print(f"Extracted {nested_count} nested ZIP file(s) from ZIP 1")
     
     # Walk through extracted directory (including nested ZIP contents)
     for root, dirs, files in os.walk(extract_dir):
+        if budget:
+            budget.check_time()
         # Get relative folder path from extract_dir
         rel_path = os.path.relpath(root, extract_dir)
         folder_name = rel_path if rel_path != '.' else 'root'
@@ -137,6 +267,8 @@ def process_zip1(zip_path: str, extract_dir: str) -> Tuple[Dict[str, str], Dict[
             if file.lower().endswith('.pdf'):
                 pdf_path = os.path.join(root, file)
                 username = extract_username_from_pdf_name(file)
+                if progress:
+                    progress.add(entries_indexed=1)
                 if username:
                     # Store the PDF path for this username
                     username_to_pdf[username] = pdf_path
@@ -187,7 +319,9 @@ def rename_zip_to_pdf(root_dir: str):
     return renamed_count
 
 
-def process_zip2(zip_path: str, extract_dir: str) -> Tuple[Dict[str, str], Dict[str, Dict]]:
+def process_zip2(zip_path: str, extract_dir: str,
+                 progress: Optional[ProgressTracker] = None,
+                 budget: Optional[JobBudget] = None) -> Tuple[Dict[str, str], Dict[str, Dict]]:
     """
     Process ZIP File 2: Extract PDFs and map USERNAME -> PDF path.
     ZIP contains multiple folders named USERNAME(NUMBER) NAME, each with one PDF.
@@ -199,10 +333,10 @@ def process_zip2(zip_path: str, extract_dir: str) -> Tuple[Dict[str, str], Dict[
     file_info = {}  # username -> {folder, filename, full_path}
     
     with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-        zip_ref.extractall(extract_dir)
+        extract_members(zip_ref, extract_dir, progress, budget)
     
     # Extract any nested ZIP files
-    nested_count = extract_nested_zips(extract_dir)
+    nested_count = extract_nested_zips(extract_dir, progress=progress, budget=budget)
     if nested_count > 0:
         print(f"Extracted {nested_count} nested ZIP file(s) from ZIP 2")
     
@@ -213,6 +347,8 @@ def process_zip2(zip_path: str, extract_dir: str) -> Tuple[Dict[str, str], Dict[
     
     # Walk through extracted directory (including nested ZIP contents)
     for root, dirs, files in os.walk(extract_dir):
+        if budget:
+            budget.check_time()
         # Get relative folder path from extract_dir
         rel_path = os.path.relpath(root, extract_dir)
         # For ZIP 2, we use the folder name for username extraction
@@ -230,6 +366,8 @@ def process_zip2(zip_path: str, extract_dir: str) -> Tuple[Dict[str, str], Dict[
                 
             if file.lower().endswith('.pdf'):
                 pdf_path = os.path.join(root, file)
+                if progress:
+                    progress.add(entries_indexed=1)
                 # If we don't have a username from folder, try to get it from PDF name
                 if not username:
                     username = extract_username_from_pdf_name(file)
@@ -263,77 +401,191 @@ def process_zip2(zip_path: str, extract_dir: str) -> Tuple[Dict[str, str], Dict[
     return username_to_pdf, file_info
 
 
-def merge_pdfs(zip1_pdfs: Dict[str, str], zip2_pdfs: Dict[str, str], 
-               zip1_info: Dict[str, Dict], zip2_info: Dict[str, Dict], 
-               output_dir: str) -> Tuple[str, Dict]:
+def index_zip1_names(names: List[str]) -> Tuple[Dict[str, str], Dict[str, Dict]]:
     """
-    Merge PDFs from both ZIPs, avoiding duplicates by username.
+    Name-only counterpart of process_zip1, for archives that were not uploaded.
+    Classifies member names the way process_zip1 classifies extracted files.
+    Returns: (username -> member name dict, file_info dict)
+    """
+    username_to_member = {}
+    file_info = {}
+    
+    for name in names:
+        if name.endswith('/') or not name.lower().endswith('.pdf'):
+            continue
+        folder, file = posixpath.split(name)
+        username = extract_username_from_pdf_name(file)
+        if username:
+            username_to_member[username] = name
+            file_info[username] = {
+                'folder': folder or 'root',
+                'filename': file,
+                'source': 'ZIP File 1'
+            }
+        else:
+            print(f"Warning: Could not extract username from {file}")
+    
+    return username_to_member, file_info
+
+
+def index_zip2_names(names: List[str]) -> Tuple[Dict[str, str], Dict[str, Dict]]:
+    """
+    Name-only counterpart of process_zip2, for archives that were not uploaded.
+    Usernames come from the folder name, falling back to the PDF name.
+    Returns: (username -> member name dict, file_info dict)
+    """
+    username_to_member = {}
+    file_info = {}
+    folder_usernames = {}  # folder -> username, as process_zip2 reuses it per folder
+    
+    for name in names:
+        if name.endswith('/') or not name.lower().endswith('.pdf'):
+            continue
+        full_folder_path, file = posixpath.split(name)
+        folder_name = posixpath.basename(full_folder_path) if full_folder_path else 'root'
+        full_folder_path = full_folder_path or 'root'
+        
+        if full_folder_path not in folder_usernames:
+            folder_usernames[full_folder_path] = extract_username_from_folder_name(folder_name)
+        username = folder_usernames[full_folder_path]
+        if not username:
+            username = extract_username_from_pdf_name(file)
+            folder_usernames[full_folder_path] = username
+        
+        if not username:
+            # Same placeholder rule as process_zip2
+            username = os.path.splitext(file)[0][:20]
+            if username in username_to_member:
+                continue
+        username_to_member[username] = name
+        file_info[username] = {
+            'folder': full_folder_path,
+            'filename': file,
+            'source': 'ZIP File 2'
+        }
+    
+    return username_to_member, file_info
+
+
+def fingerprint_duplicates(zip1_pdfs: Dict[str, str], zip2_pdfs: Dict[str, str],
+                           budget: Optional[JobBudget] = None) -> Dict[str, Dict]:
+    """
+    Fingerprint both copies of every username found in both ZIPs.
+    Only the last few KB of each PDF are read (trailer /ID, /Info dates, startxref),
+    except for pairs without an /ID whose size and tail match: those are compared in full.
+    Returns: username -> {match: identical/revised/unrelated, newer: source or None}
+    """
+    matches = {}
+    for username in sorted(set(zip1_pdfs.keys()) & set(zip2_pdfs.keys())):
+        if budget:
+            budget.check_time()
+        try:
+            zip1_fingerprint = fingerprint_pdf(zip1_pdfs[username])
+            zip2_fingerprint = fingerprint_pdf(zip2_pdfs[username])
+            match = compare_fingerprints(zip1_fingerprint, zip2_fingerprint)
+            if match == 'identical' and not (zip1_fingerprint['id'] and zip2_fingerprint['id']):
+                if not same_contents(zip1_pdfs[username], zip2_pdfs[username]):
+                    match = 'unrelated'
+        except OSError as e:
+            print(f"Warning: Could not fingerprint PDFs for {username}: {str(e)}")
+            continue
+        newer = newer_fingerprint(zip1_fingerprint, zip2_fingerprint)
+        matches[username] = {
+            'match': match,
+            'newer': None if newer is None else ('ZIP File 1', 'ZIP File 2')[newer]
+        }
+    return matches
+
+
+def merge_decisions(zip1_pdfs: Dict[str, str], zip2_pdfs: Dict[str, str],
+                    zip1_info: Dict[str, Dict], zip2_info: Dict[str, Dict],
+                    matches: Optional[Dict[str, Dict]] = None,
+                    prefer_newer: bool = False) -> Iterator[Dict]:
+    """
+    Decide, username by username, which PDF goes into the merged result.
     If same username exists in both, keep only one (prefer zip1, then zip2).
-    Returns: (path to result ZIP file, summary dict with removed files info)
+    With prefer_newer, a duplicate that fingerprinting marked as a revision
+    is taken from whichever ZIP holds the newer revision.
+    Decisions are yielded as soon as they are made so the result archive
+    can be written (or streamed) while the remaining usernames are processed.
     """
-    # Create output directory for final PDFs
-    pdfs_dir = os.path.join(output_dir, "merged_pdfs")
-    os.makedirs(pdfs_dir, exist_ok=True)
+    matches = matches or {}
     
     # Collect all unique usernames
     all_usernames = set(zip1_pdfs.keys()) | set(zip2_pdfs.keys())
     
-    # Track which files were kept and removed
-    kept_files = []
-    removed_files = []
-    
-    # Copy PDFs, preferring zip1 over zip2 for duplicates
-    for username in all_usernames:
+    for username in sorted(all_usernames):
         pdf_path = None
+        kept_from = None
         source_info = None
         removed_info = None
+        match = matches.get(username, {})
+        zip2_is_newer = (prefer_newer and match.get('match') == 'revised'
+                         and match.get('newer') == 'ZIP File 2')
         
-        # Prefer zip1, fallback to zip2
-        if username in zip1_pdfs:
+        # Prefer zip1 (unless zip2 holds the newer revision), fallback to zip2
+        if username in zip1_pdfs and not zip2_is_newer:
             pdf_path = zip1_pdfs[username]
+            kept_from = 'ZIP File 1'
             source_info = zip1_info.get(username, {})
             # If also in zip2, mark zip2 as removed
             if username in zip2_pdfs:
                 removed_info = zip2_info.get(username, {})
         elif username in zip2_pdfs:
             pdf_path = zip2_pdfs[username]
+            kept_from = 'ZIP File 2'
             source_info = zip2_info.get(username, {})
+            if username in zip1_pdfs:
+                removed_info = zip1_info.get(username, {})
         
         if pdf_path:
-            # Get original filename
-            original_filename = os.path.basename(pdf_path)
-            # Create new filename: USERNAME.pdf (clean format)
-            new_filename = f"{username}.pdf"
-            dest_path = os.path.join(pdfs_dir, new_filename)
-            
-            # Copy PDF to output directory
-            shutil.copy2(pdf_path, dest_path)
-            
-            # Track kept file
-            kept_files.append({
+            yield {
                 'username': username,
-                'source': source_info.get('source', 'Unknown'),
-                'folder': source_info.get('folder', 'Unknown'),
-                'filename': source_info.get('filename', original_filename)
+                'pdf_path': pdf_path,
+                # Create new filename: USERNAME.pdf (clean format)
+                'arcname': f"{username}.pdf",
+                'kept_from': kept_from,
+                'source_info': source_info,
+                'removed_info': removed_info,
+                'match': match.get('match')
+            }
+
+
+def build_summary(decisions: List[Dict], zip1_pdfs: Dict[str, str], zip2_pdfs: Dict[str, str],
+                  zip1_info: Dict[str, Dict], zip2_info: Dict[str, Dict]) -> Dict:
+    """
+    Build the comparison summary from the merge decisions.
+    Returns: summary dict with kept, removed and duplicate files info
+    """
+    # Track which files were kept and removed
+    kept_files = []
+    removed_files = []
+    
+    for decision in decisions:
+        username = decision['username']
+        source_info = decision['source_info']
+        removed_info = decision['removed_info']
+        
+        # Track kept file
+        kept_files.append({
+            'username': username,
+            'source': source_info.get('source', 'Unknown'),
+            'folder': source_info.get('folder', 'Unknown'),
+            'filename': source_info.get('filename', os.path.basename(decision['pdf_path']))
+        })
+        
+        # Track removed file if duplicate
+        if removed_info:
+            removed_files.append({
+                'username': username,
+                'source': removed_info.get('source', 'Unknown'),
+                'folder': removed_info.get('folder', 'Unknown'),
+                'filename': removed_info.get('filename', 'Unknown'),
+                'reason': f'Duplicate - kept from {source_info.get("source", "Unknown")} instead'
             })
-            
-            # Track removed file if duplicate
-            if removed_info:
-                removed_files.append({
-                    'username': username,
-                    'source': removed_info.get('source', 'Unknown'),
-                    'folder': removed_info.get('folder', 'Unknown'),
-                    'filename': removed_info.get('filename', 'Unknown'),
-                    'reason': f'Duplicate - kept from {source_info.get("source", "Unknown")} instead'
-                })
-    
-    # Create ZIP file from merged PDFs
-    result_zip_path = os.path.join(output_dir, "result.zip")
-    with zipfile.ZipFile(result_zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-        for pdf_file in os.listdir(pdfs_dir):
-            pdf_path = os.path.join(pdfs_dir, pdf_file)
-            if os.path.isfile(pdf_path):
-                zipf.write(pdf_path, pdf_file)
+    
+    # Which ZIP each username was finally taken from
+    kept_from = {decision['username']: decision['kept_from'] for decision in decisions}
     
     # Build comprehensive file lists from both ZIPs
     zip1_all_files = []
@@ -342,34 +594,36 @@ def merge_pdfs(zip1_pdfs: Dict[str, str], zip2_pdfs: Dict[str, str],
     for username, info in zip1_info.items():
         is_duplicate = username in zip2_pdfs
         status = 'duplicate' if is_duplicate else 'unique'
-        # zip1 files are always kept (we prefer zip1 over zip2)
+        # zip1 files are kept unless zip2 holds a newer revision
         zip1_all_files.append({
             'username': username,
             'folder': info.get('folder', 'Unknown'),
             'filename': info.get('filename', 'Unknown'),
             'status': status,
-            'kept': True  # All zip1 files are kept
+            'kept': kept_from.get(username) == 'ZIP File 1'
         })
     
     for username, info in zip2_info.items():
         is_duplicate = username in zip1_pdfs
         status = 'duplicate' if is_duplicate else 'unique'
-        # zip2 files are kept only if not duplicate (if duplicate, zip1 is kept instead)
+        # zip2 files are kept only if not duplicate (or if they are the newer revision)
         zip2_all_files.append({
             'username': username,
             'folder': info.get('folder', 'Unknown'),
             'filename': info.get('filename', 'Unknown'),
             'status': status,
-            'kept': not is_duplicate  # zip2 kept only if not duplicate
+            'kept': kept_from.get(username) == 'ZIP File 2'
         })
     
     # Build duplicate pairs information
     duplicate_pairs = []
-    for username in all_usernames:
+    match_counts = {'identical': 0, 'revised': 0, 'unrelated': 0}
+    for decision in decisions:
+        username = decision['username']
         if username in zip1_pdfs and username in zip2_pdfs:
             zip1_info_item = zip1_info.get(username, {})
             zip2_info_item = zip2_info.get(username, {})
-            duplicate_pairs.append({
+            pair = {
                 'username': username,
                 'zip1_file': {
                     'folder': zip1_info_item.get('folder', 'Unknown'),
@@ -379,9 +633,13 @@ def merge_pdfs(zip1_pdfs: Dict[str, str], zip2_pdfs: Dict[str, str],
                     'folder': zip2_info_item.get('folder', 'Unknown'),
                     'filename': zip2_info_item.get('filename', 'Unknown')
                 },
-                'kept_from': 'ZIP File 1',  # Always prefer zip1
-                'removed_from': 'ZIP File 2'
-            })
+                'kept_from': decision['kept_from'],
+                'removed_from': 'ZIP File 2' if decision['kept_from'] == 'ZIP File 1' else 'ZIP File 1'
+            }
+            if decision['match']:
+                pair['match'] = decision['match']
+                match_counts[decision['match']] += 1
+            duplicate_pairs.append(pair)
     
     summary = {
         'zip1_stats': {
@@ -407,84 +665,1125 @@ def merge_pdfs(zip1_pdfs: Dict[str, str], zip2_pdfs: Dict[str, str],
             'total_duplicates': len(duplicate_pairs)
         }
     }
+    if any(decision['match'] for decision in decisions):
+        summary['fingerprint_stats'] = match_counts
     
+    return summary
+
+
+def near_duplicate_pairs(zip1_info: Dict[str, Dict], zip2_info: Dict[str, Dict],
+                         max_distance: int) -> List[Dict]:
+    """
+    Usernames that differ only by case, spacing, OCR look-alikes or up to
+    max_distance edits between ZIP 1 and ZIP 2, with the files involved.
+    Reported for review; the merge itself still matches usernames exactly.
+    """
+    # ZIP 2 folders that fail the strict USERNAME( pattern ('dab7341(1) ...',
+    # 'DAB 7341(1) ...') fall back to other names; match on the folder prefix too
+    zip2_aliases = {}
+    for username, info in zip2_info.items():
+        prefix = re.match(r'^([^()]+?)\s*\(', os.path.basename(info.get('folder', '')))
+        if prefix:
+            zip2_aliases.setdefault(prefix.group(1), username)
+    
+    pairs = find_near_duplicates(zip1_info, zip2_info, max_distance, zip2_aliases=zip2_aliases)
+    for pair in pairs:
+        zip1_info_item = zip1_info[pair['zip1_username']]
+        zip2_info_item = zip2_info[pair['zip2_username']]
+        pair['zip1_file'] = {
+            'folder': zip1_info_item.get('folder', 'Unknown'),
+            'filename': zip1_info_item.get('filename', 'Unknown')
+        }
+        pair['zip2_file'] = {
+            'folder': zip2_info_item.get('folder', 'Unknown'),
+            'filename': zip2_info_item.get('filename', 'Unknown')
+        }
+    return pairs
+
+
+def merge_pdfs(zip1_pdfs: Dict[str, str], zip2_pdfs: Dict[str, str], 
+               zip1_info: Dict[str, Dict], zip2_info: Dict[str, Dict], 
+               output_dir: str, compression: str = 'balanced',
+               matches: Optional[Dict[str, Dict]] = None,
+               prefer_newer: bool = False,
+               progress: Optional[ProgressTracker] = None,
+               budget: Optional[JobBudget] = None) -> Tuple[str, Dict]:
+    """
+    Merge PDFs from both ZIPs, avoiding duplicates by username.
+    If same username exists in both, keep only one (prefer zip1, then zip2).
+    matches (from fingerprint_duplicates) label duplicate pairs and, with
+    prefer_newer, let the newer revision win.
+    Kept PDFs are written straight into the result ZIP as each decision is made,
+    each one STORED or DEFLATED according to the compression preset.
+    Returns: (path to result ZIP file, summary dict with removed files info)
+    """
+    decisions = []
+    
+    def kept_entries():
+        for decision in merge_decisions(zip1_pdfs, zip2_pdfs, zip1_info, zip2_info,
+                                        matches, prefer_newer):
+            decisions.append(decision)
+            if budget:
+                budget.charge(os.path.getsize(decision['pdf_path']))
+            yield decision['arcname'], decision['pdf_path']
+            if progress:
+                progress.add(files_written=1, bytes_processed=os.path.getsize(decision['pdf_path']))
+    
+    # Create ZIP file from the kept PDFs
+    result_zip_path = os.path.join(output_dir, "result.zip")
+    writer = ZipStreamWriter(policy=CompressionPolicy(compression))
+    write_zip(kept_entries(), result_zip_path, writer)
+    
+    summary = build_summary(decisions, zip1_pdfs, zip2_pdfs, zip1_info, zip2_info)
+    summary['compression'] = writer.compression_stats()
     return result_zip_path, summary
 
 
+def validate_compression(compression: str):
+    """
+    Reject unknown compression presets.
+    """
+    if compression not in COMPRESSION_PRESETS:
+        presets = ', '.join(COMPRESSION_PRESETS)
+        raise HTTPException(status_code=400, detail=f"compression must be one of: {presets}")
+
+
+def validate_fuzzy_distance(fuzzy_distance: int):
+    """
+    Reject near-duplicate edit distances outside 0 (off) to MAX_DISTANCE.
+    """
+    if not 0 <= fuzzy_distance <= MAX_DISTANCE:
+        raise HTTPException(status_code=400, detail=f"fuzzy_distance must be between 0 and {MAX_DISTANCE}")
+
+
+def validate_upload_names(file1: UploadFile, file2: UploadFile):
+    """
+    Reject uploads that are not named like ZIP files.
+    """
+    if not file1.filename.lower().endswith('.zip'):
+        raise HTTPException(status_code=400, detail="File 1 must be a ZIP file")
+    
+    if not file2.filename.lower().endswith('.zip'):
+        raise HTTPException(status_code=400, detail="File 2 must be a ZIP file")
+
+
+def save_uploads(file1: UploadFile, file2: UploadFile, temp_dir: str) -> Tuple[str, str, str, str]:
+    """
+    Save both uploads into temp_dir, hashing them while they are copied.
+    Returns: (zip1_path, zip2_path, file1_hash, file2_hash)
+    """
+    zip1_path = os.path.join(temp_dir, "zip1.zip")
+    zip2_path = os.path.join(temp_dir, "zip2.zip")
+    file1_hash = copy_and_hash(file1.file, zip1_path)
+    file2_hash = copy_and_hash(file2.file, zip2_path)
+    return zip1_path, zip2_path, file1_hash, file2_hash
+
+
+def preflight(zip1_path: str, zip2_path: str) -> int:
+    """
+    Estimate a job from the central directories before anything is extracted.
+    Returns the uncompressed bytes of both archives, nested ZIPs included.
+    Archives over the limits (or that look like zip bombs) are rejected with 413.
+    """
+    total = 0
+    for index, zip_path in enumerate((zip1_path, zip2_path)):
+        try:
+            cost = estimate_cost(zip_path, max_bytes=MAX_UNCOMPRESSED_BYTES - total)
+        except zipfile.BadZipFile:
+            raise HTTPException(status_code=400, detail=f"File {index + 1} is not a valid ZIP file")
+        except ResourceLimitExceeded as e:
+            raise HTTPException(status_code=413, detail=f"File {index + 1} is too large to process: {str(e)}")
+        total += cost['uncompressed_bytes']
+    return total
+
+
+def job_budget(estimated_bytes: int) -> JobBudget:
+    # Extraction writes at most the estimate and the result ZIP at most as much again
+    return JobBudget(disk_quota=min(2 * estimated_bytes, JOB_DISK_QUOTA))
+
+
+def admit(estimated_bytes: int, progress: Optional[ProgressTracker] = None,
+          timeout: Optional[float] = QUEUE_TIMEOUT) -> JobBudget:
+    """
+    Wait for room to run a job of estimated_bytes; answer 503 if none frees up
+    within timeout seconds (None waits for as long as it takes). Blocks the
+    calling thread, so only job workers (which own theirs) use it.
+    Returns the job's disk and time budget. The caller must release the admission.
+    """
+    if progress:
+        progress.set_stage('queued')
+    try:
+        admission.acquire(estimated_bytes, timeout)
+    except QueueTimeout as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={'Retry-After': '30'})
+    return job_budget(estimated_bytes)
+
+
+async def admit_async(estimated_bytes: int, progress: Optional[ProgressTracker] = None) -> JobBudget:
+    """
+    admit() for request handlers: waits on the event loop, so a queued request
+    holds no worker thread. Answers 503 after COMPARE_QUEUE_TIMEOUT seconds.
+    """
+    if progress:
+        progress.set_stage('queued')
+    try:
+        await admission.acquire_async(estimated_bytes)
+    except QueueTimeout as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={'Retry-After': '30'})
+    return job_budget(estimated_bytes)
+
+
+def prepare_comparison(zip1_path: str, zip2_path: str, temp_dir: str,
+                       progress: Optional[ProgressTracker] = None,
+                       budget: Optional[JobBudget] = None) -> Tuple[
+        Dict[str, str], Dict[str, str], Dict[str, Dict], Dict[str, Dict]]:
+    """
+    Validate both saved uploads and extract their PDFs.
+    Returns: (zip1_pdfs, zip2_pdfs, zip1_info, zip2_info)
+    """
+    uncompressed_total = 0
+    
+    # Validate ZIP files
+    try:
+        with zipfile.ZipFile(zip1_path, 'r') as z:
+            test_members(z, budget)
+            uncompressed_total += sum(info.file_size for info in z.infolist())
+    except zipfile.BadZipFile:
+        raise HTTPException(status_code=400, detail="File 1 is not a valid ZIP file")
+    
+    try:
+        with zipfile.ZipFile(zip2_path, 'r') as z:
+            test_members(z, budget)
+            uncompressed_total += sum(info.file_size for info in z.infolist())
+    except zipfile.BadZipFile:
+        raise HTTPException(status_code=400, detail="File 2 is not a valid ZIP file")
+    
+    if progress:
+        progress.set_stage('extracting', bytes_total=uncompressed_total)
+    
+    # Extract and process ZIP files
+    zip1_extract_dir = os.path.join(temp_dir, "zip1_extract")
+    zip2_extract_dir = os.path.join(temp_dir, "zip2_extract")
+    os.makedirs(zip1_extract_dir, exist_ok=True)
+    os.makedirs(zip2_extract_dir, exist_ok=True)
+    
+    zip1_pdfs, zip1_info = process_zip1(zip1_path, zip1_extract_dir, progress, budget)
+    zip2_pdfs, zip2_info = process_zip2(zip2_path, zip2_extract_dir, progress, budget)
+    
+    if not zip1_pdfs and not zip2_pdfs:
+        raise HTTPException(status_code=400, detail="No PDF files found in either ZIP file")
+    
+    return zip1_pdfs, zip2_pdfs, zip1_info, zip2_info
+
+
+def start_merge_stage(progress: Optional[ProgressTracker], zip1_pdfs: Dict[str, str],
+                      zip2_pdfs: Dict[str, str]):
+    """
+    Enter the merge stage, extending the expected byte count by the files to write.
+    """
+    if not progress:
+        return
+    # zip1 wins most duplicates, so this is a close estimate of what gets written
+    kept_paths = {**zip2_pdfs, **zip1_pdfs}.values()
+    to_write = sum(os.path.getsize(path) for path in kept_paths)
+    progress.set_stage('merging', bytes_total=progress.counters['bytes_processed'] + to_write)
+
+
+def validate_job_id(job_id: Optional[str]):
+    """
+    Reject malformed progress job ids.
+    """
+    if job_id is not None and not valid_job_id(job_id):
+        raise HTTPException(status_code=400, detail="job_id must be 8-64 letters, digits or dashes")
+
+
+def validate_result_id(result_id: str):
+    """
+    Reject result ids that are not cache keys (they are used as directory names).
+    """
+    if not re.fullmatch(r'[0-9a-f]{64}', result_id):
+        raise HTTPException(status_code=404, detail="Result not found")
+
+
+def validate_profile_request(request: Request) -> Optional[str]:
+    """
+    Return the profiler requested with X-Profile, or None.
+    Only callers presenting the operator token may profile.
+    """
+    profile_mode = request.headers.get('x-profile')
+    if not profile_mode:
+        return None
+    if not authorized(request.headers.get('x-profile-token')):
+        raise HTTPException(status_code=403, detail="Profiling requires a valid X-Profile-Token")
+    if profile_mode not in PROFILE_MODES:
+        raise HTTPException(status_code=400, detail=f"X-Profile must be one of: {', '.join(PROFILE_MODES)}")
+    return profile_mode
+
+
+def validate_max_part_bytes(max_part_bytes: int):
+    if max_part_bytes and max_part_bytes < MIN_PART_BYTES:
+        raise HTTPException(status_code=400,
+                            detail=f"max_part_bytes must be 0 (no split) or at least {MIN_PART_BYTES}")
+
+
+def parts_response_body(result_id: str, result_zip_path: str, max_part_bytes: int) -> Dict:
+    """
+    The parts manifest of a result. Every part carries the URL to fetch it from:
+    the part store's presigned URL when one is configured, else the API's own
+    /api/results/{result_id}/parts/{index}, served from the result cache.
+    """
+    manifest = parts_manifest(result_zip_path, max_part_bytes)
+    if part_store:
+        part_store.publish(result_id, result_zip_path, manifest)
+        return manifest
+    for part in manifest['parts']:
+        part['url'] = f"/api/results/{result_id}/parts/{part['index']}?max_bytes={max_part_bytes}"
+    return manifest
+
+
+def result_response(result_id: str, result_zip_path: str, summary: Dict, cache_status: str,
+                    max_part_bytes: int = 0) -> JSONResponse:
+    """
+    Build the JSON response carrying the summary and the base64 result ZIP.
+    With max_part_bytes the ZIP is left out and the response lists the parts
+    to fetch instead, so it stays small whatever the size of the result.
+    """
+    if max_part_bytes:
+        return JSONResponse({
+            'success': True,
+            'result_id': result_id,
+            'summary': summary,
+            'parts': parts_response_body(result_id, result_zip_path, max_part_bytes),
+            'filename': 'result.zip'
+        }, headers={'ETag': f'"{result_id}"', 'X-Cache': cache_status})
+    
+    # Encode the ZIP file to base64 straight from its memory map
+    with MappedFile(result_zip_path) as zip_data:
+        zip_base64 = base64.b64encode(zip_data).decode('utf-8')
+    
+    # Return JSON response with summary and ZIP file
+    return JSONResponse({
+        'success': True,
+        'result_id': result_id,
+        'summary': summary,
+        'zip_file': zip_base64,
+        'filename': 'result.zip'
+    }, headers={'ETag': f'"{result_id}"', 'X-Cache': cache_status})
+
+
+def run_pipeline(zip1_path: str, zip2_path: str, temp_dir: str, options: Dict, budget: JobBudget,
+                 progress: Optional[ProgressTracker] = None) -> Tuple[str, Dict]:
+    """
+    Extract, fingerprint and merge an admitted job within its budget. Blocking.
+    Returns: (path to result ZIP file in temp_dir, summary dict)
+    """
+    zip1_pdfs, zip2_pdfs, zip1_info, zip2_info = prepare_comparison(zip1_path, zip2_path, temp_dir,
+                                                                    progress, budget)
+    
+    matches = None
+    if options['fingerprint']:
+        budget.check_time()
+        if progress:
+            progress.set_stage('fingerprinting')
+        matches = fingerprint_duplicates(zip1_pdfs, zip2_pdfs, budget)
+    
+    # Merge PDFs and get summary
+    budget.check_time()
+    start_merge_stage(progress, zip1_pdfs, zip2_pdfs)
+    result_zip_path, summary = merge_pdfs(zip1_pdfs, zip2_pdfs, zip1_info, zip2_info, temp_dir,
+                                          options['compression'], matches, options['prefer_newer'],
+                                          progress, budget)
+    if options.get('fuzzy_distance'):
+        budget.check_time()
+        summary['near_duplicates'] = near_duplicate_pairs(zip1_info, zip2_info, options['fuzzy_distance'])
+    return result_zip_path, summary
+
+
+def run_comparison(zip1_path: str, zip2_path: str, temp_dir: str, options: Dict,
+                   progress: Optional[ProgressTracker] = None,
+                   queue_timeout: Optional[float] = QUEUE_TIMEOUT) -> Tuple[str, Dict]:
+    """
+    Run the governed pipeline on two saved archives: pre-flight, admission,
+    extraction, fingerprinting and merge. Blocking, including the wait for admission.
+    Returns: (path to result ZIP file in temp_dir, summary dict)
+    """
+    estimated_bytes = preflight(zip1_path, zip2_path)
+    budget = admit(estimated_bytes, progress, queue_timeout)
+    try:
+        return run_pipeline(zip1_path, zip2_path, temp_dir, options, budget, progress)
+    finally:
+        admission.release(estimated_bytes)
+
+
+def run_job(job: Dict, job_dir: str):
+    """
+    Job store handler: run a queued comparison from its job directory.
+    The result ZIP and summary are written next to the uploads (and into the result cache).
+    A busy server is no reason to fail a queued job, so it waits for admission
+    without a timeout, on its own worker thread, while the heartbeat keeps its claim.
+    """
+    result_id = job['result_id']
+    cached = result_cache.get(result_id)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        if cached:
+            result_zip_path, summary = cached
+        else:
+            result_zip_path, summary = run_comparison(os.path.join(job_dir, 'zip1.zip'),
+                                                      os.path.join(job_dir, 'zip2.zip'),
+                                                      temp_dir, job['options'], queue_timeout=None)
+            result_cache.put(result_id, result_zip_path, summary)
+        # Renamed into place, so other instances never serve a partial result
+        copy_file(result_zip_path, os.path.join(job_dir, 'result.zip.tmp'))
+        os.replace(os.path.join(job_dir, 'result.zip.tmp'), os.path.join(job_dir, 'result.zip'))
+        write_exports(job_dir, summary)
+        with open(os.path.join(job_dir, 'summary.json.tmp'), 'w', encoding='utf-8') as f:
+            json.dump(summary, f)
+        os.replace(os.path.join(job_dir, 'summary.json.tmp'), os.path.join(job_dir, 'summary.json'))
+
+
+def save_comparison(file1: UploadFile, file2: UploadFile, options: Dict, temp_dir: str,
+                    progress: Optional[ProgressTracker] = None,
+                    use_cache: bool = True) -> Tuple[str, str, str, Optional[Tuple[str, Dict]]]:
+    """
+    Save both uploads into temp_dir and look their result up in the cache. Blocking.
+    Returns: (result_id, zip1_path, zip2_path, cached (result_zip_path, summary) or None)
+    """
+    if progress:
+        progress.set_stage('saving')
+    zip1_path, zip2_path, file1_hash, file2_hash = save_uploads(file1, file2, temp_dir)
+    result_id = cache_key(file1_hash, file2_hash, options)
+    cached = result_cache.get(result_id) if use_cache else None
+    return result_id, zip1_path, zip2_path, cached
+
+
+def finish_comparison(result_id: str, zip1_path: str, zip2_path: str, temp_dir: str, options: Dict,
+                      budget: JobBudget, progress: Optional[ProgressTracker],
+                      max_part_bytes: int) -> JSONResponse:
+    """
+    Run the pipeline of an admitted comparison, cache the result and build the response. Blocking.
+    """
+    result_zip_path, summary = run_pipeline(zip1_path, zip2_path, temp_dir, options, budget, progress)
+    result_cache.put(result_id, result_zip_path, summary)
+    return result_response(result_id, result_zip_path, summary, 'MISS', max_part_bytes)
+
+
+async def compare_uploads(file1: UploadFile, file2: UploadFile, options: Dict,
+                          progress: Optional[ProgressTracker],
+                          use_cache: bool = True, max_part_bytes: int = 0,
+                          profile: Optional[RequestProfile] = None) -> Response:
+    """
+    Run the whole comparison for /api/compare-zips. The blocking steps run in
+    worker threads (under profile, if given); the wait for admission does not.
+    With use_cache=False the pipeline always runs (the result is still cached).
+    """
+    def blocking(func, *args):
+        if profile:
+            return run_in_threadpool(profile.call, func, *args)
+        return run_in_threadpool(func, *args)
+    
+    # Create temporary directory for processing
+    temp_dir = tempfile.mkdtemp()
+    try:
+        result_id, zip1_path, zip2_path, cached = await blocking(save_comparison, file1, file2, options,
+                                                                 temp_dir, progress, use_cache)
+        if cached:
+            return await blocking(result_response, result_id, cached[0], cached[1], 'HIT', max_part_bytes)
+        
+        estimated_bytes = await blocking(preflight, zip1_path, zip2_path)
+        budget = await admit_async(estimated_bytes, progress)
+        try:
+            return await blocking(finish_comparison, result_id, zip1_path, zip2_path, temp_dir, options,
+                                  budget, progress, max_part_bytes)
+        finally:
+            admission.release(estimated_bytes)
+        
+    except HTTPException:
+        raise
+    except ResourceLimitExceeded as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error processing files: {str(e)}")
+    finally:
+        await run_in_threadpool(shutil.rmtree, temp_dir, True)
+
+
 @app.post("/api/compare-zips")
 async def compare_zips(
+    request: Request,
     file1: UploadFile = File(...),
-    file2: UploadFile = File(...)
+    file2: UploadFile = File(...),
+    compression: str = Form('balanced'),
+    fingerprint: bool = Form(True),
+    prefer_newer: bool = Form(False),
+    fuzzy_distance: int = Form(0),
+    max_part_bytes: int = Form(0),
+    job_id: Optional[str] = Form(None)
 ):
     """
     Upload and compare two ZIP files.
     Returns the merged result ZIP file.
+    compression selects the speed/size preset: fast, balanced or small.
+    fingerprint labels duplicate pairs as identical, revised or unrelated;
+    prefer_newer then keeps the newer revision instead of always ZIP 1.
+    fuzzy_distance (1 or 2) reports near_duplicates: usernames that differ by case,
+    spacing, OCR look-alikes or up to that many edits.
+    max_part_bytes replaces the base64 ZIP with a manifest of parts under that size,
+    each fetched from its url (for serverless response limits).
+    Identical resubmissions are answered from the result cache; the response
+    ETag identifies the result for conditional GETs on /api/results/{result_id}.
+    With a client-chosen job_id, progress is published on /api/progress/{job_id}.
+    Operators can profile the request with the X-Profile and X-Profile-Token headers.
     """
-    # Validate file types
-    if not file1.filename.lower().endswith('.zip'):
-        raise HTTPException(status_code=400, detail="File 1 must be a ZIP file")
+    validate_upload_names(file1, file2)
+    validate_compression(compression)
+    validate_fuzzy_distance(fuzzy_distance)
+    validate_max_part_bytes(max_part_bytes)
+    validate_job_id(job_id)
+    options = {'compression': compression, 'fingerprint': fingerprint, 'prefer_newer': prefer_newer,
+               'fuzzy_distance': fuzzy_distance}
+    profile_mode = validate_profile_request(request)
     
-    if not file2.filename.lower().endswith('.zip'):
-        raise HTTPException(status_code=400, detail="File 2 must be a ZIP file")
+    progress = start_tracker(job_id)
+    # A profiled request always runs the pipeline rather than hitting the cache
+    profile = RequestProfile(profile_mode) if profile_mode else None
+    try:
+        response = await compare_uploads(file1, file2, options, progress, use_cache=profile is None,
+                                         max_part_bytes=max_part_bytes, profile=profile)
+    except HTTPException as e:
+        if progress:
+            progress.finish(str(e.detail))
+        if profile:
+            e.headers = {**(e.headers or {}), 'X-Profile-Id': profile.profile_id}
+        raise
+    finally:
+        if profile:
+            await run_in_threadpool(profile.save)
+    if profile:
+        response.headers['X-Profile-Id'] = profile.profile_id
+    if progress:
+        progress.finish()
+    return response
+
+
+class CleanupStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse that runs cleanup (in a worker thread) however the
+    response ends. Starlette skips the background task when sending fails,
+    and a generator that never started never runs its finally block, so
+    neither runs if the client disconnects before the first chunk.
+    """
+
+    def __init__(self, content, cleanup: Callable[[], None], **kwargs):
+        super().__init__(content, **kwargs)
+        self.cleanup = cleanup
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            with anyio.CancelScope(shield=True):
+                await run_in_threadpool(self.cleanup)
+
+
+@app.post("/api/compare-zips/stream")
+async def compare_zips_stream(
+    file1: UploadFile = File(...),
+    file2: UploadFile = File(...),
+    compression: str = Form('balanced'),
+    fingerprint: bool = Form(True),
+    prefer_newer: bool = Form(False),
+    fuzzy_distance: int = Form(0),
+    job_id: Optional[str] = Form(None)
+):
+    """
+    Upload and compare two ZIP files, streaming the merged result ZIP.
+    Preflight, extraction, fingerprinting and every username decision happen
+    before the first byte is sent, as the summary counts go out in the
+    X-Summary-Stats header. Only writing the kept entries (reading,
+    compressing, sending) overlaps with the download, so no result.zip has to
+    be finished first.
+    """
+    validate_upload_names(file1, file2)
+    validate_compression(compression)
+    validate_fuzzy_distance(fuzzy_distance)
+    validate_job_id(job_id)
+    options = {'compression': compression, 'fingerprint': fingerprint, 'prefer_newer': prefer_newer,
+               'fuzzy_distance': fuzzy_distance}
+    progress = start_tracker(job_id)
     
-    # Create temporary directory for processing
-    with tempfile.TemporaryDirectory() as temp_dir:
+    # The temporary directory must outlive this function: it is removed
+    # once the response is over, whether or not it was fully streamed.
+    temp_dir = tempfile.mkdtemp()
+    admitted = []
+    
+    def release():
+        # Idempotent: runs when the stream ends and again once the response is over
+        while admitted:
+            admission.release(admitted.pop())
+        shutil.rmtree(temp_dir, ignore_errors=True)
+    
+    def cleanup():
+        release()
+        # The stream never started if the client left before the first chunk
+        if progress and progress.stage not in ('done', 'failed'):
+            progress.finish("Download cancelled")
+    
+    def prepare(zip1_path: str, zip2_path: str, budget: JobBudget) -> Tuple[List[Dict], Dict]:
+        zip1_pdfs, zip2_pdfs, zip1_info, zip2_info = prepare_comparison(zip1_path, zip2_path, temp_dir,
+                                                                        progress, budget)
+        
+        matches = None
+        if fingerprint:
+            budget.check_time()
+            if progress:
+                progress.set_stage('fingerprinting')
+            matches = fingerprint_duplicates(zip1_pdfs, zip2_pdfs, budget)
+        
+        # Decisions only depend on usernames (and trailer fingerprints),
+        # so the counts are known up front
+        budget.check_time()
+        decisions = list(merge_decisions(zip1_pdfs, zip2_pdfs, zip1_info, zip2_info,
+                                         matches, prefer_newer))
+        summary = build_summary(decisions, zip1_pdfs, zip2_pdfs, zip1_info, zip2_info)
+        if fuzzy_distance:
+            summary['near_duplicates'] = near_duplicate_pairs(zip1_info, zip2_info, fuzzy_distance)
+        start_merge_stage(progress, zip1_pdfs, zip2_pdfs)
+        return decisions, summary
+    
+    try:
+        result_id, zip1_path, zip2_path, cached = await run_in_threadpool(save_comparison, file1, file2,
+                                                                          options, temp_dir, progress)
+        if cached:
+            # Served from the cache directory, so the uploads are no longer needed
+            release()
+            if progress:
+                progress.finish()
+            return FileResponse(cached[0], media_type='application/zip', filename='result.zip',
+                                headers={
+                                    'ETag': f'"{result_id}"',
+                                    'X-Cache': 'HIT',
+                                    'X-Summary-Stats': json.dumps(cached[1]['summary_stats'])
+                                })
+        
+        estimated_bytes = await run_in_threadpool(preflight, zip1_path, zip2_path)
+        budget = await admit_async(estimated_bytes, progress)
+        admitted.append(estimated_bytes)
+        decisions, summary = await run_in_threadpool(prepare, zip1_path, zip2_path, budget)
+    except Exception as e:
+        release()
+        if isinstance(e, ResourceLimitExceeded):
+            e = HTTPException(status_code=413, detail=str(e))
+        elif not isinstance(e, HTTPException):
+            e = HTTPException(status_code=500, detail=f"Error processing files: {str(e)}")
+        if progress:
+            progress.finish(str(e.detail))
+        raise e
+    
+    def kept_entries():
+        for decision in decisions:
+            budget.charge(os.path.getsize(decision['pdf_path']))
+            yield decision['arcname'], decision['pdf_path']
+            if progress:
+                progress.add(files_written=1, bytes_processed=os.path.getsize(decision['pdf_path']))
+    
+    writer = ZipStreamWriter(policy=CompressionPolicy(compression))
+    
+    def stream_and_cache():
+        # Keep a copy of the streamed archive so the result can be cached
+        # once the last byte has been sent
+        result_zip_path = os.path.join(temp_dir, "result.zip")
         try:
-            # Save uploaded files
-            zip1_path = os.path.join(temp_dir, "zip1.zip")
-            zip2_path = os.path.join(temp_dir, "zip2.zip")
-            
-            with open(zip1_path, 'wb') as f:
-                shutil.copyfileobj(file1.file, f)
-            
-            with open(zip2_path, 'wb') as f:
-                shutil.copyfileobj(file2.file, f)
-            
-            # Validate ZIP files
-            try:
-                with zipfile.ZipFile(zip1_path, 'r') as z:
-                    z.testzip()
-            except zipfile.BadZipFile:
-                raise HTTPException(status_code=400, detail="File 1 is not a valid ZIP file")
-            
-            try:
-                with zipfile.ZipFile(zip2_path, 'r') as z:
-                    z.testzip()
-            except zipfile.BadZipFile:
-                raise HTTPException(status_code=400, detail="File 2 is not a valid ZIP file")
-            
-            # Extract and process ZIP files
-            zip1_extract_dir = os.path.join(temp_dir, "zip1_extract")
-            zip2_extract_dir = os.path.join(temp_dir, "zip2_extract")
-            os.makedirs(zip1_extract_dir, exist_ok=True)
-            os.makedirs(zip2_extract_dir, exist_ok=True)
-            
-            zip1_pdfs, zip1_info = process_zip1(zip1_path, zip1_extract_dir)
-            zip2_pdfs, zip2_info = process_zip2(zip2_path, zip2_extract_dir)
-            
-            if not zip1_pdfs and not zip2_pdfs:
-                raise HTTPException(status_code=400, detail="No PDF files found in either ZIP file")
-            
-            # Merge PDFs and get summary
-            result_zip_path, summary = merge_pdfs(zip1_pdfs, zip2_pdfs, zip1_info, zip2_info, temp_dir)
-            
-            # Read ZIP file and encode to base64
-            with open(result_zip_path, 'rb') as f:
-                zip_data = f.read()
-                zip_base64 = base64.b64encode(zip_data).decode('utf-8')
-            
-            # Return JSON response with summary and ZIP file
-            return JSONResponse({
-                'success': True,
-                'summary': summary,
-                'zip_file': zip_base64,
-                'filename': 'result.zip'
-            })
-            
-        except HTTPException:
+            with open(result_zip_path, 'wb') as f:
+                for chunk in stream_zip(kept_entries(), writer):
+                    f.write(chunk)
+                    yield chunk
+            summary['compression'] = writer.compression_stats()
+            result_cache.put(result_id, result_zip_path, summary)
+        except GeneratorExit:
+            if progress:
+                progress.finish("Download cancelled")
             raise
         except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Error processing files: {str(e)}")
+            # Headers are already sent, so subscribers are the only ones told why the stream broke
+            if progress:
+                progress.finish(str(e) if isinstance(e, ResourceLimitExceeded)
+                                else f"Error processing files: {str(e)}")
+            raise
+        finally:
+            release()
+        if progress:
+            progress.finish()
+    
+    return CleanupStreamingResponse(
+        stream_and_cache(),
+        cleanup=cleanup,
+        media_type='application/zip',
+        headers={
+            'Content-Disposition': 'attachment; filename="result.zip"',
+            'ETag': f'"{result_id}"',
+            'X-Cache': 'MISS',
+            'X-Summary-Stats': json.dumps(summary['summary_stats'])
+        }
+    )
+
+
+def read_upload(upload: UploadFile) -> bytes:
+    """
+    Read a (small) uploaded part, such as an archive tail, into memory.
+    """
+    upload.file.seek(0)
+    return upload.file.read()
+
+
+def upload_size(upload: UploadFile) -> int:
+    """
+    Size in bytes of an uploaded part.
+    """
+    upload.file.seek(0, os.SEEK_END)
+    size = upload.file.tell()
+    upload.file.seek(0)
+    return size
+
+
+def validate_plan_options(compression: Optional[str], fingerprint: bool, prefer_newer: bool):
+    """
+    Reject options a manifest-first comparison cannot honor: members are copied
+    into the result as-is (no recompression), and only the kept copy of a
+    duplicate is ever uploaded, so there is nothing to fingerprint.
+    """
+    unsupported = [name for name, value in (('compression', compression), ('fingerprint', fingerprint),
+                                            ('prefer_newer', prefer_newer)) if value]
+    if unsupported:
+        raise HTTPException(status_code=400,
+                            detail=f"{', '.join(unsupported)} not supported by manifest-first comparisons; "
+                                   f"use /api/compare-zips")
+
+
+def build_plan(file1_tail: UploadFile, file1_size: int, file2_tail: UploadFile, file2_size: int,
+               fuzzy_distance: int, max_part_bytes: int = 0) -> Dict:
+    """
+    Parse both central directories, run the merge decisions on the member names
+    and save the plan (with the max_part_bytes phase 2 splits the result by).
+    Blocking; called in a worker thread.
+    Returns the response body for /api/compare-zips/plan.
+    """
+    tails = [read_upload(file1_tail), read_upload(file2_tail)]
+    sizes = [file1_size, file2_size]
+    directories = []
+    required = {}
+    for index in range(2):
+        try:
+            directories.append(read_central_directory(tails[index], sizes[index]))
+        except TailTooShort as e:
+            required[f'file{index + 1}_tail_bytes'] = e.required_bytes
+        except (zipfile.BadZipFile, ValueError, struct.error):
+            raise HTTPException(status_code=400, detail=f"File {index + 1} is not a valid ZIP file")
+    if required:
+        return {'mode': 'need_more', **required}
+    
+    (zip1_infos, zip1_cd_offset), (zip2_infos, zip2_cd_offset) = directories
+    if needs_full_upload(zip1_infos) or needs_full_upload(zip2_infos):
+        return {'mode': 'full'}
+    
+    zip1_members, zip1_info = index_zip1_names([info.filename for info in zip1_infos])
+    zip2_members, zip2_info = index_zip2_names([info.filename for info in zip2_infos])
+    if not zip1_members and not zip2_members:
+        raise HTTPException(status_code=400, detail="No PDF files found in either ZIP file")
+    
+    decisions = list(merge_decisions(zip1_members, zip2_members, zip1_info, zip2_info))
+    summary = build_summary(decisions, zip1_members, zip2_members, zip1_info, zip2_info)
+    if fuzzy_distance:
+        summary['near_duplicates'] = near_duplicate_pairs(zip1_info, zip2_info, fuzzy_distance)
+    
+    infos = [{info.filename: info for info in zip1_infos}, {info.filename: info for info in zip2_infos}]
+    ranges = [member_ranges(zip1_infos, zip1_cd_offset), member_ranges(zip2_infos, zip2_cd_offset)]
+    entries = []
+    for decision in decisions:
+        source = 0 if decision['kept_from'] == 'ZIP File 1' else 1
+        member = decision['pdf_path']
+        entry = plan_entry(infos[source][member], ranges[source][member], decision['arcname'])
+        entry['source'] = source
+        entries.append(entry)
+    
+    # The client uploads each archive's ranges back to back, in offset order
+    upload_ranges = [sorted(entry['range'] for entry in entries if entry['source'] == source)
+                     for source in range(2)]
+    upload_bytes = sum(end - start for source_ranges in upload_ranges for start, end in source_ranges)
+    
+    plan_id = secrets.token_hex(32)
+    save_plan(plan_id, {
+        'entries': entries,
+        'upload_ranges': upload_ranges,
+        'summary': summary,
+        'upload_bytes': upload_bytes,
+        'full_bytes': file1_size + file2_size,
+        'max_part_bytes': max_part_bytes
+    })
+    return {
+        'mode': 'ranges',
+        'plan_id': plan_id,
+        'file1_ranges': upload_ranges[0],
+        'file2_ranges': upload_ranges[1],
+        'upload_bytes': upload_bytes,
+        'full_bytes': file1_size + file2_size,
+        'summary_stats': summary['summary_stats']
+    }
+
+
+@app.post("/api/compare-zips/plan")
+async def plan_comparison(
+    file1_tail: UploadFile = File(...),
+    file1_size: int = Form(...),
+    file2_tail: UploadFile = File(...),
+    file2_size: int = Form(...),
+    fuzzy_distance: int = Form(0),
+    max_part_bytes: int = Form(0),
+    compression: Optional[str] = Form(None),
+    fingerprint: bool = Form(False),
+    prefer_newer: bool = Form(False)
+):
+    """
+    Phase 1 of a manifest-first comparison.
+    Receives only the tail of each archive (its central directory), classifies
+    the member names and returns the byte ranges of the members the merged
+    result needs. Responds with mode 'need_more' and the tail sizes to send if
+    a tail is too short, or mode 'full' if the archives need a full upload.
+    max_part_bytes makes phase 2 answer with a parts manifest, as in /api/compare-zips.
+    compression, fingerprint and prefer_newer are rejected with 400: they
+    need the full archives (/api/compare-zips).
+    """
+    validate_fuzzy_distance(fuzzy_distance)
+    validate_max_part_bytes(max_part_bytes)
+    validate_plan_options(compression, fingerprint, prefer_newer)
+    body = await run_in_threadpool(build_plan, file1_tail, file1_size, file2_tail, file2_size, fuzzy_distance,
+                                   max_part_bytes)
+    return JSONResponse(body)
+
+
+def complete_plan(plan_id: str, file1_ranges: UploadFile, file2_ranges: UploadFile) -> JSONResponse:
+    """
+    Build the result ZIP of a saved plan from the uploaded member ranges.
+    Blocking; called in a worker thread.
+    """
+    try:
+        plan = load_plan(plan_id)
+    except (OSError, ValueError):
+        raise HTTPException(status_code=404, detail="Plan not found or expired")
+    
+    blobs = [file1_ranges.file, file2_ranges.file]
+    blob_offsets = [{}, {}]
+    for source in range(2):
+        position = 0
+        for start, end in plan['upload_ranges'][source]:
+            blob_offsets[source][start] = position
+            position += end - start
+        if upload_size([file1_ranges, file2_ranges][source]) != position:
+            raise HTTPException(status_code=400,
+                                detail=f"File {source + 1} ranges must total {position} bytes")
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        try:
+            writer = ZipStreamWriter()
+            result_zip_path = os.path.join(temp_dir, "result.zip")
+            with open(result_zip_path, 'wb') as f:
+                for entry in plan['entries']:
+                    source = entry['source']
+                    # Spooled uploads on disk are copied into the result kernel-side
+                    chunks = iter_member_data(blobs[source], blob_offsets[source][entry['range'][0]], entry,
+                                              ranges=True)
+                    write_chunks(f, writer.add_raw(entry['arcname'], entry['compress_type'], entry['crc'],
+                                                   entry['compress_size'], entry['file_size'],
+                                                   pack_dos_datetime(entry['date_time']), chunks))
+                write_chunks(f, writer.finish())
+        except (zipfile.BadZipFile, ValueError) as e:
+            raise HTTPException(status_code=400, detail=f"Invalid member ranges: {str(e)}")
+        
+        summary = plan['summary']
+        summary['compression'] = writer.compression_stats()
+        summary['manifest'] = {
+            'upload_bytes': plan['upload_bytes'],
+            'full_bytes': plan['full_bytes']
+        }
+        result_cache.put(plan_id, result_zip_path, summary)
+        return result_response(plan_id, result_zip_path, summary, 'MISS', plan.get('max_part_bytes', 0))
+
+
+@app.post("/api/compare-zips/plan/{plan_id}")
+async def complete_planned_comparison(
+    plan_id: str,
+    file1_ranges: UploadFile = File(...),
+    file2_ranges: UploadFile = File(...)
+):
+    """
+    Phase 2 of a manifest-first comparison.
+    Receives the member ranges requested by the plan (each archive's ranges
+    concatenated in the order given) and builds the merged result ZIP by
+    copying the compressed member data as-is.
+    Returns the same JSON as /api/compare-zips (a parts manifest if the plan
+    was made with max_part_bytes).
+    """
+    validate_result_id(plan_id)
+    return await run_in_threadpool(complete_plan, plan_id, file1_ranges, file2_ranges)
+
+
+def submit_job(file1: UploadFile, file2: UploadFile, options: Dict) -> str:
+    """
+    Save both uploads into a new job directory and queue the job. Blocking.
+    Returns the job id.
+    """
+    job_store = get_job_store()
+    job_store.cleanup()
+    job_id = job_store.create(options)
+    try:
+        _, _, file1_hash, file2_hash = save_uploads(file1, file2, job_store.job_dir(job_id))
+    except Exception as e:
+        job_store.fail(job_id, None, f"Upload failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error saving files: {str(e)}")
+    job_store.enqueue(job_id, cache_key(file1_hash, file2_hash, options))
+    return job_id
+
+
+def get_job_or_404(job_id: str) -> Dict:
+    if not re.fullmatch(r'[0-9a-f]{32}', job_id):
+        raise HTTPException(status_code=404, detail="Job not found")
+    job = get_job_store().get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@app.post("/api/jobs", status_code=202)
+async def create_job(
+    file1: UploadFile = File(...),
+    file2: UploadFile = File(...),
+    compression: str = Form('balanced'),
+    fingerprint: bool = Form(True),
+    prefer_newer: bool = Form(False),
+    fuzzy_distance: int = Form(0)
+):
+    """
+    Queue a comparison for the job workers instead of running it in the request.
+    Takes the same fields as /api/compare-zips. Poll /api/jobs/{job_id} for its
+    state, then download /api/jobs/{job_id}/result; any instance sharing the
+    job store can answer both.
+    """
+    validate_upload_names(file1, file2)
+    validate_compression(compression)
+    validate_fuzzy_distance(fuzzy_distance)
+    options = {'compression': compression, 'fingerprint': fingerprint, 'prefer_newer': prefer_newer,
+               'fuzzy_distance': fuzzy_distance}
+    job_id = await run_in_threadpool(submit_job, file1, file2, options)
+    return JSONResponse({
+        'job_id': job_id,
+        'state': 'queued',
+        'status_url': f"/api/jobs/{job_id}",
+        'result_url': f"/api/jobs/{job_id}/result"
+    }, status_code=202)
+
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    """
+    State of a queued comparison; includes the summary once it is done.
+    """
+    job = get_job_or_404(job_id)
+    status = {
+        'job_id': job['id'],
+        'state': job['state'],
+        'attempts': job['attempts'],
+        'created': job['created'],
+        'updated': job['updated'],
+        'error': job['error'],
+        'result_id': job['result_id'] if job['state'] == 'done' else None
+    }
+    if job['state'] == 'done':
+        with open(os.path.join(get_job_store().job_dir(job_id), 'summary.json'), 'r', encoding='utf-8') as f:
+            status['summary'] = json.load(f)
+    return status
+
+
+@app.get("/api/jobs/{job_id}/result")
+async def download_job_result(job_id: str):
+    """
+    Download the result ZIP of a finished job.
+    """
+    job = get_job_or_404(job_id)
+    if job['state'] == 'failed':
+        raise HTTPException(status_code=409, detail=f"Job failed: {job['error']}")
+    if job['state'] != 'done':
+        raise HTTPException(status_code=409, detail=f"Job is {job['state']}", headers={'Retry-After': '5'})
+    result_zip_path = os.path.join(get_job_store().job_dir(job_id), 'result.zip')
+    return FileResponse(result_zip_path, media_type='application/zip', filename='result.zip',
+                        headers={'ETag': f'"{job["result_id"]}"'})
+
+
+def export_response(directory: str, section: str, fmt: str) -> StreamingResponse:
+    """
+    Stream one summary section of a stored result as NDJSON or CSV.
+    """
+    media_type, extension = EXPORT_FORMATS[fmt]
+    return StreamingResponse(iter_export(directory, section, fmt), media_type=media_type,
+                             headers={'Content-Disposition': f'attachment; filename="{section}.{extension}"'})
+
+
+def validate_export(section: str, fmt: str):
+    if section not in EXPORT_SECTIONS:
+        raise HTTPException(status_code=404,
+                            detail=f"Unknown export; use one of: {', '.join(EXPORT_SECTIONS)}")
+    if fmt not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(EXPORT_FORMATS)}")
+
+
+@app.get("/api/jobs/{job_id}/export/{section}")
+async def export_job_summary(job_id: str, section: str, format: str = 'ndjson'):
+    """
+    Stream zip1_files, zip2_files, duplicate_pairs or final_merged of a finished job
+    as NDJSON or CSV, one row per file (409 until the job is done).
+    """
+    validate_export(section, format)
+    job = get_job_or_404(job_id)
+    if job['state'] != 'done':
+        raise HTTPException(status_code=409, detail=f"Job is {job['state']}")
+    return export_response(get_job_store().job_dir(job_id), section, format)
+
+
+@app.get("/api/progress/{job_id}")
+async def progress_events(job_id: str, request: Request):
+    """
+    Stream a job's progress as server-sent events.
+    Each event carries the per-stage counters (entries indexed, nested archives
+    opened, files written, bytes processed), the current stage and an ETA.
+    The stream ends once the job is done or has failed.
+    """
+    if not valid_job_id(job_id):
+        raise HTTPException(status_code=400, detail="job_id must be 8-64 letters, digits or dashes")
+    tracker = get_tracker(job_id)
+    
+    async def events():
+        version = None
+        deadline = time.monotonic() + PROGRESS_STREAM_TIMEOUT
+        while time.monotonic() < deadline and not await request.is_disconnected():
+            if tracker.version != version:
+                version = tracker.version
+                snapshot = tracker.snapshot
+                yield f"data: {json.dumps(snapshot)}\n\n"
+                if snapshot['stage'] in ('done', 'failed'):
+                    break
+            if tracker.evicted:
+                # Nothing started the job in time; a reconnecting client gets a fresh tracker
+                break
+            await asyncio.sleep(PUBLISH_INTERVAL)
+    
+    return StreamingResponse(events(), media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@app.get("/api/results/{result_id}")
+async def get_result(result_id: str, request: Request):
+    """
+    Fetch a cached comparison result (summary and base64 ZIP) by its ETag.
+    Supports conditional GET with If-None-Match.
+    """
+    validate_result_id(result_id)
+    if etag_matches(request.headers.get('if-none-match'), result_id):
+        return Response(status_code=304, headers={'ETag': f'"{result_id}"'})
+    cached = await run_in_threadpool(result_cache.get, result_id)
+    if not cached:
+        raise HTTPException(status_code=404, detail="Result not found")
+    # Base64-encoding a large result would block the event loop
+    return await run_in_threadpool(result_response, result_id, cached[0], cached[1], 'HIT')
+
+
+@app.get("/api/results/{result_id}/download")
+async def download_result(result_id: str, request: Request):
+    """
+    Download a cached result ZIP by its ETag.
+    Supports conditional GET with If-None-Match.
+    """
+    validate_result_id(result_id)
+    if etag_matches(request.headers.get('if-none-match'), result_id):
+        return Response(status_code=304, headers={'ETag': f'"{result_id}"'})
+    cached = result_cache.get(result_id)
+    if not cached:
+        raise HTTPException(status_code=404, detail="Result not found")
+    return FileResponse(cached[0], media_type='application/zip', filename='result.zip',
+                        headers={'ETag': f'"{result_id}"'})
+
+
+def cached_result_or_404(result_id: str) -> Tuple[str, Dict]:
+    validate_result_id(result_id)
+    cached = result_cache.get(result_id)
+    if not cached:
+        raise HTTPException(status_code=404, detail="Result not found")
+    return cached
+
+
+@app.get("/api/results/{result_id}/parts")
+async def get_result_parts(result_id: str, max_bytes: int = DEFAULT_PART_BYTES):
+    """
+    Manifest of a cached result split into ZIP parts of at most max_bytes each:
+    {max_part_bytes, total_parts, total_files, parts: [{index, files, bytes, first, last, oversized, url}]}.
+    """
+    validate_max_part_bytes(max_bytes)
+    result_zip_path, _ = cached_result_or_404(result_id)
+    return await run_in_threadpool(parts_response_body, result_id, result_zip_path, max_bytes)
+
+
+@app.get("/api/results/{result_id}/parts/{index}")
+async def download_result_part(result_id: str, index: int, max_bytes: int = DEFAULT_PART_BYTES):
+    """
+    Download one part of a cached result as a standalone ZIP.
+    The same max_bytes always yields the same parts, so they can be fetched one by one.
+    """
+    validate_max_part_bytes(max_bytes)
+    result_zip_path, _ = cached_result_or_404(result_id)
+    manifest = await run_in_threadpool(parts_manifest, result_zip_path, max_bytes)
+    if not 0 <= index < manifest['total_parts']:
+        raise HTTPException(status_code=404, detail="Part not found")
+    filename = part_filename(index, manifest['total_parts'])
+    return StreamingResponse(stream_part(result_zip_path, max_bytes, index), media_type='application/zip',
+                             headers={'Content-Disposition': f'attachment; filename="{filename}"',
+                                      'Content-Length': str(manifest['parts'][index]['bytes']),
+                                      'ETag': f'"{result_id}-{max_bytes}-{index}"'})
+
+
+@app.get("/api/results/{result_id}/export/{section}")
+async def export_result_summary(result_id: str, section: str, format: str = 'ndjson'):
+    """
+    Stream zip1_files, zip2_files, duplicate_pairs or final_merged of a cached result
+    as NDJSON or CSV, one row per file, without loading the summary.
+    """
+    validate_export(section, format)
+    validate_result_id(result_id)
+    entry_dir = result_cache.locate(result_id)
+    if not entry_dir:
+        raise HTTPException(status_code=404, detail="Result not found")
+    return export_response(entry_dir, section, format)
+
+
+@app.get("/api/profiles/{profile_id}")
+async def download_profile(profile_id: str, request: Request, format: str = 'text'):
+    """
+    Download a stored request profile (operators only).
+    format: pstats or text for cprofile runs, collapsed or text for sampling runs.
+    """
+    if not authorized(request.headers.get('x-profile-token')):
+        raise HTTPException(status_code=403, detail="Profiles require a valid X-Profile-Token")
+    if format not in PROFILE_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(PROFILE_FORMATS)}")
+    artifact = profile_file(profile_id, format)
+    if not artifact:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(artifact['path'], media_type=artifact['media_type'], filename=artifact['filename'])
+
+
+@app.get("/api/status")
+async def get_status():
+    """
+    Load of this process: jobs running and waiting for admission, and the
+    estimated bytes they hold against COMPARE_MAX_CONCURRENT_BYTES.
+    """
+    return {'admission': admission.stats()}
 
 
 @app.get("/")
@@ -0,0 +1,248 @@
+"""
+Manifest-first comparison.
+
+Instead of uploading both archives in full, the client first sends only the
+tail of each archive (the central directory and end-of-central-directory
+record). The server classifies the member names, runs the usual merge
+decisions on them and answers with a plan: the byte ranges of the members
+that end up in the result. The client then uploads just those ranges, and the
+server copies the compressed member data into the result ZIP as-is.
+
+Archives whose contents cannot be classified by name alone (nested ZIPs, or
+ZIP 2 files that may be misnamed PDFs) fall back to a full upload.
+"""
+import io
+import json
+import os
+import struct
+import tempfile
+import time
+import zipfile
+from typing import BinaryIO, Dict, Iterator, List, Tuple, Union
+
+from fast_io import FileRange, source_fileno
+
+PLAN_DIR = os.environ.get('COMPARE_PLAN_DIR',
+                          os.path.join(tempfile.gettempdir(), 'compare-zips-plans'))
+PLAN_TTL = int(os.environ.get('COMPARE_PLAN_TTL', 3600))
+
+# Enough to hold the end-of-central-directory record with a maximal comment
+# plus a typical central directory; larger directories are requested on demand
+DEFAULT_TAIL_SIZE = 64 * 1024 + 22
+CHUNK_SIZE = 1024 * 1024
+
+END_SIGNATURE = b'PK\x05\x06'
+ZIP64_LOCATOR_SIGNATURE = b'PK\x06\x07'
+LOCAL_HEADER_SIGNATURE = b'PK\x03\x04'
+END_RECORD_SIZE = 22
+ZIP64_LOCATOR_SIZE = 20
+LOCAL_HEADER_SIZE = 30
+
+
+class TailTooShort(Exception):
+    """
+    Raised when the uploaded tail does not contain the whole central directory.
+    required_bytes is the tail length that would.
+    """
+
+    def __init__(self, required_bytes: int):
+        super().__init__(f"Tail must include the last {required_bytes} bytes of the archive")
+        self.required_bytes = required_bytes
+
+
+class TailFile(io.RawIOBase):
+    """
+    Read-only file of archive_size bytes of which only the tail is known.
+    Lets zipfile parse the central directory at its real offsets; reads
+    before the tail (which zipfile never needs for the directory) return zeros.
+    """
+
+    def __init__(self, tail: bytes, archive_size: int):
+        self.tail = tail
+        self.size = archive_size
+        self.tail_start = archive_size - len(tail)
+        self.position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.position
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        if whence == os.SEEK_CUR:
+            offset += self.position
+        elif whence == os.SEEK_END:
+            offset += self.size
+        self.position = max(offset, 0)
+        return self.position
+
+    def readinto(self, buffer) -> int:
+        end = min(self.position + len(buffer), self.size)
+        if end <= self.position:
+            return 0
+        start = self.position
+        data = b''
+        if start < self.tail_start:
+            data = bytes(min(end, self.tail_start) - start)
+            start += len(data)
+        data += self.tail[start - self.tail_start:end - self.tail_start]
+        buffer[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+
+def central_directory_offset(tail: bytes, archive_size: int) -> int:
+    """
+    Locate the central directory from the end-of-central-directory record.
+    Returns its absolute offset in the archive.
+    Raises TailTooShort if the tail does not reach back far enough.
+    """
+    end_pos = tail.rfind(END_SIGNATURE)
+    if end_pos < 0 or len(tail) - end_pos < END_RECORD_SIZE:
+        if len(tail) < archive_size:
+            raise TailTooShort(min(archive_size, len(tail) + DEFAULT_TAIL_SIZE))
+        raise zipfile.BadZipFile("End of central directory record not found")
+    cd_offset = struct.unpack('<I', tail[end_pos + 16:end_pos + 20])[0]
+
+    if cd_offset == 0xFFFFFFFF:
+        locator_pos = end_pos - ZIP64_LOCATOR_SIZE
+        if locator_pos < 0:
+            raise TailTooShort(min(archive_size, len(tail) + ZIP64_LOCATOR_SIZE))
+        if tail[locator_pos:locator_pos + 4] != ZIP64_LOCATOR_SIGNATURE:
+            raise zipfile.BadZipFile("ZIP64 end of central directory locator not found")
+        zip64_end_offset = struct.unpack('<Q', tail[locator_pos + 8:locator_pos + 16])[0]
+        zip64_end_pos = zip64_end_offset - (archive_size - len(tail))
+        if zip64_end_pos < 0:
+            raise TailTooShort(archive_size - zip64_end_offset)
+        cd_offset = struct.unpack('<Q', tail[zip64_end_pos + 48:zip64_end_pos + 56])[0]
+
+    if cd_offset < archive_size - len(tail):
+        raise TailTooShort(archive_size - cd_offset)
+    return cd_offset
+
+
+def read_central_directory(tail: bytes, archive_size: int) -> Tuple[List[zipfile.ZipInfo], int]:
+    """
+    Parse the central directory contained in the tail of an archive.
+    Returns: (infolist, central directory offset)
+    """
+    cd_offset = central_directory_offset(tail, archive_size)
+    with zipfile.ZipFile(TailFile(tail, archive_size), 'r') as zf:
+        infos = zf.infolist()
+    return infos, cd_offset
+
+
+def member_ranges(infos: List[zipfile.ZipInfo], cd_offset: int) -> Dict[str, Tuple[int, int]]:
+    """
+    Compute the byte range [start, end) of every member: its local header,
+    data and data descriptor, up to the next member or the central directory.
+    """
+    ordered = sorted(infos, key=lambda info: info.header_offset)
+    ranges = {}
+    for index, info in enumerate(ordered):
+        end = ordered[index + 1].header_offset if index + 1 < len(ordered) else cd_offset
+        ranges[info.filename] = (info.header_offset, end)
+    return ranges
+
+
+def needs_full_upload(infos: List[zipfile.ZipInfo]) -> bool:
+    """
+    True if some member can only be handled after a full upload: nested ZIPs
+    are unpacked and misnamed ZIPs renamed to PDFs, and encrypted members
+    (flag bit 0) cannot be copied raw, as their bytes are only valid with the
+    encryption flag and header they were written with.
+    """
+    return any(info.filename.lower().endswith('.zip') or info.flag_bits & 0x1
+               for info in infos if not info.is_dir())
+
+
+def cleanup_plans(plan_dir: str = PLAN_DIR, ttl: int = PLAN_TTL):
+    """
+    Remove plans older than ttl seconds.
+    """
+    now = time.time()
+    for name in os.listdir(plan_dir):
+        path = os.path.join(plan_dir, name)
+        try:
+            if now - os.path.getmtime(path) > ttl:
+                os.remove(path)
+        except OSError:
+            continue
+
+
+def save_plan(plan_id: str, plan: Dict, plan_dir: str = PLAN_DIR):
+    """
+    Persist a plan so the second phase can be served by any worker.
+    """
+    os.makedirs(plan_dir, exist_ok=True)
+    cleanup_plans(plan_dir)
+    path = os.path.join(plan_dir, f"{plan_id}.json")
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(plan, f)
+    os.replace(path + '.tmp', path)
+
+
+def load_plan(plan_id: str, plan_dir: str = PLAN_DIR) -> Dict:
+    """
+    Load a saved plan. Raises FileNotFoundError if it is missing or expired.
+    """
+    path = os.path.join(plan_dir, f"{plan_id}.json")
+    if time.time() - os.path.getmtime(path) > PLAN_TTL:
+        raise FileNotFoundError(path)
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def plan_entry(info: zipfile.ZipInfo, member_range: Tuple[int, int], arcname: str) -> Dict:
+    """
+    Everything needed to copy one member out of its uploaded range.
+    """
+    return {
+        'arcname': arcname,
+        'member': info.filename,
+        'range': list(member_range),
+        'compress_type': info.compress_type,
+        'crc': info.CRC,
+        'compress_size': info.compress_size,
+        'file_size': info.file_size,
+        'date_time': list(info.date_time)
+    }
+
+
+def iter_member_data(blob: BinaryIO, blob_offset: int, entry: Dict,
+                     ranges: bool = False) -> Iterator[Union[bytes, FileRange]]:
+    """
+    Yield the compressed data of one member from the uploaded ranges blob.
+    blob_offset is where the member's range starts inside the blob.
+    With ranges, a blob on disk yields a FileRange for write_chunks instead of bytes.
+    """
+    blob.seek(blob_offset)
+    header = blob.read(LOCAL_HEADER_SIZE)
+    if len(header) < LOCAL_HEADER_SIZE or header[:4] != LOCAL_HEADER_SIGNATURE:
+        raise zipfile.BadZipFile(f"Bad local header for {entry['member']}")
+    name_length, extra_length = struct.unpack('<HH', header[26:30])
+    name = blob.read(name_length)
+    if name.decode('utf-8', 'replace') != entry['member'] and name.decode('cp437') != entry['member']:
+        raise zipfile.BadZipFile(f"Range does not start with {entry['member']}")
+    blob.seek(extra_length, os.SEEK_CUR)
+
+    fd = source_fileno(blob) if ranges else None
+    if fd is not None:
+        data_offset = blob.tell()
+        if data_offset + entry['compress_size'] > os.fstat(fd).st_size:
+            raise zipfile.BadZipFile(f"Truncated data for {entry['member']}")
+        if entry['compress_size']:
+            yield FileRange(fd, data_offset, entry['compress_size'])
+        return
+
+    remaining = entry['compress_size']
+    while remaining > 0:
+        chunk = blob.read(min(CHUNK_SIZE, remaining))
+        if not chunk:
+            raise zipfile.BadZipFile(f"Truncated data for {entry['member']}")
+        remaining -= len(chunk)
+        yield chunk
@@ -0,0 +1,74 @@
+"""
+Shared object storage for result parts.
+
+Serverless instances share no disk, so a part listed in a manifest cannot be
+served later from the cache of the instance that built the result, and
+function responses are capped anyway. When COMPARE_PART_BUCKET names an
+S3-compatible bucket (AWS S3, Cloudflare R2, MinIO, ...), every part is
+uploaded there once, right after the manifest is built, and the manifest
+points at a presigned download URL. Clients then fetch the parts straight
+from object storage, whichever instance answered the comparison.
+
+Parts are stored under <prefix><result_id>/<max_part_bytes>/<index>.zip; a
+result and split size always give the same parts, so parts already in the
+bucket are not uploaded again. Expire old parts with a bucket lifecycle rule.
+boto3 is only needed when a bucket is configured.
+"""
+import os
+from typing import Dict, Optional
+
+from result_parts import part_filename, stream_part
+
+PART_BUCKET = os.environ.get('COMPARE_PART_BUCKET', '')
+PART_PREFIX = os.environ.get('COMPARE_PART_PREFIX', 'parts/')
+# Endpoint of an S3-compatible service other than AWS S3
+PART_ENDPOINT_URL = os.environ.get('COMPARE_PART_ENDPOINT_URL') or None
+# Seconds a presigned part URL stays valid
+PART_URL_TTL = int(os.environ.get('COMPARE_PART_URL_TTL', 3600))
+
+
+class PartStore:
+    """
+    Uploads result parts to an S3-compatible bucket and hands out presigned URLs.
+    client is a boto3 S3 client (one is created from the environment if omitted).
+    """
+
+    def __init__(self, bucket: str = PART_BUCKET, prefix: str = PART_PREFIX,
+                 endpoint_url: Optional[str] = PART_ENDPOINT_URL, url_ttl: int = PART_URL_TTL,
+                 client=None):
+        if client is None:
+            import boto3
+            client = boto3.client('s3', endpoint_url=endpoint_url)
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix
+        self.url_ttl = url_ttl
+
+    def publish(self, result_id: str, result_zip_path: str, manifest: Dict):
+        """
+        Upload the manifest's parts that are not in the bucket yet and set each
+        part's url to a presigned download URL. Blocking.
+        """
+        prefix = f"{self.prefix}{result_id}/{manifest['max_part_bytes']}/"
+        stored = set()
+        pages = self.client.get_paginator('list_objects_v2').paginate(Bucket=self.bucket, Prefix=prefix)
+        for page in pages:
+            stored.update(item['Key'] for item in page.get('Contents', []))
+
+        for part in manifest['parts']:
+            key = f"{prefix}{part['index']}.zip"
+            filename = part_filename(part['index'], manifest['total_parts'])
+            if key not in stored:
+                # A part is at most max_part_bytes (or one oversized PDF), so it is built in memory
+                body = b''.join(stream_part(result_zip_path, manifest['max_part_bytes'], part['index']))
+                self.client.put_object(Bucket=self.bucket, Key=key, Body=body, ContentType='application/zip',
+                                       ContentDisposition=f'attachment; filename="{filename}"')
+            part['url'] = self.client.generate_presigned_url(
+                'get_object', Params={'Bucket': self.bucket, 'Key': key}, ExpiresIn=self.url_ttl)
+
+
+def open_part_store() -> Optional[PartStore]:
+    """
+    The configured part store, or None when parts are served by the API itself.
+    """
+    return PartStore() if PART_BUCKET else None
@@ -0,0 +1,130 @@
+"""
+PDF fingerprinting from the end of the file.
+
+A PDF's trailer (or cross-reference stream dictionary) sits at the end of the
+file and carries the document /ID pair and the startxref offset; incremental
+updates usually append the updated /Info dictionary there as well. Reading
+only the last few KB is therefore enough to tell whether two copies of a
+document are byte-identical, revisions of the same document or unrelated,
+without hashing either file in full.
+
+Fingerprints are taken from the extracted PDFs, where each tail is a direct
+seek into a file on disk. Reading tails out of the ZIP members (seeking into
+STORED data, streaming DEFLATED data) would only pay off if fingerprinting
+ran instead of extraction; the merge extracts every PDF anyway, so it does not.
+
+Without an /ID, equal size and tail bytes only suggest identical files, so
+same_contents compares such pairs in full before they are called identical.
+"""
+import filecmp
+import hashlib
+import os
+import re
+from typing import Dict, Optional
+
+TAIL_SIZE = 4 * 1024
+MAX_TAIL_SIZE = 64 * 1024
+
+ID_PATTERN = re.compile(rb'/ID\s*\[\s*<([0-9A-Fa-f\s]*)>\s*<([0-9A-Fa-f\s]*)>\s*\]')
+STARTXREF_PATTERN = re.compile(rb'startxref\s+(\d+)')
+CREATION_DATE_PATTERN = re.compile(rb'/CreationDate\s*\((D:[^)]*)\)')
+MOD_DATE_PATTERN = re.compile(rb'/ModDate\s*\((D:[^)]*)\)')
+
+
+def read_tail(path: str, size: int = TAIL_SIZE) -> bytes:
+    """
+    Read the last size bytes of a file on disk.
+    """
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        file_size = f.tell()
+        f.seek(max(file_size - size, 0))
+        return f.read()
+
+
+def parse_fingerprint(tail: bytes, file_size: int) -> Dict:
+    """
+    Extract the fingerprint fields from the tail of a PDF.
+    The last match wins, as incremental updates append newer trailers.
+    """
+    ids = ID_PATTERN.findall(tail)
+    startxrefs = STARTXREF_PATTERN.findall(tail)
+    creation_dates = CREATION_DATE_PATTERN.findall(tail)
+    mod_dates = MOD_DATE_PATTERN.findall(tail)
+
+    document_id = None
+    if ids:
+        document_id = [re.sub(rb'\s', b'', part).decode('ascii').upper() for part in ids[-1]]
+
+    return {
+        'size': file_size,
+        'id': document_id,
+        'startxref': int(startxrefs[-1]) if startxrefs else None,
+        'creation_date': creation_dates[-1].decode('latin-1') if creation_dates else None,
+        'mod_date': mod_dates[-1].decode('latin-1') if mod_dates else None,
+        'tail_digest': hashlib.sha1(tail).hexdigest()
+    }
+
+
+def fingerprint_pdf(path: str) -> Dict:
+    """
+    Fingerprint a PDF on disk from its last few KB.
+    The read window grows up to MAX_TAIL_SIZE if no /ID is found in the first one.
+    """
+    file_size = os.path.getsize(path)
+    size = TAIL_SIZE
+    while True:
+        tail = read_tail(path, size)
+        if ID_PATTERN.search(tail) or size >= MAX_TAIL_SIZE or size >= file_size:
+            return parse_fingerprint(tail, file_size)
+        size *= 4
+
+
+def compare_fingerprints(first: Dict, second: Dict) -> str:
+    """
+    Classify two fingerprints as 'identical', 'revised' or 'unrelated'.
+    identical: same size, same trailer and same tail bytes (when neither PDF has
+    an /ID, callers confirm this with same_contents)
+    revised: same permanent document ID (first /ID entry) but different content
+    unrelated: anything else
+    """
+    same_tail = (first['size'] == second['size']
+                 and first['tail_digest'] == second['tail_digest'])
+    if first['id'] and second['id']:
+        if first['id'] == second['id'] and same_tail:
+            return 'identical'
+        if first['id'][0] == second['id'][0]:
+            return 'revised'
+        return 'unrelated'
+    return 'identical' if same_tail else 'unrelated'
+
+
+def same_contents(first_path: str, second_path: str) -> bool:
+    """
+    Compare two files byte by byte, stopping at the first difference.
+    """
+    return filecmp.cmp(first_path, second_path, shallow=False)
+
+
+def pdf_date_key(fingerprint: Dict) -> str:
+    """
+    Sortable key for the most recent date recorded in a fingerprint.
+    PDF dates look like D:YYYYMMDDHHmmSS; only the digits are compared.
+    """
+    date = fingerprint.get('mod_date') or fingerprint.get('creation_date') or ''
+    return re.sub(r'\D', '', date)[:14]
+
+
+def newer_fingerprint(first: Dict, second: Dict) -> Optional[int]:
+    """
+    Return 0 if first is the newer revision, 1 if second is, None if unknown.
+    """
+    first_key = pdf_date_key(first)
+    second_key = pdf_date_key(second)
+    if first_key and second_key and first_key != second_key:
+        return 0 if first_key > second_key else 1
+    if first['startxref'] is not None and second['startxref'] is not None:
+        # Incremental updates append to the file, moving startxref forward
+        if first['startxref'] != second['startxref']:
+            return 0 if first['startxref'] > second['startxref'] else 1
+    return None
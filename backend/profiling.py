@@ -0,0 +1,201 @@
+"""
+Opt-in profiling of single comparison requests.
+
+An operator sends `X-Profile: cprofile` (deterministic, every function call)
+or `X-Profile: sampling` (stack samples every few milliseconds, lower
+overhead) together with `X-Profile-Token` matching COMPARE_PROFILE_TOKEN.
+The request then runs under the profiler and the artifacts are stored under
+a profile id returned in the X-Profile-Id header:
+
+- cprofile: profile.pstats (load with pstats or snakeviz) and profile.txt
+- sampling: stacks.collapsed (flamegraph.pl / speedscope input) and profile.txt
+
+Only function names and timings are recorded, never archive contents.
+Requests without the header take the normal path and pay nothing.
+"""
+import collections
+import cProfile
+import io
+import os
+import pstats
+import secrets
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+PROFILE_TOKEN = os.environ.get('COMPARE_PROFILE_TOKEN')
+PROFILE_DIR = os.environ.get('COMPARE_PROFILE_DIR',
+                             os.path.join(tempfile.gettempdir(), 'compare-zips-profiles'))
+PROFILE_TTL = int(os.environ.get('COMPARE_PROFILE_TTL', 24 * 3600))
+SAMPLE_INTERVAL = 0.005
+
+PROFILE_MODES = ('cprofile', 'sampling')
+# format -> (file name, media type)
+PROFILE_FORMATS = {
+    'pstats': ('profile.pstats', 'application/octet-stream'),
+    'collapsed': ('stacks.collapsed', 'text/plain'),
+    'text': ('profile.txt', 'text/plain'),
+}
+
+
+def authorized(token: Optional[str]) -> bool:
+    """
+    True if token matches the configured operator token (profiling is off without one).
+    """
+    if not PROFILE_TOKEN or not token:
+        return False
+    return secrets.compare_digest(token, PROFILE_TOKEN)
+
+
+def frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+class StackSampler(threading.Thread):
+    """
+    Samples the stack of one thread at a fixed interval and counts identical stacks.
+    """
+
+    def __init__(self, thread_id: int, interval: float = SAMPLE_INTERVAL):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            labels = []
+            while frame is not None:
+                labels.append(frame_label(frame))
+                frame = frame.f_back
+            if labels:
+                self.stacks[';'.join(reversed(labels))] += 1
+                self.samples += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def cleanup_profiles(profile_dir: str = PROFILE_DIR, ttl: int = PROFILE_TTL):
+    """
+    Remove profiles older than ttl seconds.
+    """
+    now = time.time()
+    for name in os.listdir(profile_dir):
+        path = os.path.join(profile_dir, name)
+        try:
+            if now - os.path.getmtime(path) > ttl:
+                shutil.rmtree(path, ignore_errors=True)
+        except OSError:
+            continue
+
+
+def new_profile_id() -> str:
+    return secrets.token_hex(16)
+
+
+class RequestProfile:
+    """
+    Profile of one request whose blocking steps run as separate calls, possibly
+    in different worker threads. Every call() runs under the chosen profiler
+    and adds to the same profile; save() stores the artifacts under profile_id.
+    """
+
+    def __init__(self, mode: str, profile_id: Optional[str] = None):
+        self.mode = mode
+        self.profile_id = profile_id or new_profile_id()
+        self.profiler = cProfile.Profile() if mode == 'cprofile' else None
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self.elapsed = 0.0
+
+    def call(self, func: Callable, *args, **kwargs):
+        """
+        Call func in the current thread under the profiler.
+        """
+        started = time.perf_counter()
+        try:
+            if self.profiler:
+                return self.profiler.runcall(func, *args, **kwargs)
+            sampler = StackSampler(threading.get_ident())
+            sampler.start()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                sampler.stop()
+                self.stacks.update(sampler.stacks)
+                self.samples += sampler.samples
+        finally:
+            self.elapsed += time.perf_counter() - started
+
+    def save(self):
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        cleanup_profiles()
+        profile_path = os.path.join(PROFILE_DIR, self.profile_id)
+        os.makedirs(profile_path)
+
+        if self.profiler:
+            self.profiler.dump_stats(os.path.join(profile_path, 'profile.pstats'))
+            report = io.StringIO()
+            stats = pstats.Stats(self.profiler, stream=report)
+            stats.sort_stats('cumulative').print_stats(60)
+            write_text(profile_path, 'profile.txt', report.getvalue())
+            return
+
+        write_text(profile_path, 'stacks.collapsed',
+                   ''.join(f"{stack} {count}\n" for stack, count in self.stacks.most_common()))
+        write_text(profile_path, 'profile.txt', sampling_report(self.stacks, self.samples, self.elapsed))
+
+
+def run_profiled(mode: str, profile_id: str, func: Callable, *args, **kwargs):
+    """
+    Call func in the current thread under the chosen profiler and store the
+    artifacts under profile_id, whether func returns or raises.
+    """
+    profile = RequestProfile(mode, profile_id)
+    try:
+        return profile.call(func, *args, **kwargs)
+    finally:
+        profile.save()
+
+
+def sampling_report(stacks: collections.Counter, samples: int, elapsed: float,
+                    interval: float = SAMPLE_INTERVAL) -> str:
+    """
+    Plain-text summary of a sampling profile: the functions most often on top of the stack.
+    """
+    own = collections.Counter()
+    for stack, count in stacks.items():
+        own[stack.rsplit(';', 1)[-1]] += count
+    lines = [f"{samples} samples every {interval * 1000:g} ms over {elapsed:.3f}s", '',
+             f"{'samples':>8} {'share':>7}  function"]
+    for label, count in own.most_common(60):
+        lines.append(f"{count:>8} {count / max(samples, 1):>7.1%}  {label}")
+    return '\n'.join(lines) + '\n'
+
+
+def write_text(profile_path: str, name: str, text: str):
+    with open(os.path.join(profile_path, name), 'w', encoding='utf-8') as f:
+        f.write(text)
+
+
+def profile_file(profile_id: str, fmt: str) -> Optional[Dict[str, str]]:
+    """
+    Locate a stored artifact. Returns {path, media_type, filename}, or None if it does not exist.
+    """
+    if fmt not in PROFILE_FORMATS or len(profile_id) != 32 or \
+            not all(c in '0123456789abcdef' for c in profile_id):
+        return None
+    name, media_type = PROFILE_FORMATS[fmt]
+    path = os.path.join(PROFILE_DIR, profile_id, name)
+    if not os.path.isfile(path):
+        return None
+    return {'path': path, 'media_type': media_type, 'filename': f"{profile_id}-{name}"}
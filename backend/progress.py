@@ -0,0 +1,138 @@
+"""
+Live progress reporting for long comparisons.
+
+The pipeline bumps plain integer counters on a ProgressTracker from inside its
+loops; a snapshot is only published when PUBLISH_INTERVAL has elapsed since the
+previous one, so the hot loops pay for an addition and a clock read at most.
+The /api/progress/{job_id} endpoint streams the published snapshots to the
+browser as server-sent events.
+"""
+import re
+import threading
+import time
+from typing import Dict, Optional
+
+PUBLISH_INTERVAL = 0.25
+# Finished trackers are kept this long so late subscribers still see the outcome
+FINISHED_TTL = 60
+# Unfinished trackers nothing has published to for this long are dropped:
+# ids only ever subscribed to, and jobs that died without finishing
+IDLE_TTL = 10 * 60
+JOB_ID_PATTERN = re.compile(r'^[A-Za-z0-9-]{8,64}$')
+
+COUNTERS = ('entries_indexed', 'nested_archives', 'files_written', 'bytes_processed')
+
+
+class ProgressTracker:
+    """
+    Per-job progress counters with throttled snapshots.
+    Written from the single thread running the job, read from the event loop.
+    """
+
+    def __init__(self, job_id: str, interval: float = PUBLISH_INTERVAL):
+        self.job_id = job_id
+        self.interval = interval
+        self.counters = {name: 0 for name in COUNTERS}
+        self.stage = 'waiting'
+        self.bytes_total = 0
+        self.started_at = time.monotonic()
+        self.published_at = 0.0
+        self.finished_at = None
+        self.error = None
+        self.evicted = False
+        self.version = 0
+        self.snapshot = {}
+        self.publish()
+
+    def add(self, **counts: int):
+        """
+        Increment counters, publishing a snapshot if the interval has elapsed.
+        """
+        for name, value in counts.items():
+            self.counters[name] += value
+        now = time.monotonic()
+        if now - self.published_at >= self.interval:
+            self.publish(now)
+
+    def set_stage(self, stage: str, bytes_total: Optional[int] = None):
+        """
+        Enter a new pipeline stage; always published immediately.
+        bytes_total, if given, is the number of bytes the job expects to process.
+        """
+        self.stage = stage
+        if bytes_total is not None:
+            self.bytes_total = bytes_total
+        self.publish()
+
+    def finish(self, error: Optional[str] = None):
+        """
+        Mark the job as done (or failed) and publish the final snapshot.
+        """
+        self.stage = 'failed' if error else 'done'
+        self.error = error
+        self.finished_at = time.monotonic()
+        self.publish()
+
+    def eta_seconds(self, now: float) -> Optional[float]:
+        processed = self.counters['bytes_processed']
+        if not self.bytes_total or not processed or self.finished_at:
+            return None
+        remaining = max(self.bytes_total - processed, 0)
+        return round((now - self.started_at) * remaining / processed, 1)
+
+    def publish(self, now: Optional[float] = None):
+        now = now or time.monotonic()
+        self.published_at = now
+        snapshot = dict(self.counters)
+        snapshot.update({
+            'job_id': self.job_id,
+            'stage': self.stage,
+            'bytes_total': self.bytes_total,
+            'elapsed_seconds': round(now - self.started_at, 1),
+            'eta_seconds': self.eta_seconds(now),
+            'error': self.error
+        })
+        # Replace the dict rather than mutating it, so readers never see a partial update
+        self.snapshot = snapshot
+        self.version += 1
+
+
+_trackers: Dict[str, ProgressTracker] = {}
+_trackers_lock = threading.Lock()
+
+
+def is_stale(tracker: ProgressTracker, now: float) -> bool:
+    if tracker.finished_at:
+        return now - tracker.finished_at > FINISHED_TTL
+    return now - tracker.published_at > IDLE_TTL
+
+
+def get_tracker(job_id: str) -> ProgressTracker:
+    """
+    Return the tracker for job_id, creating it if needed. A subscriber may
+    connect before the upload that starts the job has finished.
+    """
+    with _trackers_lock:
+        now = time.monotonic()
+        for stale_id in [key for key, tracker in _trackers.items() if is_stale(tracker, now)]:
+            _trackers.pop(stale_id).evicted = True
+        tracker = _trackers.get(job_id)
+        if tracker is None:
+            tracker = _trackers[job_id] = ProgressTracker(job_id)
+        return tracker
+
+
+def start_tracker(job_id: Optional[str]) -> Optional[ProgressTracker]:
+    """
+    Tracker for a request's optional job_id; None when progress was not requested.
+    The clock restarts, since the tracker may have been created by an early subscriber.
+    """
+    if not job_id:
+        return None
+    tracker = get_tracker(job_id)
+    tracker.started_at = time.monotonic()
+    return tracker
+
+
+def valid_job_id(job_id: str) -> bool:
+    return bool(JOB_ID_PATTERN.match(job_id))
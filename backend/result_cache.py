@@ -0,0 +1,171 @@
+"""
+On-disk cache of completed comparisons.
+
+Results are keyed by the SHA-256 of both uploaded archives plus the
+comparison options, so resubmitting the same pair of ZIP files (double
+clicks, several people uploading the same batch) is answered from disk
+instead of rerunning the pipeline. The key doubles as the response ETag.
+
+Each entry is a directory holding result.zip, summary.json and the row
+files of summary_export. Entries expire after COMPARE_CACHE_TTL seconds and
+the least recently used ones are evicted once the store exceeds
+COMPARE_CACHE_MAX_ENTRIES or COMPARE_CACHE_MAX_BYTES.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
+
+from fast_io import copy_file
+from summary_export import write_exports
+
+CACHE_DIR = os.environ.get('COMPARE_CACHE_DIR',
+                           os.path.join(tempfile.gettempdir(), 'compare-zips-cache'))
+CACHE_TTL = int(os.environ.get('COMPARE_CACHE_TTL', 3600))
+CACHE_MAX_ENTRIES = int(os.environ.get('COMPARE_CACHE_MAX_ENTRIES', 64))
+CACHE_MAX_BYTES = int(os.environ.get('COMPARE_CACHE_MAX_BYTES', 1024 * 1024 * 1024))
+
+
+def cache_key(file1_hash: str, file2_hash: str, options: Dict) -> str:
+    """
+    Build the cache key (and ETag) for a comparison.
+    """
+    material = json.dumps([file1_hash, file2_hash, options], sort_keys=True)
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+def etag_matches(if_none_match: Optional[str], key: str) -> bool:
+    """
+    Check an If-None-Match header value against a cache key.
+    """
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        if tag == '*':
+            return True
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        if tag.strip('"') == key:
+            return True
+    return False
+
+
+class ResultCache:
+    """
+    Bounded on-disk store of comparison results with TTL and LRU eviction.
+    Writes go to a scratch directory first and are renamed into place, so
+    concurrent workers sharing the directory never see partial entries.
+    """
+
+    def __init__(self, root: str = CACHE_DIR, ttl: int = CACHE_TTL,
+                 max_entries: int = CACHE_MAX_ENTRIES, max_bytes: int = CACHE_MAX_BYTES):
+        self.root = root
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        os.makedirs(self.root, exist_ok=True)
+
+    def entry_dir(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def locate(self, key: str) -> Optional[str]:
+        """
+        Return the entry directory for key, or None if missing or expired.
+        A hit marks the entry as recently used; nothing is read.
+        """
+        entry_dir = self.entry_dir(key)
+        summary_path = os.path.join(entry_dir, 'summary.json')
+        try:
+            created = os.path.getmtime(summary_path)
+            if time.time() - created > self.ttl:
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                return None
+            os.utime(entry_dir)
+        except OSError:
+            return None
+        return entry_dir
+
+    def get(self, key: str) -> Optional[Tuple[str, Dict]]:
+        """
+        Return (result_zip_path, summary) for key, or None if missing or expired.
+        A hit marks the entry as recently used.
+        """
+        entry_dir = self.locate(key)
+        if not entry_dir:
+            return None
+        try:
+            with open(os.path.join(entry_dir, 'summary.json'), 'r', encoding='utf-8') as f:
+                summary = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return os.path.join(entry_dir, 'result.zip'), summary
+
+    def put(self, key: str, result_zip_path: str, summary: Dict) -> str:
+        """
+        Store a finished result and evict old entries. Returns the entry directory.
+        """
+        entry_dir = self.entry_dir(key)
+        if os.path.isdir(entry_dir):
+            return entry_dir
+        scratch_dir = tempfile.mkdtemp(prefix='.incoming-', dir=self.root)
+        try:
+            copy_file(result_zip_path, os.path.join(scratch_dir, 'result.zip'))
+            with open(os.path.join(scratch_dir, 'summary.json'), 'w', encoding='utf-8') as f:
+                json.dump(summary, f)
+            write_exports(scratch_dir, summary)
+            os.rename(scratch_dir, entry_dir)
+        except OSError:
+            # Another worker stored the same key first
+            shutil.rmtree(scratch_dir, ignore_errors=True)
+        self.evict()
+        return entry_dir
+
+    def entries(self) -> List[Tuple[float, int, str]]:
+        """
+        List cached entries as (last_used, size_in_bytes, key).
+        """
+        found = []
+        for key in os.listdir(self.root):
+            entry_dir = self.entry_dir(key)
+            if key.startswith('.') or not os.path.isdir(entry_dir):
+                continue
+            try:
+                size = sum(os.path.getsize(os.path.join(entry_dir, name))
+                           for name in os.listdir(entry_dir))
+                found.append((os.path.getmtime(entry_dir), size, key))
+            except OSError:
+                continue
+        return found
+
+    def evict(self) -> int:
+        """
+        Remove expired entries, then least recently used ones until within limits.
+        Returns the number of entries removed.
+        """
+        removed = 0
+        now = time.time()
+        live = []
+        for last_used, size, key in self.entries():
+            summary_path = os.path.join(self.entry_dir(key), 'summary.json')
+            try:
+                expired = now - os.path.getmtime(summary_path) > self.ttl
+            except OSError:
+                expired = True
+            if expired:
+                shutil.rmtree(self.entry_dir(key), ignore_errors=True)
+                removed += 1
+            else:
+                live.append((last_used, size, key))
+
+        live.sort()
+        total_bytes = sum(size for _, size, _ in live)
+        while live and (len(live) > self.max_entries or total_bytes > self.max_bytes):
+            _, size, key = live.pop(0)
+            shutil.rmtree(self.entry_dir(key), ignore_errors=True)
+            total_bytes -= size
+            removed += 1
+        return removed
@@ -0,0 +1,147 @@
+"""
+Split result archives.
+
+Serverless deployments cap the size of a function response, so a large
+result.zip (base64-encoded in the JSON response, on top of that) cannot be
+returned in one piece. Instead the finished result can be served as several
+smaller, independent ZIP archives ("parts"), each under a byte limit.
+
+Parts are packed from the result's central directory: the bytes a member adds
+to a part follow from its compressed size and name length, so the packing
+needs no trial writes and the size of every part is known before it is sent.
+Members keep their order and are copied into the part raw, without
+recompression. A member larger than the limit on its own gets a part of its
+own (marked oversized).
+"""
+import os
+import zipfile
+from typing import Dict, Iterator, List
+
+from manifest import iter_member_data
+from zip_stream import ZIP64_LIMIT, ZipStreamWriter, pack_dos_datetime
+
+DEFAULT_PART_BYTES = int(os.environ.get('COMPARE_PART_BYTES', 4 * 1024 * 1024))
+MIN_PART_BYTES = 64 * 1024
+
+LOCAL_HEADER_SIZE = 30
+CENTRAL_HEADER_SIZE = 46
+END_RECORD_SIZE = 22
+# ZIP64 end record and locator, for parts with more than 65535 members
+ZIP64_END_SIZE = 56 + 20
+ZIP64_EXTRA_SIZE = 20
+# Central ZIP64 extra with file size, compressed size and header offset
+ZIP64_CENTRAL_EXTRA_SIZE = 4 + 3 * 8
+ZIP_MAX_COUNT = 0xFFFF
+
+
+def encoded_name_length(name: str) -> int:
+    """
+    Length of the name as ZipStreamWriter stores it (ASCII, else UTF-8).
+    """
+    return len(name.encode('utf-8'))
+
+
+def member_part_size(info: zipfile.ZipInfo) -> int:
+    """
+    Upper bound of the bytes a member adds to a part: local header, data and
+    central directory entry (with the largest ZIP64 extra it could need).
+    """
+    name_length = encoded_name_length(info.filename)
+    zip64 = info.file_size > ZIP64_LIMIT or info.compress_size > ZIP64_LIMIT
+    extra = ZIP64_EXTRA_SIZE if zip64 else 0
+    return (LOCAL_HEADER_SIZE + name_length + extra + info.compress_size
+            + CENTRAL_HEADER_SIZE + name_length + ZIP64_CENTRAL_EXTRA_SIZE)
+
+
+def part_size(infos: List[zipfile.ZipInfo]) -> int:
+    """
+    Exact size of the part ZipStreamWriter writes for these members.
+    """
+    offset = 0
+    central = 0
+    for info in infos:
+        name_length = encoded_name_length(info.filename)
+        zip64 = info.file_size > ZIP64_LIMIT or info.compress_size > ZIP64_LIMIT
+        wide = [info.file_size > ZIP64_LIMIT, info.compress_size > ZIP64_LIMIT, offset > ZIP64_LIMIT]
+        central += CENTRAL_HEADER_SIZE + name_length + (4 + 8 * sum(wide) if any(wide) else 0)
+        offset += LOCAL_HEADER_SIZE + name_length + (ZIP64_EXTRA_SIZE if zip64 else 0) + info.compress_size
+    size = offset + central + END_RECORD_SIZE
+    if len(infos) > ZIP_MAX_COUNT or offset > ZIP64_LIMIT or central > ZIP64_LIMIT:
+        size += ZIP64_END_SIZE
+    return size
+
+
+def plan_parts(infos: List[zipfile.ZipInfo], max_part_bytes: int) -> List[List[zipfile.ZipInfo]]:
+    """
+    Pack members, in order, into consecutive parts of at most max_part_bytes.
+    """
+    parts = []
+    current = []
+    current_size = 0
+    for info in infos:
+        size = member_part_size(info)
+        if current and current_size + size + END_RECORD_SIZE + ZIP64_END_SIZE > max_part_bytes:
+            parts.append(current)
+            current = []
+            current_size = 0
+        current.append(info)
+        current_size += size
+    if current or not parts:
+        parts.append(current)
+    return parts
+
+
+def read_members(result_zip_path: str) -> List[zipfile.ZipInfo]:
+    with zipfile.ZipFile(result_zip_path, 'r') as zf:
+        return [info for info in zf.infolist() if not info.is_dir()]
+
+
+def parts_manifest(result_zip_path: str, max_part_bytes: int) -> Dict:
+    """
+    Describe how a result splits into parts under max_part_bytes.
+    Returns: {max_part_bytes, total_parts, total_files, parts: [{index, files, bytes, first, last, oversized}]}
+    """
+    parts = plan_parts(read_members(result_zip_path), max_part_bytes)
+    described = []
+    for index, part in enumerate(parts):
+        size = part_size(part)
+        described.append({
+            'index': index,
+            'files': len(part),
+            'bytes': size,
+            'first': part[0].filename if part else None,
+            'last': part[-1].filename if part else None,
+            'oversized': size > max_part_bytes
+        })
+    return {
+        'max_part_bytes': max_part_bytes,
+        'total_parts': len(parts),
+        'total_files': sum(len(part) for part in parts),
+        'parts': described
+    }
+
+
+def part_filename(index: int, total_parts: int) -> str:
+    return f"result.part{index + 1}of{total_parts}.zip"
+
+
+def stream_part(result_zip_path: str, max_part_bytes: int, index: int) -> Iterator[bytes]:
+    """
+    Stream part number index as a standalone ZIP archive.
+    Raises IndexError if there is no such part.
+    """
+    parts = plan_parts(read_members(result_zip_path), max_part_bytes)
+    if not 0 <= index < len(parts):
+        raise IndexError(index)
+    return _stream_members(result_zip_path, parts[index])
+
+
+def _stream_members(result_zip_path: str, infos: List[zipfile.ZipInfo]) -> Iterator[bytes]:
+    writer = ZipStreamWriter()
+    with open(result_zip_path, 'rb') as f:
+        for info in infos:
+            entry = {'member': info.filename, 'compress_size': info.compress_size}
+            yield from writer.add_raw(info.filename, info.compress_type, info.CRC, info.compress_size,
+                                      info.file_size, pack_dos_datetime(info.date_time),
+                                      iter_member_data(f, info.header_offset, entry))
+    yield from writer.finish()
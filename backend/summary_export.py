@@ -0,0 +1,128 @@
+"""
+Row-by-row export of comparison summaries.
+
+Downstream loaders want the per-file results (both archives' file lists, the
+duplicate pairs and the merged files) as rows, not as one large JSON object.
+When a result is stored, each of those lists is also written next to
+summary.json as an NDJSON file, one row per line. Exports then stream that
+file line by line, as NDJSON unchanged or converted to CSV one row at a time,
+so serving an export never loads the summary and memory stays flat however
+many files the comparison had.
+
+The rows are written from the finished summary, not from the merge decisions
+as they are made: the comparison response carries the whole summary, so the
+pipeline holds it in memory anyway. Only serving exports is flat in memory.
+"""
+import csv
+import io
+import json
+import os
+from typing import Dict, Iterator, List, Tuple
+
+# section -> (path of the list in the summary, CSV columns; nested keys are dotted)
+EXPORT_SECTIONS: Dict[str, Tuple[Tuple[str, ...], List[str]]] = {
+    'zip1_files': (('zip1_stats', 'files'), ['username', 'folder', 'filename', 'status', 'kept']),
+    'zip2_files': (('zip2_stats', 'files'), ['username', 'folder', 'filename', 'status', 'kept']),
+    'duplicate_pairs': (('duplicate_pairs',), ['username', 'zip1_file.folder', 'zip1_file.filename',
+                                                'zip2_file.folder', 'zip2_file.filename',
+                                                'kept_from', 'removed_from', 'match']),
+    'final_merged': (('final_merged', 'files'), ['username', 'source', 'folder', 'filename']),
+}
+# format -> (media type, file extension)
+EXPORT_FORMATS = {
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+}
+BATCH_ROWS = 256
+
+
+def section_rows(summary: Dict, section: str) -> List[Dict]:
+    value = summary
+    for key in EXPORT_SECTIONS[section][0]:
+        value = value.get(key) if isinstance(value, dict) else None
+    return value or []
+
+
+def rows_path(directory: str, section: str) -> str:
+    return os.path.join(directory, f"{section}.ndjson")
+
+
+def write_exports(directory: str, summary: Dict):
+    """
+    Write every export section of summary into directory, one JSON row per line.
+    Each file is renamed into place once complete.
+    """
+    for section in EXPORT_SECTIONS:
+        path = rows_path(directory, section)
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            for row in section_rows(summary, section):
+                f.write(json.dumps(row, separators=(',', ':')))
+                f.write('\n')
+        os.replace(path + '.tmp', path)
+
+
+def iter_lines(directory: str, section: str) -> Iterator[str]:
+    """
+    The section's rows as NDJSON lines. Directories stored before exports existed
+    fall back to reading summary.json (which does load it whole).
+    """
+    path = rows_path(directory, section)
+    if os.path.isfile(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            yield from f
+        return
+    with open(os.path.join(directory, 'summary.json'), 'r', encoding='utf-8') as f:
+        summary = json.load(f)
+    for row in section_rows(summary, section):
+        yield json.dumps(row, separators=(',', ':')) + '\n'
+
+
+def flatten(row: Dict, prefix: str = '') -> Dict:
+    flat = {}
+    for key, value in row.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        else:
+            flat[prefix + key] = value
+    return flat
+
+
+def csv_value(value) -> str:
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    return str(value)
+
+
+def iter_export(directory: str, section: str, fmt: str) -> Iterator[bytes]:
+    """
+    Stream one section of a stored result as NDJSON or CSV (with a header row).
+    Rows are sent in small batches, so the first bytes go out right away.
+    """
+    if fmt == 'csv':
+        columns = EXPORT_SECTIONS[section][1]
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        pending = 1
+        for line in iter_lines(directory, section):
+            flat = flatten(json.loads(line))
+            writer.writerow([csv_value(flat.get(column)) for column in columns])
+            pending += 1
+            if pending >= BATCH_ROWS:
+                yield buffer.getvalue().encode('utf-8')
+                buffer.seek(0)
+                buffer.truncate()
+                pending = 0
+        yield buffer.getvalue().encode('utf-8')
+        return
+
+    batch = []
+    for line in iter_lines(directory, section):
+        batch.append(line)
+        if len(batch) >= BATCH_ROWS:
+            yield ''.join(batch).encode('utf-8')
+            batch = []
+    if batch:
+        yield ''.join(batch).encode('utf-8')
@@ -0,0 +1,127 @@
+import io
+import os
+import zipfile
+
+import pytest
+
+from fast_io import write_chunks
+from manifest import (TailTooShort, iter_member_data, member_ranges, needs_full_upload, plan_entry,
+                      read_central_directory)
+from zip_stream import ZipStreamWriter, pack_dos_datetime
+
+TEXT = b''.join(b'%d 0 obj << /Type /Page >> endobj\n' % i for i in range(2000))
+SCANNED = os.urandom(50 * 1024)
+
+
+class Unseekable:
+    """
+    Write-only stream, so zipfile writes members with data descriptors.
+    """
+
+    def __init__(self):
+        self.buffer = io.BytesIO()
+
+    def write(self, data):
+        return self.buffer.write(data)
+
+    def flush(self):
+        pass
+
+
+def source_archive(streamed=False):
+    target = Unseekable() if streamed else io.BytesIO()
+    with zipfile.ZipFile(target, 'w') as zf:
+        zf.writestr(zipfile.ZipInfo('batch/', (2024, 5, 1, 8, 0, 0)), b'')
+        zf.writestr(zipfile.ZipInfo('batch/DAB0001_PLM-1.pdf', (2024, 5, 1, 8, 0, 0)), TEXT,
+                    compress_type=zipfile.ZIP_DEFLATED)
+        zf.writestr(zipfile.ZipInfo('batch/DAB0002_PLM-1.pdf', (2023, 12, 31, 23, 59, 58)), SCANNED,
+                    compress_type=zipfile.ZIP_STORED)
+        zf.writestr(zipfile.ZipInfo('batch/DAB0003_PLM-1.pdf', (2024, 1, 2, 3, 4, 6)), b'',
+                    compress_type=zipfile.ZIP_DEFLATED)
+    return (target.buffer if streamed else target).getvalue()
+
+
+def copy_members(archive, tmp_path, ranges=False):
+    """
+    Copy every PDF of archive into a new ZIP the way complete_plan does:
+    from the central directory in the tail, through the uploaded ranges.
+    """
+    infos, cd_offset = read_central_directory(archive[-4096:], len(archive))
+    member_range = member_ranges(infos, cd_offset)
+    entries = [plan_entry(info, member_range[info.filename], info.filename.split('/')[-1])
+               for info in infos if not info.is_dir()]
+
+    # The client sends the requested ranges back to back
+    blob_offsets = {}
+    blob_path = tmp_path / 'ranges.bin'
+    with open(blob_path, 'wb') as blob:
+        for start, end in sorted(entry['range'] for entry in entries):
+            blob_offsets[start] = blob.tell()
+            blob.write(archive[start:end])
+
+    result_path = tmp_path / 'result.zip'
+    writer = ZipStreamWriter()
+    with open(blob_path, 'rb') as blob, open(result_path, 'wb') as f:
+        for entry in entries:
+            chunks = iter_member_data(blob, blob_offsets[entry['range'][0]], entry, ranges=ranges)
+            write_chunks(f, writer.add_raw(entry['arcname'], entry['compress_type'], entry['crc'],
+                                           entry['compress_size'], entry['file_size'],
+                                           pack_dos_datetime(entry['date_time']), chunks))
+        write_chunks(f, writer.finish())
+    return result_path.read_bytes()
+
+
+@pytest.mark.parametrize('streamed', [False, True])
+@pytest.mark.parametrize('ranges', [False, True])
+def test_planned_members_are_copied_raw(tmp_path, streamed, ranges):
+    archive = source_archive(streamed)
+
+    result = copy_members(archive, tmp_path, ranges)
+
+    with zipfile.ZipFile(io.BytesIO(archive)) as source, zipfile.ZipFile(io.BytesIO(result)) as copy:
+        assert copy.testzip() is None
+        assert copy.namelist() == ['DAB0001_PLM-1.pdf', 'DAB0002_PLM-1.pdf', 'DAB0003_PLM-1.pdf']
+        for info in copy.infolist():
+            original = source.getinfo(f'batch/{info.filename}')
+            assert info.compress_type == original.compress_type
+            assert (info.CRC, info.compress_size, info.file_size) == (
+                original.CRC, original.compress_size, original.file_size)
+            assert info.date_time == original.date_time
+            assert copy.read(info) == source.read(original)
+
+
+def test_ranges_cover_data_descriptors():
+    archive = source_archive(streamed=True)
+    infos, cd_offset = read_central_directory(archive, len(archive))
+    assert all(info.flag_bits & 0x08 for info in infos if not info.is_dir())
+
+    ranges = member_ranges(infos, cd_offset)
+
+    ordered = sorted(ranges.values())
+    assert ordered[0][0] == 0
+    assert ordered[-1][1] == cd_offset
+    assert all(end == next_start for (_, end), (next_start, _) in zip(ordered, ordered[1:]))
+
+
+def test_short_tail_asks_for_more_bytes():
+    archive = source_archive()
+    _, cd_offset = read_central_directory(archive, len(archive))
+
+    with pytest.raises(TailTooShort) as raised:
+        read_central_directory(archive[-30:], len(archive))
+    assert raised.value.required_bytes == len(archive) - cd_offset
+
+    with pytest.raises(TailTooShort) as raised:
+        read_central_directory(archive[:10], len(archive))
+    assert raised.value.required_bytes == len(archive)
+
+
+def test_nested_and_encrypted_members_need_a_full_upload():
+    pdf = zipfile.ZipInfo('batch/DAB0001_PLM-1.pdf')
+    nested = zipfile.ZipInfo('batch/more.ZIP')
+    encrypted = zipfile.ZipInfo('batch/DAB0002_PLM-1.pdf')
+    encrypted.flag_bits |= 0x1
+
+    assert not needs_full_upload([pdf, zipfile.ZipInfo('batch.zip/')])
+    assert needs_full_upload([pdf, nested])
+    assert needs_full_upload([pdf, encrypted])
@@ -0,0 +1,45 @@
+from fuzzy_match import find_near_duplicates
+from main import near_duplicate_pairs
+
+
+def zip1_entry(username):
+    return {'folder': 'batch', 'filename': f"{username}_PLM-1.pdf", 'source': 'ZIP File 1'}
+
+
+def zip2_entry(folder, filename='doc.pdf'):
+    return {'folder': folder, 'filename': filename, 'source': 'ZIP File 2'}
+
+
+def test_folder_prefix_matching_a_zip1_username_is_reported():
+    # 'dab7341(1) ANJUM' fails the strict folder pattern, so its PDF name becomes the username
+    zip1_info = {'dab7341': zip1_entry('dab7341')}
+    zip2_info = {'doc': zip2_entry('dab7341(1) ANJUM')}
+
+    pairs = near_duplicate_pairs(zip1_info, zip2_info, 1)
+
+    assert len(pairs) == 1
+    assert pairs[0]['zip1_username'] == 'dab7341'
+    assert pairs[0]['zip2_username'] == 'doc'
+    assert pairs[0]['reason'] == 'normalized'
+    assert pairs[0]['zip2_file'] == {'folder': 'dab7341(1) ANJUM', 'filename': 'doc.pdf'}
+
+
+def test_exact_username_matches_are_not_reported():
+    zip1_info = {'DAB7341': zip1_entry('DAB7341')}
+    zip2_info = {'DAB7341': zip2_entry('DAB7341(1) ANJUM')}
+
+    assert near_duplicate_pairs(zip1_info, zip2_info, 1) == []
+
+
+def test_aliases_of_matched_usernames_are_ignored():
+    pairs = find_near_duplicates(['DAB7341', 'dab7341'], ['DAB7341'], 1,
+                                 zip2_aliases={'dab7341': 'DAB7341'})
+
+    assert pairs == []
+
+
+def test_username_and_alias_report_one_pair():
+    pairs = find_near_duplicates(['DAB7341'], ['DAB 7341'], 1,
+                                 zip2_aliases={'DAB734': 'DAB 7341'})
+
+    assert [(pair['zip2_username'], pair['reason']) for pair in pairs] == [('DAB 7341', 'normalized')]
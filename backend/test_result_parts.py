@@ -0,0 +1,128 @@
+import io
+import os
+import zipfile
+
+import pytest
+
+from part_store import PartStore
+from result_parts import MIN_PART_BYTES, part_filename, parts_manifest, stream_part
+from zip_stream import CompressionPolicy, ZipStreamWriter, write_zip
+
+TEXT = b''.join(b'%d 0 obj << /Type /Page >> endobj\n' % i for i in range(3000))
+
+
+def result_zip(tmp_path, sizes):
+    """
+    Write a result archive with one PDF per size: random (STORED) bytes, with
+    every third entry compressible text (DEFLATED) and a non-ASCII name.
+    """
+    entries = []
+    for index, size in enumerate(sizes):
+        data = TEXT[:size] if index % 3 == 2 else os.urandom(size)
+        name = f"DAB{index:04d}{'_é' if index % 3 == 2 else ''}.pdf"
+        path = tmp_path / name
+        path.write_bytes(data)
+        entries.append((name, str(path)))
+    return write_zip(entries, str(tmp_path / 'result.zip'), ZipStreamWriter(policy=CompressionPolicy()))
+
+
+def read_parts(path, manifest):
+    return [b''.join(stream_part(path, manifest['max_part_bytes'], part['index']))
+            for part in manifest['parts']]
+
+
+@pytest.mark.parametrize('max_part_bytes', [MIN_PART_BYTES, 100 * 1024, 4 * 1024 * 1024])
+def test_parts_match_the_manifest_bytes(tmp_path, max_part_bytes):
+    path = result_zip(tmp_path, [30 * 1024, 5 * 1024, 40 * 1024, 2 * 1024, 60 * 1024, 20 * 1024, 0, 10 * 1024])
+
+    manifest = parts_manifest(path, max_part_bytes)
+
+    with zipfile.ZipFile(path) as result:
+        originals = {info.filename: result.read(info) for info in result.infolist()}
+    names = []
+    for part, data in zip(manifest['parts'], read_parts(path, manifest)):
+        assert len(data) == part['bytes']
+        assert part['bytes'] <= max_part_bytes and not part['oversized']
+        with zipfile.ZipFile(io.BytesIO(data)) as zf:
+            assert zf.testzip() is None
+            part_names = zf.namelist()
+            assert (part_names[0], part_names[-1]) == (part['first'], part['last'])
+            assert len(part_names) == part['files']
+            for name in part_names:
+                assert zf.read(name) == originals[name]
+        names += part_names
+    assert names == list(originals)
+    assert manifest['total_files'] == len(originals)
+    assert manifest['total_parts'] == len(manifest['parts'])
+    assert (manifest['total_parts'] > 1) == (max_part_bytes < os.path.getsize(path))
+
+
+def test_member_over_the_limit_gets_an_oversized_part(tmp_path):
+    path = result_zip(tmp_path, [10 * 1024, 100 * 1024, 10 * 1024])
+
+    manifest = parts_manifest(path, MIN_PART_BYTES)
+
+    assert [part['files'] for part in manifest['parts']] == [1, 1, 1]
+    assert [part['oversized'] for part in manifest['parts']] == [False, True, False]
+    for part, data in zip(manifest['parts'], read_parts(path, manifest)):
+        assert len(data) == part['bytes']
+
+
+def test_part_with_more_than_65535_members_uses_zip64_end_record(tmp_path):
+    writer = ZipStreamWriter()
+    path = str(tmp_path / 'result.zip')
+    with open(path, 'wb') as f:
+        for index in range(70000):
+            f.write(b''.join(writer.add_raw(f'{index}.pdf', 0, 0, 0, 0, (0, 33), [])))
+        f.write(b''.join(writer.finish()))
+
+    manifest = parts_manifest(path, 16 * 1024 * 1024)
+
+    assert manifest['total_parts'] == 1
+    data = read_parts(path, manifest)[0]
+    assert len(data) == manifest['parts'][0]['bytes']
+    assert data[-98:-94] == b'PK\x06\x06'  # ZIP64 end record, before the locator and end record
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        assert len(zf.infolist()) == 70000
+
+
+def test_missing_part_raises_index_error(tmp_path):
+    path = result_zip(tmp_path, [1024])
+
+    with pytest.raises(IndexError):
+        stream_part(path, MIN_PART_BYTES, 1)
+
+
+class FakeS3:
+    def __init__(self):
+        self.objects = {}
+
+    def get_paginator(self, operation):
+        return self
+
+    def paginate(self, Bucket, Prefix):
+        yield {'Contents': [{'Key': key} for key in self.objects if key.startswith(Prefix)]}
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.objects[Key] = Body
+
+    def generate_presigned_url(self, operation, Params, ExpiresIn):
+        return f"https://{Params['Bucket']}.example/{Params['Key']}?expires={ExpiresIn}"
+
+
+def test_part_store_uploads_each_part_once(tmp_path):
+    path = result_zip(tmp_path, [30 * 1024, 40 * 1024, 50 * 1024])
+    client = FakeS3()
+    store = PartStore('bucket', 'parts/', None, 60, client=client)
+
+    manifest = parts_manifest(path, MIN_PART_BYTES)
+    store.publish('abc', path, manifest)
+    uploaded = dict(client.objects)
+    client.put_object = lambda **kwargs: pytest.fail('part uploaded twice')
+    store.publish('abc', path, parts_manifest(path, MIN_PART_BYTES))
+
+    assert sorted(uploaded) == [f'parts/abc/{MIN_PART_BYTES}/{i}.zip' for i in range(manifest['total_parts'])]
+    for part, data in zip(manifest['parts'], read_parts(path, manifest)):
+        assert uploaded[f"parts/abc/{MIN_PART_BYTES}/{part['index']}.zip"] == data
+        assert part['url'] == f"https://bucket.example/parts/abc/{MIN_PART_BYTES}/{part['index']}.zip?expires=60"
+    assert part_filename(0, manifest['total_parts']) == f"result.part1of{manifest['total_parts']}.zip"
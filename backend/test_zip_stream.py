@@ -0,0 +1,196 @@
+import io
+import os
+import struct
+import zipfile
+
+import pytest
+
+import zip_stream
+from fast_io import write_chunks
+from zip_stream import ZIP64_LIMIT, ZIP_DEFLATED, ZIP_STORED, CompressionPolicy, ZipStreamWriter, stream_zip
+
+LOCAL_HEADER = struct.Struct('<IHHHHHIIIHH')
+
+
+def write_file(tmp_path, name, data):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+def build_archive(entries, writer):
+    return b''.join(stream_zip(entries, writer))
+
+
+def local_entry(archive, offset):
+    """
+    Parse the local header at offset.
+    Returns: (header fields, name, extra, data offset)
+    """
+    fields = LOCAL_HEADER.unpack_from(archive, offset)
+    name_length, extra_length = fields[9], fields[10]
+    name_start = offset + LOCAL_HEADER.size
+    name = archive[name_start:name_start + name_length]
+    extra = archive[name_start + name_length:name_start + name_length + extra_length]
+    return fields, name, extra, name_start + name_length + extra_length
+
+
+def test_small_entry_round_trips_with_32_bit_data_descriptor(tmp_path):
+    data = os.urandom(5000)
+    path = write_file(tmp_path, 'a.pdf', data)
+
+    archive = build_archive([('a.pdf', path)], ZipStreamWriter(compression=ZIP_STORED))
+
+    fields, name, extra, data_offset = local_entry(archive, 0)
+    assert name == b'a.pdf'
+    assert extra == b''
+    assert fields[2] & 0x08  # data descriptor flag
+    assert fields[6:9] == (0, 0, 0)  # CRC and sizes are left to the descriptor
+    descriptor = struct.unpack_from('<IIII', archive, data_offset + len(data))
+    assert descriptor == (0x08074b50, zipfile.crc32(data), len(data), len(data))
+
+    with zipfile.ZipFile(io.BytesIO(archive)) as zf:
+        assert zf.testzip() is None
+        assert zf.read('a.pdf') == data
+
+
+def test_entry_over_zip64_limit_switches_to_zip64(tmp_path, monkeypatch):
+    monkeypatch.setattr(zip_stream, 'ZIP64_LIMIT', 4000)
+    data = os.urandom(5000)
+    path = write_file(tmp_path, 'big.pdf', data)
+
+    archive = build_archive([('big.pdf', path)], ZipStreamWriter(compression=ZIP_STORED))
+
+    fields, _, extra, data_offset = local_entry(archive, 0)
+    assert fields[1] == 45
+    assert fields[7:9] == (0xFFFFFFFF, 0xFFFFFFFF)
+    assert extra == struct.pack('<HHQQ', 0x0001, 16, 0, 0)
+    descriptor = struct.unpack_from('<IIQQ', archive, data_offset + len(data))
+    assert descriptor == (0x08074b50, zipfile.crc32(data), len(data), len(data))
+
+    with zipfile.ZipFile(io.BytesIO(archive)) as zf:
+        info = zf.getinfo('big.pdf')
+        assert (info.file_size, info.compress_size) == (len(data), len(data))
+        assert info.extra.startswith(struct.pack('<HH', 0x0001, 16))
+        assert zf.read('big.pdf') == data
+
+
+def test_entry_that_could_outgrow_the_limit_gets_a_64_bit_descriptor(tmp_path, monkeypatch):
+    # 4800 bytes fit, but DEFLATE may expand them by more than the 200 bytes left
+    monkeypatch.setattr(zip_stream, 'ZIP64_LIMIT', 5000)
+    data = os.urandom(4800)
+    path = write_file(tmp_path, 'edge.pdf', data)
+
+    archive = build_archive([('edge.pdf', path)], ZipStreamWriter(compression=ZIP_STORED))
+
+    _, _, extra, data_offset = local_entry(archive, 0)
+    assert len(extra) == 20
+    descriptor = struct.unpack_from('<IIQQ', archive, data_offset + len(data))
+    assert descriptor[2:] == (len(data), len(data))
+
+    with zipfile.ZipFile(io.BytesIO(archive)) as zf:
+        # Sizes fit in the central directory, so it needs no ZIP64 extra
+        assert zf.getinfo('edge.pdf').extra == b''
+        assert zf.read('edge.pdf') == data
+
+
+def write_sparse(path, chunks):
+    """
+    Write an archive with add_raw data chunks (all zeros) skipped, so
+    multi-GB entries only cost their headers on disk.
+    """
+    with open(path, 'wb') as f:
+        for chunk in chunks:
+            if chunk.startswith(b'PK'):
+                f.write(chunk)
+            else:
+                f.seek(len(chunk), os.SEEK_CUR)
+        f.truncate()
+
+
+def zero_chunks(size, block=bytes(8 << 20)):
+    while size > 0:
+        chunk = block[:min(size, len(block))]
+        size -= len(chunk)
+        yield chunk
+
+
+def test_raw_entries_around_2gb_write_matching_central_headers(tmp_path):
+    writer = ZipStreamWriter()
+    date_time = (0, 33)  # 1980-01-01
+
+    def chunks():
+        yield from writer.add_raw('at-limit.pdf', ZIP_STORED, 0, ZIP64_LIMIT, ZIP64_LIMIT, date_time,
+                                  zero_chunks(ZIP64_LIMIT))
+        yield from writer.add_raw('over-limit.pdf', ZIP_STORED, 0, ZIP64_LIMIT + 1, ZIP64_LIMIT + 1,
+                                  date_time, zero_chunks(ZIP64_LIMIT + 1))
+        yield from writer.finish()
+
+    path = str(tmp_path / 'large.zip')
+    write_sparse(path, chunks())
+
+    with zipfile.ZipFile(path) as zf:
+        at_limit, over_limit = zf.infolist()
+    assert (at_limit.file_size, at_limit.compress_size, at_limit.header_offset) == (ZIP64_LIMIT, ZIP64_LIMIT, 0)
+    assert at_limit.extra == b''
+    assert (over_limit.file_size, over_limit.compress_size) == (ZIP64_LIMIT + 1, ZIP64_LIMIT + 1)
+    assert over_limit.header_offset == LOCAL_HEADER.size + len('at-limit.pdf') + ZIP64_LIMIT
+    # File size, compressed size and header offset all moved to the ZIP64 extra
+    assert over_limit.extra[:4] == struct.pack('<HH', 0x0001, 24)
+
+    with open(path, 'rb') as f:
+        f.seek(over_limit.header_offset)
+        header = f.read(LOCAL_HEADER.size + len('over-limit.pdf') + 20)
+    fields, _, extra, _ = local_entry(header, 0)
+    assert fields[7:9] == (0xFFFFFFFF, 0xFFFFFFFF)
+    assert extra == struct.pack('<HHQQ', 0x0001, 16, ZIP64_LIMIT + 1, ZIP64_LIMIT + 1)
+
+
+TEXT = b''.join(b'%d 0 obj << /Type /Page /Parent 2 0 R >> endobj\n' % i for i in range(4000))
+
+
+def test_policy_stores_incompressible_samples():
+    for preset in ('fast', 'balanced', 'small'):
+        assert CompressionPolicy(preset).choose(os.urandom(64 * 1024)) == (ZIP_STORED, 0)
+        assert CompressionPolicy(preset).choose(b'') == (ZIP_STORED, 0)
+
+
+def test_policy_deflates_compressible_samples_at_the_preset_level():
+    sample = TEXT[:64 * 1024]
+    assert CompressionPolicy('fast').choose(sample) == (ZIP_DEFLATED, 1)
+    assert CompressionPolicy('balanced').choose(sample) == (ZIP_DEFLATED, 6)
+    assert CompressionPolicy('small').choose(sample) == (ZIP_DEFLATED, 9)
+
+
+def test_policy_rejects_unknown_presets():
+    with pytest.raises(ValueError):
+        CompressionPolicy('maximum')
+
+
+@pytest.mark.parametrize('ranges', [False, True])
+def test_policy_picks_the_method_per_entry(tmp_path, ranges):
+    scanned = os.urandom(200 * 1024)
+    entries = [('scanned.pdf', write_file(tmp_path, 'scanned.pdf', scanned)),
+               ('text.pdf', write_file(tmp_path, 'text.pdf', TEXT)),
+               ('empty.pdf', write_file(tmp_path, 'empty.pdf', b''))]
+    writer = ZipStreamWriter(policy=CompressionPolicy('balanced'))
+
+    # ranges copies STORED data kernel-side, DEFLATED data still goes through zlib
+    path = str(tmp_path / 'result.zip')
+    with open(path, 'wb') as f:
+        write_chunks(f, stream_zip(entries, writer, ranges=ranges))
+
+    with zipfile.ZipFile(path) as zf:
+        assert zf.testzip() is None
+        methods = {info.filename: info.compress_type for info in zf.infolist()}
+        assert methods == {'scanned.pdf': ZIP_STORED, 'text.pdf': ZIP_DEFLATED, 'empty.pdf': ZIP_STORED}
+        assert zf.read('scanned.pdf') == scanned
+        assert zf.read('text.pdf') == TEXT
+        assert zf.getinfo('text.pdf').compress_size < len(TEXT)
+
+        text_size = zf.getinfo('text.pdf').compress_size
+
+    stats = writer.compression_stats()
+    assert (stats['preset'], stats['stored_entries'], stats['deflated_entries']) == ('balanced', 2, 1)
+    assert stats['bytes_in'] == len(scanned) + len(TEXT)
+    assert stats['bytes_saved'] == len(TEXT) - text_size
@@ -0,0 +1,620 @@
+"""
+Watch-folder ingestion daemon.
+
+Sites that drop ZIP 1 / ZIP 2 pairs onto a shared directory instead of using
+the upload page are served by this daemon: it watches an inbox, pairs the
+archives, queues each pair in the shared job store (the same durable queue as
+/api/jobs) and writes every result and summary to an outbox.
+
+Pairing:
+- sidecar manifest: `<anything>.pair.json` holding
+  {"zip1": "a.zip", "zip2": "b.zip", "name": "batch-42", "options": {...}};
+  name and options (compression, fingerprint, prefer_newer, fuzzy_distance)
+  are optional
+- naming rule: `<batch>.zip1.zip` with `<batch>.zip2.zip` (`_` or `-` also
+  separate the batch name); COMPARE_WATCH_PATTERN replaces the rule with a
+  regular expression with `batch` and `side` groups, side ending in 1 or 2
+
+A file is only picked up once its size and modification time have not
+changed for COMPARE_WATCH_SETTLE seconds, so archives still being copied in
+are left alone. The inbox is watched with inotify where available (Linux,
+local filesystems) and polled otherwise; it is rescanned every
+COMPARE_WATCH_POLL seconds in any case, since network filesystems send no
+inotify events.
+
+Claimed archives are moved into the job directory, so they leave the inbox.
+Each in-flight pair is recorded under `<outbox>/.pending/` until its result
+is delivered, which lets a restarted daemon pick up where it stopped. Results
+land in `<outbox>/<batch>/` as result.zip and summary.json, or error.json if
+the comparison failed.
+
+Throughput and queue depth are served on COMPARE_WATCH_METRICS_PORT, at
+/metrics (Prometheus text format) and /metrics.json.
+
+Example:
+    python watch_daemon.py --inbox /srv/drop/in --outbox /srv/drop/out --workers 2 --metrics-port 9108
+"""
+import argparse
+import collections
+import ctypes
+import ctypes.util
+import json
+import os
+import re
+import select
+import shutil
+import signal
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+from fast_io import copy_file, file_sha256
+from fuzzy_match import MAX_DISTANCE
+from job_store import JOB_WORKERS, JobStore, start_workers, stop_workers
+from main import get_job_store, run_job
+from result_cache import cache_key
+from zip_stream import COMPRESSION_PRESETS
+
+WATCH_INBOX = os.environ.get('COMPARE_WATCH_INBOX')
+WATCH_OUTBOX = os.environ.get('COMPARE_WATCH_OUTBOX')
+WATCH_POLL = float(os.environ.get('COMPARE_WATCH_POLL', 2))
+WATCH_SETTLE = float(os.environ.get('COMPARE_WATCH_SETTLE', 5))
+WATCH_PATTERN = os.environ.get('COMPARE_WATCH_PATTERN', r'(?P<batch>.+?)[._-](?P<side>zip[12])\.zip')
+WATCH_METRICS_PORT = int(os.environ.get('COMPARE_WATCH_METRICS_PORT', 0))
+# Completions counted for the throughput figures
+THROUGHPUT_WINDOW = 300.0
+
+MANIFEST_SUFFIX = '.pair.json'
+DEFAULT_OPTIONS = {'compression': 'balanced', 'fingerprint': True, 'prefer_newer': False, 'fuzzy_distance': 0}
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+
+class InvalidPair(Exception):
+    pass
+
+
+class PollingWatcher:
+    """
+    Wakes the daemon every poll interval.
+    """
+    kind = 'polling'
+
+    def __init__(self, poll: float = WATCH_POLL):
+        self.poll = poll
+
+    def wait(self, timeout: float):
+        time.sleep(min(timeout, self.poll))
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """
+    Wakes the daemon as soon as a file in the inbox is written or moved in
+    (inotify through ctypes, so no extra dependency is needed).
+    """
+    kind = 'inotify'
+
+    def __init__(self, inbox: str):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        if not hasattr(libc, 'inotify_init1'):
+            raise OSError("inotify is not available")
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        if libc.inotify_add_watch(self.fd, os.fsencode(inbox), IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE) < 0:
+            error = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(error, f"Cannot watch {inbox}")
+
+    def wait(self, timeout: float):
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return
+        # The events only trigger a rescan, so they are drained unread
+        try:
+            while os.read(self.fd, 64 * 1024):
+                pass
+        except BlockingIOError:
+            pass
+
+    def close(self):
+        os.close(self.fd)
+
+
+def open_watcher(inbox: str, use_inotify: bool = True, poll: float = WATCH_POLL):
+    """
+    An inotify watcher if the platform supports it, else a polling one.
+    """
+    if use_inotify:
+        try:
+            return InotifyWatcher(inbox)
+        except (OSError, AttributeError) as e:
+            print(f"Warning: inotify unavailable ({str(e)}); polling {inbox} every {poll:g}s")
+    return PollingWatcher(poll)
+
+
+def validate_options(options: Dict) -> Dict:
+    """
+    Comparison options from a sidecar manifest, with the API defaults filled in.
+    """
+    unknown = set(options) - set(DEFAULT_OPTIONS)
+    if unknown:
+        raise InvalidPair(f"Unknown options: {', '.join(sorted(unknown))}")
+    merged = {**DEFAULT_OPTIONS, **options}
+    if merged['compression'] not in COMPRESSION_PRESETS:
+        raise InvalidPair(f"compression must be one of: {', '.join(COMPRESSION_PRESETS)}")
+    if not isinstance(merged['fingerprint'], bool) or not isinstance(merged['prefer_newer'], bool):
+        raise InvalidPair("fingerprint and prefer_newer must be true or false")
+    if type(merged['fuzzy_distance']) is not int or merged['fuzzy_distance'] not in range(MAX_DISTANCE + 1):
+        raise InvalidPair(f"fuzzy_distance must be between 0 and {MAX_DISTANCE}")
+    return merged
+
+
+def safe_name(name: str) -> str:
+    return re.sub(r'[^A-Za-z0-9._-]+', '_', name).strip('._') or 'batch'
+
+
+def move_file(src: str, dest: str):
+    """
+    Move a file, copying it when the inbox is on another filesystem.
+    """
+    try:
+        os.rename(src, dest)
+    except OSError:
+        if not os.path.exists(src):
+            raise
+        copy_file(src, dest)
+        os.remove(src)
+
+
+class WatchMetrics:
+    """
+    Counters for the metrics endpoint. Thread-safe.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.pairs_enqueued = 0
+        self.bytes_enqueued = 0
+        self.results_delivered = 0
+        self.results_failed = 0
+        self.completions = collections.deque()
+        self.inbox_files = 0
+        self.pending = 0
+        self.last_scan = None
+
+    def record_enqueued(self, nbytes: int):
+        with self.lock:
+            self.pairs_enqueued += 1
+            self.bytes_enqueued += nbytes
+
+    def record_delivered(self, ok: bool, nbytes: int):
+        with self.lock:
+            if ok:
+                self.results_delivered += 1
+            else:
+                self.results_failed += 1
+            self.completions.append((time.time(), nbytes))
+
+    def record_scan(self, inbox_files: int, pending: int):
+        with self.lock:
+            self.inbox_files = inbox_files
+            self.pending = pending
+            self.last_scan = time.time()
+
+    def snapshot(self, store: JobStore) -> Dict:
+        now = time.time()
+        with self.lock:
+            while self.completions and now - self.completions[0][0] > THROUGHPUT_WINDOW:
+                self.completions.popleft()
+            window = min(THROUGHPUT_WINDOW, max(now - self.started, 1.0))
+            recent_bytes = sum(nbytes for _, nbytes in self.completions)
+            snapshot = {
+                'uptime_seconds': round(now - self.started, 1),
+                'pairs_enqueued': self.pairs_enqueued,
+                'bytes_enqueued': self.bytes_enqueued,
+                'results_delivered': self.results_delivered,
+                'results_failed': self.results_failed,
+                'jobs_per_minute': round(len(self.completions) * 60 / window, 3),
+                'input_bytes_per_second': round(recent_bytes / window, 1),
+                'inbox_files': self.inbox_files,
+                'pending_pairs': self.pending,
+                'last_scan_age_seconds': round(now - self.last_scan, 1) if self.last_scan else None,
+            }
+        try:
+            snapshot['queue'] = store.counts()
+        except Exception as e:
+            print(f"Warning: job store unavailable: {str(e)}")
+            snapshot['queue'] = None
+        return snapshot
+
+    @staticmethod
+    def prometheus(snapshot: Dict) -> str:
+        lines = []
+
+        def metric(name: str, kind: str, value, labels: str = ''):
+            if not any(line.startswith(f"# TYPE {name} ") for line in lines):
+                lines.append(f"# TYPE {name} {kind}")
+            lines.append(f"{name}{labels} {value}")
+
+        metric('compare_watch_uptime_seconds', 'gauge', snapshot['uptime_seconds'])
+        metric('compare_watch_pairs_enqueued_total', 'counter', snapshot['pairs_enqueued'])
+        metric('compare_watch_bytes_enqueued_total', 'counter', snapshot['bytes_enqueued'])
+        metric('compare_watch_results_total', 'counter', snapshot['results_delivered'], '{outcome="done"}')
+        metric('compare_watch_results_total', 'counter', snapshot['results_failed'], '{outcome="failed"}')
+        metric('compare_watch_jobs_per_minute', 'gauge', snapshot['jobs_per_minute'])
+        metric('compare_watch_input_bytes_per_second', 'gauge', snapshot['input_bytes_per_second'])
+        metric('compare_watch_inbox_files', 'gauge', snapshot['inbox_files'])
+        metric('compare_watch_pending_pairs', 'gauge', snapshot['pending_pairs'])
+        for state, count in (snapshot['queue'] or {}).items():
+            metric('compare_watch_queue_jobs', 'gauge', count, f'{{state="{state}"}}')
+        return '\n'.join(lines) + '\n'
+
+
+def serve_metrics(metrics: WatchMetrics, store: JobStore, port: int) -> ThreadingHTTPServer:
+    """
+    Serve /metrics (Prometheus) and /metrics.json on port in a background thread.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            path = self.path.split('?', 1)[0]
+            if path == '/metrics':
+                body = WatchMetrics.prometheus(metrics.snapshot(store)).encode('utf-8')
+                content_type = 'text/plain; version=0.0.4'
+            elif path == '/metrics.json':
+                body = json.dumps(metrics.snapshot(store)).encode('utf-8')
+                content_type = 'application/json'
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('', port), Handler)
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    return server
+
+
+class WatchDaemon:
+    """
+    Pairs settled archives in the inbox, queues them and delivers finished results.
+    """
+
+    def __init__(self, inbox: str, outbox: str, store: Optional[JobStore] = None,
+                 pattern: str = WATCH_PATTERN, settle: float = WATCH_SETTLE,
+                 metrics: Optional[WatchMetrics] = None):
+        self.inbox = inbox
+        self.outbox = outbox
+        self.store = store or get_job_store()
+        self.pattern = re.compile(pattern, re.IGNORECASE)
+        if not {'batch', 'side'} <= set(self.pattern.groupindex):
+            raise ValueError("The pairing pattern needs 'batch' and 'side' groups")
+        self.settle = settle
+        self.metrics = metrics or WatchMetrics()
+        self.ledger_dir = os.path.join(outbox, '.pending')
+        os.makedirs(self.ledger_dir, exist_ok=True)
+        # file name -> (size, mtime_ns, unchanged since)
+        self.seen: Dict[str, Tuple[int, int, float]] = {}
+
+    # Inbox scanning
+
+    def settled_files(self) -> Tuple[List[str], float]:
+        """
+        Inbox files unchanged for the settle time, and the seconds until the
+        next unsettled one may be ready.
+        """
+        now = time.time()
+        current = {}
+        settled = []
+        next_ready = float('inf')
+        with os.scandir(self.inbox) as entries:
+            for entry in entries:
+                if entry.name.startswith('.') or not entry.is_file(follow_symlinks=False):
+                    continue
+                try:
+                    stat = entry.stat(follow_symlinks=False)
+                except FileNotFoundError:
+                    continue
+                previous = self.seen.get(entry.name)
+                if previous and previous[:2] == (stat.st_size, stat.st_mtime_ns):
+                    since = previous[2]
+                else:
+                    since = now
+                current[entry.name] = (stat.st_size, stat.st_mtime_ns, since)
+                if now - since >= self.settle:
+                    settled.append(entry.name)
+                else:
+                    next_ready = min(next_ready, since + self.settle - now)
+        self.seen = current
+        return sorted(settled), next_ready
+
+    def find_pairs(self, names: List[str]) -> List[Dict]:
+        """
+        Pairs among the settled names: sidecar manifests first, then the naming rule.
+        Returns dicts {name, zip1, zip2, options, manifest}.
+        """
+        available = set(names)
+        pairs = []
+        for name in names:
+            if not name.endswith(MANIFEST_SUFFIX):
+                continue
+            try:
+                pair = self.read_manifest(name)
+            except InvalidPair as e:
+                self.reject(name, str(e))
+                continue
+            # Wait until both archives are in and settled
+            if pair['zip1'] in available and pair['zip2'] in available:
+                available -= {pair['zip1'], pair['zip2']}
+                pairs.append(pair)
+            else:
+                available -= {pair['zip1'], pair['zip2']}
+
+        sides: Dict[str, Dict[str, str]] = {}
+        for name in sorted(available):
+            match = self.pattern.fullmatch(name)
+            if match and match.group('side')[-1] in '12':
+                sides.setdefault(match.group('batch'), {})[match.group('side')[-1]] = name
+        for batch, found in sorted(sides.items()):
+            if '1' in found and '2' in found:
+                pairs.append({'name': batch, 'zip1': found['1'], 'zip2': found['2'],
+                              'options': dict(DEFAULT_OPTIONS), 'manifest': None})
+        return pairs
+
+    def read_manifest(self, name: str) -> Dict:
+        try:
+            with open(os.path.join(self.inbox, name), 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError) as e:
+            raise InvalidPair(f"Unreadable manifest: {str(e)}")
+        if not isinstance(manifest, dict):
+            raise InvalidPair("The manifest must be a JSON object")
+        zip1, zip2 = manifest.get('zip1'), manifest.get('zip2')
+        for archive in (zip1, zip2):
+            if not isinstance(archive, str) or os.path.basename(archive) != archive \
+                    or not archive.lower().endswith('.zip'):
+                raise InvalidPair("zip1 and zip2 must be ZIP file names in the inbox")
+        if zip1 == zip2:
+            raise InvalidPair("zip1 and zip2 must be different files")
+        options = manifest.get('options', {})
+        if not isinstance(options, dict):
+            raise InvalidPair("options must be a JSON object")
+        return {'name': str(manifest.get('name') or name[:-len(MANIFEST_SUFFIX)]),
+                'zip1': zip1, 'zip2': zip2, 'options': validate_options(options), 'manifest': name}
+
+    def reject(self, name: str, reason: str):
+        """
+        Set an invalid manifest aside so it is not read again.
+        """
+        print(f"Warning: rejected {name}: {reason}")
+        try:
+            os.rename(os.path.join(self.inbox, name), os.path.join(self.inbox, name + '.rejected'))
+        except OSError:
+            pass
+
+    # Queueing
+
+    def ledger_path(self, job_id: str) -> str:
+        return os.path.join(self.ledger_dir, f"{job_id}.json")
+
+    def write_ledger(self, record: Dict):
+        path = self.ledger_path(record['job_id'])
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(record, f)
+        os.replace(path + '.tmp', path)
+
+    def ledger(self) -> List[Dict]:
+        records = []
+        for name in sorted(os.listdir(self.ledger_dir)):
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.ledger_dir, name), 'r', encoding='utf-8') as f:
+                    records.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return records
+
+    def ingest(self, pair: Dict) -> Optional[str]:
+        """
+        Move a pair into a new job and queue it. Returns the job id, or None
+        if another daemon claimed the files first.
+        """
+        job_id = self.store.create(pair['options'])
+        job_dir = self.store.job_dir(job_id)
+        record = {'job_id': job_id, 'name': pair['name'], 'zip1': pair['zip1'], 'zip2': pair['zip2'],
+                  'manifest': pair['manifest'], 'created': time.time()}
+        # Recorded before anything moves, so a crash in between can be undone on restart
+        self.write_ledger(record)
+        try:
+            move_file(os.path.join(self.inbox, pair['zip1']), os.path.join(job_dir, 'zip1.zip'))
+            move_file(os.path.join(self.inbox, pair['zip2']), os.path.join(job_dir, 'zip2.zip'))
+        except FileNotFoundError:
+            self.abandon(record, "Inputs were claimed by another process")
+            return None
+        except OSError as e:
+            self.abandon(record, f"Could not move inputs: {str(e)}")
+            raise
+        if pair['manifest']:
+            try:
+                move_file(os.path.join(self.inbox, pair['manifest']), os.path.join(job_dir, 'pair.json'))
+            except FileNotFoundError:
+                pass
+        self.enqueue(record)
+        print(f"Queued {pair['name']} ({pair['zip1']}, {pair['zip2']}) as job {job_id}")
+        return job_id
+
+    def enqueue(self, record: Dict):
+        job = self.store.get(record['job_id'])
+        job_dir = self.store.job_dir(record['job_id'])
+        zip1_path = os.path.join(job_dir, 'zip1.zip')
+        zip2_path = os.path.join(job_dir, 'zip2.zip')
+        result_id = cache_key(file_sha256(zip1_path), file_sha256(zip2_path), job['options'])
+        self.store.enqueue(record['job_id'], result_id)
+        self.metrics.record_enqueued(os.path.getsize(zip1_path) + os.path.getsize(zip2_path))
+
+    def abandon(self, record: Dict, reason: str):
+        """
+        Give up on a job that was never queued: put back whatever was moved and forget it.
+        """
+        job_dir = self.store.job_dir(record['job_id'])
+        for side in ('zip1', 'zip2'):
+            moved = os.path.join(job_dir, f"{side}.zip")
+            original = os.path.join(self.inbox, record[side])
+            if os.path.exists(moved) and not os.path.exists(original):
+                move_file(moved, original)
+        self.store.fail(record['job_id'], None, reason)
+        os.remove(self.ledger_path(record['job_id']))
+
+    def recover(self) -> int:
+        """
+        Finish what a previous run left half done. Returns the jobs queued.
+        """
+        queued = 0
+        for record in self.ledger():
+            job = self.store.get(record['job_id'])
+            if job is None:
+                print(f"Warning: job {record['job_id']} for {record['name']} no longer exists")
+                os.remove(self.ledger_path(record['job_id']))
+            elif job['state'] == 'uploading':
+                job_dir = self.store.job_dir(record['job_id'])
+                if all(os.path.exists(os.path.join(job_dir, f"{side}.zip")) for side in ('zip1', 'zip2')):
+                    self.enqueue(record)
+                    queued += 1
+                else:
+                    self.abandon(record, "Interrupted before the inputs were moved")
+        return queued
+
+    # Delivery
+
+    def deliver(self) -> int:
+        """
+        Write finished jobs to the outbox. Returns the number delivered.
+        """
+        delivered = 0
+        for record in self.ledger():
+            job = self.store.get(record['job_id'])
+            if job is None:
+                print(f"Warning: job {record['job_id']} for {record['name']} no longer exists")
+                os.remove(self.ledger_path(record['job_id']))
+                continue
+            if job['state'] not in ('done', 'failed'):
+                continue
+            job_dir = self.store.job_dir(record['job_id'])
+            target = os.path.join(self.outbox, safe_name(record['name']))
+            if os.path.exists(target):
+                target = f"{target}-{record['job_id'][:8]}"
+            if os.path.exists(target):
+                # Delivered before a restart, but the ledger entry was not removed
+                os.remove(self.ledger_path(record['job_id']))
+                continue
+            scratch_dir = tempfile.mkdtemp(prefix='.incoming-', dir=self.outbox)
+            try:
+                if job['state'] == 'done':
+                    copy_file(os.path.join(job_dir, 'result.zip'), os.path.join(scratch_dir, 'result.zip'))
+                    copy_file(os.path.join(job_dir, 'summary.json'), os.path.join(scratch_dir, 'summary.json'))
+                else:
+                    with open(os.path.join(scratch_dir, 'error.json'), 'w', encoding='utf-8') as f:
+                        json.dump({'job_id': job['id'], 'zip1': record['zip1'], 'zip2': record['zip2'],
+                                   'error': job['error'], 'attempts': job['attempts']}, f)
+                # Renamed into place, so consumers of the outbox never see partial results
+                os.rename(scratch_dir, target)
+            except OSError:
+                shutil.rmtree(scratch_dir, ignore_errors=True)
+                raise
+            os.remove(self.ledger_path(record['job_id']))
+            input_bytes = sum(os.path.getsize(os.path.join(job_dir, f"{side}.zip"))
+                              for side in ('zip1', 'zip2')
+                              if os.path.exists(os.path.join(job_dir, f"{side}.zip")))
+            self.metrics.record_delivered(job['state'] == 'done', input_bytes)
+            print(f"Delivered {record['name']} ({job['state']}) to {target}")
+            delivered += 1
+        return delivered
+
+    def run_once(self) -> float:
+        """
+        One scan, queue and delivery round. Returns the seconds until the next
+        inbox file may settle (inf if none is waiting).
+        """
+        names, next_ready = self.settled_files()
+        for pair in self.find_pairs(names):
+            self.ingest(pair)
+        self.deliver()
+        self.store.cleanup()
+        self.metrics.record_scan(len(self.seen), len(self.ledger()))
+        return next_ready
+
+
+def run(daemon: WatchDaemon, watcher, stopped: threading.Event, poll: float = WATCH_POLL):
+    daemon.recover()
+    while not stopped.is_set():
+        try:
+            next_ready = daemon.run_once()
+        except Exception as e:
+            print(f"Warning: watch round failed: {str(e)}")
+            next_ready = float('inf')
+        # inotify events end the wait early; results are checked for every poll interval
+        watcher.wait(max(0.1, min(poll, next_ready)))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Compare ZIP pairs dropped into a watched folder.")
+    parser.add_argument('--inbox', default=WATCH_INBOX, help="Directory to watch (COMPARE_WATCH_INBOX)")
+    parser.add_argument('--outbox', default=WATCH_OUTBOX, help="Directory for results (COMPARE_WATCH_OUTBOX)")
+    parser.add_argument('--workers', type=int, default=JOB_WORKERS,
+                        help="Worker threads in this process (0 to leave the jobs to API workers)")
+    parser.add_argument('--poll', type=float, default=WATCH_POLL, help="Seconds between polls")
+    parser.add_argument('--settle', type=float, default=WATCH_SETTLE,
+                        help="Seconds a file must stay unchanged before it is picked up")
+    parser.add_argument('--pattern', default=WATCH_PATTERN, help="Pairing rule (regex with batch and side groups)")
+    parser.add_argument('--metrics-port', type=int, default=WATCH_METRICS_PORT,
+                        help="Port for /metrics and /metrics.json (0 to disable)")
+    parser.add_argument('--polling', action='store_true', help="Poll even where inotify is available")
+    args = parser.parse_args(argv)
+    if not args.inbox or not args.outbox:
+        parser.error("--inbox and --outbox (or COMPARE_WATCH_INBOX and COMPARE_WATCH_OUTBOX) are required")
+    os.makedirs(args.outbox, exist_ok=True)
+
+    try:
+        daemon = WatchDaemon(args.inbox, args.outbox, get_job_store(), args.pattern, args.settle)
+    except (re.error, ValueError) as e:
+        parser.error(f"invalid --pattern: {str(e)}")
+    watcher = open_watcher(args.inbox, not args.polling, args.poll)
+    server = serve_metrics(daemon.metrics, daemon.store, args.metrics_port) if args.metrics_port else None
+    workers = start_workers(daemon.store, run_job, args.workers)
+
+    stopped = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopped.set())
+    print(f"Watching {args.inbox} ({watcher.kind}), results to {args.outbox}, {args.workers} workers")
+    try:
+        run(daemon, watcher, stopped, args.poll)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop_workers(workers)
+        watcher.close()
+        if server:
+            server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
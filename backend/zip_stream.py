@@ -0,0 +1,382 @@
+"""
+Streaming ZIP writer.
+
+Produces a ZIP archive as an iterator of byte chunks so the first bytes can be
+sent to the client before the last entry has been read. Every entry is written
+with a data descriptor (general purpose flag bit 3), so compressed sizes and
+CRCs do not have to be known before the entry data is emitted. The central
+directory is written once all entries have been added.
+"""
+import os
+import struct
+import time
+import zlib
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from fast_io import FileRange, file_crc32, source_fileno, write_chunks
+
+CHUNK_SIZE = 64 * 1024
+SAMPLE_LEVEL = 1
+
+ZIP_STORED = 0
+ZIP_DEFLATED = 8
+
+ZIP64_LIMIT = (1 << 31) - 1
+ZIP_MAX_VALUE = 0xFFFFFFFF
+ZIP_MAX_COUNT = 0xFFFF
+
+FLAG_DATA_DESCRIPTOR = 0x08
+FLAG_UTF8 = 0x800
+
+LOCAL_HEADER_SIGNATURE = 0x04034b50
+DATA_DESCRIPTOR_SIGNATURE = 0x08074b50
+CENTRAL_HEADER_SIGNATURE = 0x02014b50
+ZIP64_END_SIGNATURE = 0x06064b50
+ZIP64_LOCATOR_SIGNATURE = 0x07064b50
+END_SIGNATURE = 0x06054b50
+
+
+# Speed/size presets for the adaptive compression policy.
+# min_saving: estimated fraction saved below which an entry is STORED
+# levels: (min estimated saving, DEFLATE level) bands, checked in order
+COMPRESSION_PRESETS = {
+    'fast': {'min_saving': 0.10, 'levels': [(0.0, 1)]},
+    'balanced': {'min_saving': 0.05, 'levels': [(0.30, 6), (0.0, 3)]},
+    'small': {'min_saving': 0.01, 'levels': [(0.0, 9)]},
+}
+
+
+def dos_datetime(timestamp: float) -> Tuple[int, int]:
+    """
+    Convert a POSIX timestamp to the (time, date) pair used in ZIP headers.
+    """
+    return pack_dos_datetime(time.localtime(timestamp)[:6])
+
+
+def pack_dos_datetime(date_time: Tuple[int, ...]) -> Tuple[int, int]:
+    """
+    Pack a (year, month, day, hour, minute, second) tuple into the DOS
+    (time, date) pair. Dates before 1980 are clamped, as the DOS format
+    cannot represent them.
+    """
+    year, month, day, hour, minute, second = date_time[:6]
+    year = max(year, 1980)
+    dos_time = (hour << 11) | (minute << 5) | (second // 2)
+    dos_date = ((year - 1980) << 9) | (month << 5) | day
+    return dos_time, dos_date
+
+
+class CompressionPolicy:
+    """
+    Per-entry compression policy.
+
+    The first block of every entry is compressed once at a cheap level to
+    estimate how compressible the entry is. Entries that would barely shrink
+    (typically PDFs with already-compressed streams) are STORED; the others
+    are DEFLATED at the level the preset assigns to their estimated saving.
+    """
+
+    def __init__(self, preset: str = 'balanced'):
+        if preset not in COMPRESSION_PRESETS:
+            raise ValueError(f"Unknown compression preset: {preset}")
+        self.preset = preset
+        self.min_saving = COMPRESSION_PRESETS[preset]['min_saving']
+        self.levels = COMPRESSION_PRESETS[preset]['levels']
+
+    def choose(self, sample: bytes) -> Tuple[int, int]:
+        """
+        Return (compression method, level) for an entry starting with sample.
+        """
+        if not sample:
+            return ZIP_STORED, 0
+        compressor = zlib.compressobj(SAMPLE_LEVEL, zlib.DEFLATED, -15)
+        estimated = len(compressor.compress(sample)) + len(compressor.flush())
+        saving = 1 - estimated / len(sample)
+        if saving < self.min_saving:
+            return ZIP_STORED, 0
+        for min_saving, level in self.levels:
+            if saving >= min_saving:
+                return ZIP_DEFLATED, level
+        return ZIP_DEFLATED, self.levels[-1][1]
+
+
+class ZipStreamWriter:
+    """
+    Incremental ZIP writer that yields archive bytes as they are produced.
+
+    Usage:
+        writer = ZipStreamWriter()
+        for chunk in writer.add_file(path, 'name.pdf'):
+            send(chunk)
+        for chunk in writer.finish():
+            send(chunk)
+    """
+
+    def __init__(self, compression: int = ZIP_DEFLATED, compresslevel: int = -1,
+                 policy: Optional[CompressionPolicy] = None):
+        self.compression = compression
+        self.compresslevel = compresslevel
+        self.policy = policy
+        self.offset = 0
+        self.entries: List[Dict] = []
+        self.names = set()
+        # Compression statistics, reported by compression_stats()
+        self.cpu_seconds = 0.0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def _emit(self, data: bytes) -> bytes:
+        self.offset += len(data)
+        return data
+
+    def add_file(self, path: str, arcname: str, ranges: bool = False) -> Iterator[Union[bytes, FileRange]]:
+        """
+        Add the file at path to the archive under arcname.
+        Yields the local header, the (compressed) data and the data descriptor.
+        With ranges, the data of a STORED entry is yielded as one FileRange
+        for write_chunks to copy kernel-side.
+        """
+        if arcname in self.names:
+            raise ValueError(f"Duplicate archive name: {arcname}")
+        self.names.add(arcname)
+
+        stat = os.stat(path)
+        file_size = stat.st_size
+        dos_time, dos_date = dos_datetime(stat.st_mtime)
+        name_bytes, flags = self._encode_name(arcname)
+        flags |= FLAG_DATA_DESCRIPTOR
+        zip64 = file_size * 1.05 > ZIP64_LIMIT
+        version = 45 if zip64 else 20
+
+        with open(path, 'rb') as f:
+            yield from self._add_stream(f, file_size, name_bytes, flags,
+                                        dos_time, dos_date, version, zip64, ranges)
+
+    def _add_stream(self, f, file_size: int, name_bytes: bytes, flags: int,
+                    dos_time: int, dos_date: int, version: int,
+                    zip64: bool, ranges: bool = False) -> Iterator[Union[bytes, FileRange]]:
+        chunk = f.read(CHUNK_SIZE)
+        started = time.thread_time()
+        if self.policy:
+            compression, compresslevel = self.policy.choose(chunk)
+        else:
+            compression, compresslevel = self.compression, self.compresslevel
+        self.cpu_seconds += time.thread_time() - started
+
+        header_offset = self.offset
+        extra = struct.pack('<HHQQ', 0x0001, 16, 0, 0) if zip64 else b''
+        header_size = ZIP_MAX_VALUE if zip64 else 0
+        yield self._emit(struct.pack(
+            '<IHHHHHIIIHH',
+            LOCAL_HEADER_SIGNATURE, version, flags, compression,
+            dos_time, dos_date, 0, header_size, header_size,
+            len(name_bytes), len(extra)
+        ) + name_bytes + extra)
+
+        crc = 0
+        compressed_size = 0
+        compressor = None
+        if compression == ZIP_DEFLATED:
+            compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, -15)
+        elif ranges and chunk and source_fileno(f) is not None:
+            # Stored data is copied as is: CRC over a memory map, bytes by the kernel
+            crc = file_crc32(f.fileno(), file_size)
+            compressed_size = file_size
+            yield self._emit(FileRange(f.fileno(), 0, file_size))
+            chunk = b''
+
+        while chunk:
+            crc = zlib.crc32(chunk, crc)
+            if compressor:
+                started = time.thread_time()
+                chunk = compressor.compress(chunk)
+                self.cpu_seconds += time.thread_time() - started
+            if chunk:
+                compressed_size += len(chunk)
+                yield self._emit(chunk)
+            chunk = f.read(CHUNK_SIZE)
+        if compressor:
+            started = time.thread_time()
+            tail = compressor.flush()
+            self.cpu_seconds += time.thread_time() - started
+            compressed_size += len(tail)
+            if tail:
+                yield self._emit(tail)
+        self.bytes_in += file_size
+        self.bytes_out += compressed_size
+
+        if zip64:
+            descriptor = struct.pack('<IIQQ', DATA_DESCRIPTOR_SIGNATURE, crc,
+                                     compressed_size, file_size)
+        else:
+            descriptor = struct.pack('<IIII', DATA_DESCRIPTOR_SIGNATURE, crc,
+                                     compressed_size, file_size)
+        yield self._emit(descriptor)
+
+        self.entries.append({
+            'name': name_bytes,
+            'flags': flags,
+            'compression': compression,
+            'dos_time': dos_time,
+            'dos_date': dos_date,
+            'crc': crc,
+            'compressed_size': compressed_size,
+            'file_size': file_size,
+            'header_offset': header_offset,
+        })
+
+    def compression_stats(self) -> Dict:
+        """
+        Summarise how the entries written so far were compressed.
+        """
+        stored = len([e for e in self.entries if e['compression'] == ZIP_STORED])
+        return {
+            'preset': self.policy.preset if self.policy else None,
+            'stored_entries': stored,
+            'deflated_entries': len(self.entries) - stored,
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'bytes_saved': self.bytes_in - self.bytes_out,
+            'cpu_seconds': round(self.cpu_seconds, 4)
+        }
+
+    def add_raw(self, arcname: str, compression: int, crc: int, compressed_size: int,
+                file_size: int, date_time: Tuple[int, int],
+                chunks: Iterable[bytes]) -> Iterator[bytes]:
+        """
+        Add an entry whose compressed data is already known, e.g. a member
+        copied out of another archive. The data is passed through untouched;
+        since sizes and CRC are known, they go straight into the local header.
+        date_time is the (dos_time, dos_date) pair of the source entry.
+        """
+        if arcname in self.names:
+            raise ValueError(f"Duplicate archive name: {arcname}")
+        self.names.add(arcname)
+
+        name_bytes, flags = self._encode_name(arcname)
+        dos_time, dos_date = date_time
+        zip64 = file_size > ZIP64_LIMIT or compressed_size > ZIP64_LIMIT
+        header_offset = self.offset
+        if zip64:
+            extra = struct.pack('<HHQQ', 0x0001, 16, file_size, compressed_size)
+            header_sizes = (ZIP_MAX_VALUE, ZIP_MAX_VALUE)
+        else:
+            extra = b''
+            header_sizes = (compressed_size, file_size)
+        yield self._emit(struct.pack(
+            '<IHHHHHIIIHH',
+            LOCAL_HEADER_SIGNATURE, 45 if zip64 else 20, flags, compression,
+            dos_time, dos_date, crc, header_sizes[0], header_sizes[1],
+            len(name_bytes), len(extra)
+        ) + name_bytes + extra)
+
+        written = 0
+        for chunk in chunks:
+            written += len(chunk)
+            yield self._emit(chunk)
+        if written != compressed_size:
+            raise ValueError(f"{arcname}: expected {compressed_size} bytes of data, got {written}")
+        self.bytes_in += file_size
+        self.bytes_out += compressed_size
+
+        self.entries.append({
+            'name': name_bytes,
+            'flags': flags,
+            'compression': compression,
+            'dos_time': dos_time,
+            'dos_date': dos_date,
+            'crc': crc,
+            'compressed_size': compressed_size,
+            'file_size': file_size,
+            'header_offset': header_offset,
+        })
+
+    def finish(self) -> Iterator[bytes]:
+        """
+        Write the central directory and end-of-archive records.
+        """
+        cd_offset = self.offset
+        for entry in self.entries:
+            yield self._emit(self._central_header(entry))
+        cd_size = self.offset - cd_offset
+        count = len(self.entries)
+
+        if count > ZIP_MAX_COUNT or cd_offset > ZIP64_LIMIT or cd_size > ZIP64_LIMIT:
+            zip64_end_offset = self.offset
+            yield self._emit(struct.pack(
+                '<IQHHIIQQQQ',
+                ZIP64_END_SIGNATURE, 44, 45, 45, 0, 0,
+                count, count, cd_size, cd_offset
+            ))
+            yield self._emit(struct.pack(
+                '<IIQI', ZIP64_LOCATOR_SIGNATURE, 0, zip64_end_offset, 1
+            ))
+            count = min(count, ZIP_MAX_COUNT)
+            cd_size = min(cd_size, ZIP_MAX_VALUE)
+            cd_offset = min(cd_offset, ZIP_MAX_VALUE)
+
+        yield self._emit(struct.pack(
+            '<IHHHHIIH', END_SIGNATURE, 0, 0, count, count, cd_size, cd_offset, 0
+        ))
+
+    def _encode_name(self, arcname: str) -> Tuple[bytes, int]:
+        try:
+            return arcname.encode('ascii'), 0
+        except UnicodeEncodeError:
+            return arcname.encode('utf-8'), FLAG_UTF8
+
+    def _central_header(self, entry: Dict) -> bytes:
+        extra_values = []
+        file_size = entry['file_size']
+        compressed_size = entry['compressed_size']
+        header_offset = entry['header_offset']
+        if file_size > ZIP64_LIMIT:
+            extra_values.append(file_size)
+            file_size = ZIP_MAX_VALUE
+        if compressed_size > ZIP64_LIMIT:
+            extra_values.append(compressed_size)
+            compressed_size = ZIP_MAX_VALUE
+        if header_offset > ZIP64_LIMIT:
+            extra_values.append(header_offset)
+            header_offset = ZIP_MAX_VALUE
+
+        extra = b''
+        version = 20
+        if extra_values:
+            extra = struct.pack('<HH', 0x0001, 8 * len(extra_values))
+            extra += struct.pack('<' + 'Q' * len(extra_values), *extra_values)
+            version = 45
+
+        return struct.pack(
+            '<IHHHHHHIIIHHHHHII',
+            CENTRAL_HEADER_SIGNATURE, version, version, entry['flags'],
+            entry['compression'], entry['dos_time'], entry['dos_date'],
+            entry['crc'], compressed_size, file_size,
+            len(entry['name']), len(extra), 0, 0, 0, 0, header_offset
+        ) + entry['name'] + extra
+
+
+def stream_zip(entries: Iterable[Tuple[str, str]],
+               writer: Optional[ZipStreamWriter] = None,
+               ranges: bool = False) -> Iterator[Union[bytes, FileRange]]:
+    """
+    Stream a ZIP archive built from (arcname, path) pairs.
+    Entries are consumed lazily, so each one is emitted as soon as it is produced.
+    ranges is passed on to add_file.
+    """
+    if writer is None:
+        writer = ZipStreamWriter()
+    for arcname, path in entries:
+        yield from writer.add_file(path, arcname, ranges)
+    yield from writer.finish()
+
+
+def write_zip(entries: Iterable[Tuple[str, str]], dest_path: str,
+              writer: Optional[ZipStreamWriter] = None) -> str:
+    """
+    Write a ZIP archive built from (arcname, path) pairs to dest_path.
+    Returns dest_path.
+    """
+    with open(dest_path, 'wb') as f:
+        write_chunks(f, stream_zip(entries, writer, ranges=True))
+    return dest_path
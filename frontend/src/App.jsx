@@ -1,4 +1,7 @@
 import { useState } from 'react'
+import { manifestCompare } from './manifestUpload'
+
+const API_BASE = 'http://localhost:8000'
 
 // Icon Components
 const UploadIcon = () => (
@@ -25,6 +28,60 @@ const XIcon = () => (
   </svg>
 )
 
+const formatBytes = (bytes) => {
+  if (bytes < 1024 * 1024) return `${(bytes / 1024).toFixed(0)} KB`
+  return `${(bytes / (1024 * 1024)).toFixed(1)} MB`
+}
+
+// Split results are fetched as ZIP parts of at most this many bytes
+const PART_BYTES = 4 * 1024 * 1024
+
+const saveBlob = (blob, filename) => {
+  const url = window.URL.createObjectURL(blob)
+  const a = document.createElement('a')
+  a.href = url
+  a.download = filename
+  document.body.appendChild(a)
+  a.click()
+
+  window.URL.revokeObjectURL(url)
+  document.body.removeChild(a)
+}
+
+// Progress line fed by the backend's server-sent events
+const ProgressStatus = ({ progress }) => {
+  const stageLabels = {
+    waiting: 'Uploading',
+    saving: 'Saving uploads',
+    extracting: 'Extracting',
+    fingerprinting: 'Comparing duplicates',
+    merging: 'Writing result',
+    done: 'Finishing',
+    failed: 'Failed',
+  }
+  const percent = progress.bytes_total
+    ? Math.min(100, Math.round((progress.bytes_processed / progress.bytes_total) * 100))
+    : null
+
+  return (
+    <div className="space-y-2 text-sm text-gray-600">
+      <div className="flex justify-between">
+        <span className="font-medium text-gray-700">{stageLabels[progress.stage] || progress.stage}</span>
+        {progress.eta_seconds != null && <span>About {Math.ceil(progress.eta_seconds)}s left</span>}
+      </div>
+      {percent != null && (
+        <div className="w-full h-2 bg-gray-200 rounded-full overflow-hidden">
+          <div className="h-2 bg-blue-600 transition-all" style={{ width: `${percent}%` }}></div>
+        </div>
+      )}
+      <p className="text-xs text-gray-500">
+        {progress.entries_indexed} PDFs indexed · {progress.nested_archives} nested ZIPs opened ·{' '}
+        {progress.files_written} files written · {formatBytes(progress.bytes_processed)} processed
+      </p>
+    </div>
+  )
+}
+
 const LoadingSpinner = () => (
   <div className="flex justify-center items-center">
     <div className="animate-spin rounded-full h-8 w-8 border-b-2 border-white"></div>
@@ -188,6 +245,10 @@ function App() {
   const [success, setSuccess] = useState('')
   const [loading, setLoading] = useState(false)
   const [summary, setSummary] = useState(null)
+  const [neededOnly, setNeededOnly] = useState(false)
+  const [fuzzyDistance, setFuzzyDistance] = useState(0)
+  const [splitParts, setSplitParts] = useState(false)
+  const [progress, setProgress] = useState(null)
 
   const handleFile1Change = (e) => {
     const file = e.target.files[0]
@@ -234,49 +295,71 @@ function App() {
       return
     }
 
+    let events = null
     try {
-      const formData = new FormData()
-      formData.append('file1', file1)
-      formData.append('file2', file2)
-
-      const response = await fetch('http://localhost:8000/api/compare-zips', {
-        method: 'POST',
-        body: formData,
-      })
-
-      if (!response.ok) {
-        const errorData = await response.json().catch(() => ({ detail: 'Unknown error occurred' }))
-        setError(errorData.detail || `Error: ${response.statusText}`)
-        setLoading(false)
-        return
+      // Upload only the central directories, then only the members to keep
+      const planOptions = { fuzzy_distance: fuzzyDistance }
+      if (splitParts) planOptions.max_part_bytes = PART_BYTES
+      let data = neededOnly ? await manifestCompare(API_BASE, file1, file2, planOptions) : null
+
+      if (!data) {
+        // Subscribe to progress before uploading, so no stage is missed
+        const jobId = crypto.randomUUID()
+        events = new EventSource(`${API_BASE}/api/progress/${jobId}`)
+        events.onmessage = (event) => setProgress(JSON.parse(event.data))
+
+        const formData = new FormData()
+        formData.append('file1', file1)
+        formData.append('file2', file2)
+        formData.append('job_id', jobId)
+        formData.append('fuzzy_distance', fuzzyDistance)
+        if (splitParts) formData.append('max_part_bytes', PART_BYTES)
+
+        const response = await fetch(`${API_BASE}/api/compare-zips`, {
+          method: 'POST',
+          body: formData,
+        })
+
+        if (!response.ok) {
+          const errorData = await response.json().catch(() => ({ detail: 'Unknown error occurred' }))
+          setError(errorData.detail || `Error: ${response.statusText}`)
+          setLoading(false)
+          return
+        }
+
+        data = await response.json()
       }
-
-      const data = await response.json()
       
-      const binaryString = atob(data.zip_file)
-      const bytes = new Uint8Array(binaryString.length)
-      for (let i = 0; i < binaryString.length; i++) {
-        bytes[i] = binaryString.charCodeAt(i)
+      if (data.parts) {
+        // Fetch the parts one by one, each small enough for one response. Part URLs are
+        // API paths, or presigned object storage URLs on serverless deployments
+        for (const part of data.parts.parts) {
+          const response = await fetch(new URL(part.url, API_BASE))
+          if (!response.ok) {
+            const errorData = await response.json().catch(() => ({ detail: 'Unknown error occurred' }))
+            throw new Error(errorData.detail || `Part ${part.index + 1}: ${response.statusText}`)
+          }
+          saveBlob(await response.blob(), `result.part${part.index + 1}of${data.parts.total_parts}.zip`)
+        }
+      } else {
+        const binaryString = atob(data.zip_file)
+        const bytes = new Uint8Array(binaryString.length)
+        for (let i = 0; i < binaryString.length; i++) {
+          bytes[i] = binaryString.charCodeAt(i)
+        }
+        saveBlob(new Blob([bytes], { type: 'application/zip' }), data.filename || 'result.zip')
       }
-      const blob = new Blob([bytes], { type: 'application/zip' })
-      
-      const url = window.URL.createObjectURL(blob)
-      const a = document.createElement('a')
-      a.href = url
-      a.download = data.filename || 'result.zip'
-      document.body.appendChild(a)
-      a.click()
-      
-      window.URL.revokeObjectURL(url)
-      document.body.removeChild(a)
 
       setSummary(data.summary)
       const stats = data.summary.summary_stats
       setSuccess(`Files processed successfully! Found ${data.summary.zip1_stats.total_files} files in ZIP 1, ${data.summary.zip2_stats.total_files} files in ZIP 2. ${stats.total_duplicates} duplicates detected. Final merged ZIP contains ${stats.total_kept} files.`)
       setLoading(false)
     } catch (err) {
-      setError(`Error: ${err.message}. Make sure the backend server is running on http://localhost:8000`)
+      setError(`Error: ${err.message}. Make sure the backend server is running on ${API_BASE}`)
       setLoading(false)
+    } finally {
+      if (events) events.close()
+      setProgress(null)
     }
   }
 
@@ -378,6 +461,45 @@ function App() {
               </div>
             </div>
 
+            {/* Upload Mode */}
+            <label className="flex items-center gap-2 text-sm text-gray-700">
+              <input
+                type="checkbox"
+                checked={neededOnly}
+                onChange={(e) => setNeededOnly(e.target.checked)}
+                disabled={loading}
+                className="rounded border-gray-300"
+              />
+              Upload only the files that end up in the result (faster when the ZIPs overlap)
+            </label>
+
+            {/* Split Download */}
+            <label className="flex items-center gap-2 text-sm text-gray-700">
+              <input
+                type="checkbox"
+                checked={splitParts}
+                onChange={(e) => setSplitParts(e.target.checked)}
+                disabled={loading}
+                className="rounded border-gray-300"
+              />
+              Download the result in parts of up to {formatBytes(PART_BYTES)} (for size-limited deployments)
+            </label>
+
+            {/* Near-duplicate Usernames */}
+            <label className="flex items-center gap-2 text-sm text-gray-700">
+              Report near-duplicate usernames:
+              <select
+                value={fuzzyDistance}
+                onChange={(e) => setFuzzyDistance(Number(e.target.value))}
+                disabled={loading}
+                className="rounded border-gray-300 text-sm"
+              >
+                <option value={0}>Off</option>
+                <option value={1}>Case, spacing, OCR and 1 typo</option>
+                <option value={2}>Up to 2 typos</option>
+              </select>
+            </label>
+
             {/* Submit Button */}
             <button
               type="submit"
@@ -396,6 +518,8 @@ function App() {
                 </>
               )}
             </button>
+
+            {loading && progress && <ProgressStatus progress={progress} />}
           </form>
         </div>
 
@@ -629,6 +753,54 @@ function App() {
               </div>
             )}
 
+            {/* Near-duplicate Usernames */}
+            {summary.near_duplicates?.length > 0 && (
+              <div className="bg-white rounded-xl shadow-lg p-6">
+                <h3 className="text-xl font-bold text-gray-800 mb-4">
+                  Possible Near-Duplicates ({summary.near_duplicates.length} to review)
+                </h3>
+                <p className="text-sm text-gray-600 mb-4 italic">
+                  These usernames differ slightly and were treated as different users:
+                </p>
+                <div className="overflow-x-auto">
+                  <table className="w-full text-sm">
+                    <thead className="bg-gray-100">
+                      <tr>
+                        <th className="px-4 py-3 text-left font-semibold text-gray-700">ZIP 1 Username</th>
+                        <th className="px-4 py-3 text-left font-semibold text-gray-700">ZIP 2 Username</th>
+                        <th className="px-4 py-3 text-left font-semibold text-gray-700">ZIP 1 File</th>
+                        <th className="px-4 py-3 text-left font-semibold text-gray-700">ZIP 2 File</th>
+                        <th className="px-4 py-3 text-left font-semibold text-gray-700">Reason</th>
+                        <th className="px-4 py-3 text-left font-semibold text-gray-700">Score</th>
+                      </tr>
+                    </thead>
+                    <tbody className="divide-y divide-gray-200">
+                      {summary.near_duplicates.map((pair, index) => (
+                        <tr key={index} className="bg-orange-50 hover:bg-orange-100">
+                          <td className="px-4 py-3 font-semibold text-gray-900">{pair.zip1_username}</td>
+                          <td className="px-4 py-3 font-semibold text-gray-900">{pair.zip2_username}</td>
+                          <td className="px-4 py-3">
+                            <div className="text-gray-600">
+                              <div className="text-xs text-gray-500 italic">{pair.zip1_file.folder}</div>
+                              <div className="font-medium">{pair.zip1_file.filename}</div>
+                            </div>
+                          </td>
+                          <td className="px-4 py-3">
+                            <div className="text-gray-600">
+                              <div className="text-xs text-gray-500 italic">{pair.zip2_file.folder}</div>
+                              <div className="font-medium">{pair.zip2_file.filename}</div>
+                            </div>
+                          </td>
+                          <td className="px-4 py-3 text-gray-600">{pair.reason}</td>
+                          <td className="px-4 py-3 text-gray-600">{pair.score.toFixed(2)}</td>
+                        </tr>
+                      ))}
+                    </tbody>
+                  </table>
+                </div>
+              </div>
+            )}
+
             {/* Final Merged File List */}
             <div className="bg-gradient-to-br from-emerald-50 to-teal-50 border-2 border-emerald-200 rounded-xl shadow-lg p-6">
               <div className="flex items-center gap-2 mb-4">
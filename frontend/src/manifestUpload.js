@@ -0,0 +1,48 @@
+// Manifest-first upload: send each archive's central directory first, then
+// only the byte ranges of the members the merged result actually needs.
+
+const DEFAULT_TAIL_BYTES = 64 * 1024 + 22
+
+const tailOf = (file, bytes) => file.slice(Math.max(file.size - bytes, 0))
+
+// Concatenate the requested [start, end) ranges without copying the file
+const rangesOf = (file, ranges) => new Blob(ranges.map(([start, end]) => file.slice(start, end)))
+
+const postForm = async (url, formData) => {
+  const response = await fetch(url, { method: 'POST', body: formData })
+  if (!response.ok) {
+    const errorData = await response.json().catch(() => ({ detail: 'Unknown error occurred' }))
+    throw new Error(errorData.detail || `Error: ${response.statusText}`)
+  }
+  return response.json()
+}
+
+// Returns the same JSON as /api/compare-zips, or null when the archives
+// need a full upload (nested ZIPs cannot be classified from names alone,
+// encrypted members cannot be copied as-is).
+// options are extra form fields for the plan, e.g. { fuzzy_distance: 1 }.
+export const manifestCompare = async (apiBase, file1, file2, options = {}) => {
+  let tail1 = DEFAULT_TAIL_BYTES
+  let tail2 = DEFAULT_TAIL_BYTES
+  let plan
+
+  for (;;) {
+    const formData = new FormData()
+    formData.append('file1_tail', tailOf(file1, tail1), 'file1.tail')
+    formData.append('file1_size', file1.size)
+    formData.append('file2_tail', tailOf(file2, tail2), 'file2.tail')
+    formData.append('file2_size', file2.size)
+    for (const [name, value] of Object.entries(options)) formData.append(name, value)
+    plan = await postForm(`${apiBase}/api/compare-zips/plan`, formData)
+    if (plan.mode !== 'need_more') break
+    tail1 = plan.file1_tail_bytes ?? tail1
+    tail2 = plan.file2_tail_bytes ?? tail2
+  }
+
+  if (plan.mode === 'full') return null
+
+  const formData = new FormData()
+  formData.append('file1_ranges', rangesOf(file1, plan.file1_ranges), 'file1.ranges')
+  formData.append('file2_ranges', rangesOf(file2, plan.file2_ranges), 'file2.ranges')
+  return postForm(`${apiBase}/api/compare-zips/plan/${plan.plan_id}`, formData)
+}